@@ -1,129 +1,989 @@
 # api.py
+import asyncio
+import codecs
+import hashlib
+import io
 import json
+import multiprocessing
+import os
+import pickle
 import re
-from datetime import datetime
-from typing import List, Optional, Dict, Any
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import AsyncIterator, Callable, Iterator, List, Optional, Dict, Any, Tuple
+import numpy as np
 from fastapi import FastAPI, UploadFile, File, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
 from pydantic import BaseModel
 import grpc
 import plugin_pb2
 import plugin_pb2_grpc
+from timestamps import NAT, parse_ts_column
+from compressed_io import Decompressor
+from metrics import Metrics, SIZE_BUCKETS
+from result_cache import ResultCache
+from log_store import STALE_AFTER, LogStore
+from sampling import Sampler
 
 app = FastAPI(title="Terraform Log Analyzer API")
+# Ответы сжимаются, если клиент прислал Accept-Encoding: gzip (NDJSON логов жмётся в 10+ раз).
+# Кроме потоковой выдачи /upload: сжатие копило бы записи в блоки, и первая дошла бы до клиента
+# не сразу. Такой ответ помечается STREAM_HEADERS — ответ с Content-Encoding middleware не трогает.
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+STREAM_HEADERS = {"Content-Encoding": "identity"}
+
+# --- Метрики (GET /metrics, формат Prometheus) ---
+# METRICS=0 — выключить совсем; METRICS_STAGES=1 — ещё и время по стадиям разбора каждой строки
+METRICS = Metrics() if os.environ.get("METRICS", "1") != "0" else None
+METRICS_STAGES = METRICS is not None and os.environ.get("METRICS_STAGES", "0") == "1"
+if METRICS is not None:
+    METRICS.describe("tflog_upload_bytes", "Size of uploaded log files.")
+    METRICS.describe("tflog_parse_seconds", "Time to parse and stream one upload, plugins included.")
+    METRICS.describe("tflog_plugin_rpc_seconds", "Round-trip time of one LogBatch through a gRPC plugin.")
+    METRICS.describe("tflog_plugin_fallbacks_total", "Batches passed through unprocessed by a plugin.")
+    METRICS.describe("tflog_job_wait_seconds", "Time a parse job waited for a free worker process.")
+    METRICS.describe("tflog_job_seconds", "Total time of a parse job: queue, parsing and plugins.")
+    METRICS.describe("tflog_jobs_rejected_total", "Jobs refused by admission control.")
+    METRICS.describe("tflog_cache_lookups_total", "Parse-result cache lookups by upload content hash.")
+    METRICS.describe("tflog_runs_stored_total", "Uploads ingested into the SQLite run store.")
 
 # --- Парсинг (зеркало логики из index.html) ---
-def parse_log_content(content: str) -> List[Dict[str, Any]]:
-    lines = [line.strip() for line in content.split("\n") if line.strip()]
-    parsed = []
-    current_section = None
-    section_start_index = -1
-
-    for idx, line in enumerate(lines):
-        entry = {}
-        is_parsed = True
-        try:
-            entry = json.loads(line)
-        except json.JSONDecodeError:
-            is_parsed = False
-            # Эвристика для timestamp и level
-            ts_match = re.search(r'(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(?:\.\d+)?(?:Z|[+-]\d{2}:\d{2}))', line)
-            level_match = re.search(r'\b(info|debug|trace|warn|error)\b', line, re.IGNORECASE)
-            entry = {
-                "@message": line,
-                "@timestamp": ts_match.group(1) if ts_match else None,
-                "@level": level_match.group(1).lower() if level_match else "unknown"
-            }
-
-        message = entry.get("@message", "")
-        if "CLI args:" in message:
-            if '"plan"' in message:
-                current_section = "plan"
-                section_start_index = idx
-            elif '"apply"' in message:
-                current_section = "apply"
-                section_start_index = idx
-
-        log = {
-            "index": idx,
-            "timestamp": entry.get("@timestamp") or "N/A",
-            "level": (entry.get("@level") or "unknown").lower(),
-            "message": message,
-            "section": current_section,
-            "sectionStart": section_start_index == idx,
-            "isParsed": is_parsed,
-            "tf_req_id": entry.get("tf_req_id") or entry.get("request_id"),
-            "tf_resource_type": entry.get("tf_resource_type") or entry.get("resource_type"),
-            "http_req_body": entry.get("tf_http_req_body") or entry.get("http_req_body"),
-            "http_res_body": entry.get("tf_http_res_body") or entry.get("http_res_body"),
+def new_parse_state(metrics: Optional[Metrics] = None) -> Dict[str, Any]:
+    """
+    Состояние парсера между строками: текущая секция и индекс её начала.
+    metrics — копить время по стадиям разбора строки (json_loads / fallback / build_entry).
+    """
+    return {"index": 0, "section": None, "section_start_index": -1, "parse_errors": 0,
+            "timer": metrics.timer() if metrics is not None else None}
+
+def parse_log_line(line: str, state: Dict[str, Any]) -> Dict[str, Any]:
+    """Разбирает одну непустую строку лога; state обновляется (см. new_parse_state)."""
+    idx = state["index"]
+    state["index"] += 1
+    timer = state["timer"]
+    if timer: timer.start()
+    entry = {}
+    is_parsed = True
+    try:
+        entry = json.loads(line)
+        if timer: timer.lap("json_loads")
+    except json.JSONDecodeError:
+        if timer: timer.lap("json_loads")
+        is_parsed = False
+        state["parse_errors"] += 1
+        # Эвристика для timestamp и level
+        ts_match = re.search(r'(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(?:\.\d+)?(?:Z|[+-]\d{2}:\d{2}))', line)
+        level_match = re.search(r'\b(info|debug|trace|warn|error)\b', line, re.IGNORECASE)
+        entry = {
+            "@message": line,
+            "@timestamp": ts_match.group(1) if ts_match else None,
+            "@level": level_match.group(1).lower() if level_match else "unknown"
         }
-        parsed.append(log)
-    return parsed
+        if timer: timer.lap("fallback")
+
+    message = entry.get("@message", "")
+    if "CLI args:" in message:
+        if '"plan"' in message:
+            state["section"] = "plan"
+            state["section_start_index"] = idx
+        elif '"apply"' in message:
+            state["section"] = "apply"
+            state["section_start_index"] = idx
+
+    record = {
+        "index": idx,
+        "timestamp": entry.get("@timestamp") or "N/A",
+        "level": (entry.get("@level") or "unknown").lower(),
+        "message": message,
+        "section": state["section"],
+        "sectionStart": state["section_start_index"] == idx,
+        "isParsed": is_parsed,
+        "tf_req_id": entry.get("tf_req_id") or entry.get("request_id"),
+        "tf_resource_type": entry.get("tf_resource_type") or entry.get("resource_type"),
+        "tf_rpc": entry.get("tf_rpc"),
+        "http_req_body": entry.get("tf_http_req_body") or entry.get("http_req_body"),
+        "http_res_body": entry.get("tf_http_res_body") or entry.get("http_res_body"),
+    }
+    if timer: timer.lap("build_entry")
+    return record
+
+def attach_ts_ns(logs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Один раз при приёме разбирает timestamp пачки в epoch ns (поле ts_ns, None — нет метки)."""
+    column = parse_ts_column([log["timestamp"] for log in logs])
+    for log, ns in zip(logs, column.tolist()):
+        log["ts_ns"] = ns if ns != NAT else None
+    return logs
+
+def sample_logs(logs: List[Dict[str, Any]], sampler: Sampler) -> List[Dict[str, Any]]:
+    """Выборка trace/debug-записей (см. sampling.py): ключ записи — index, граница — sectionStart."""
+    if sampler.needs_observe:
+        for log in logs:
+            sampler.observe(log["index"], log["level"], log["tf_req_id"], log["tf_rpc"])
+    sampler.finish_observe()
+    return [log for log in logs
+            if sampler.keep(log["index"], log["level"], log["tf_req_id"], log["tf_rpc"], log["sectionStart"])]
+
+def parse_log_content(content: str, metrics: Optional[Metrics] = None,
+                      sampler: Optional[Sampler] = None) -> List[Dict[str, Any]]:
+    """
+    metrics — время по стадиям (json_loads, fallback, build_entry, ts_ns) и счётчики строк/ошибок.
+    sampler — оставить лишь выборку trace/debug-записей; доли по уровням — sampler.stats().
+    """
+    state = new_parse_state(metrics)
+    logs = [parse_log_line(line.strip(), state) for line in content.split("\n") if line.strip()]
+    if sampler is not None:
+        logs = sample_logs(logs, sampler)
+    if metrics is None:
+        return attach_ts_ns(logs)
+    timer = state["timer"]
+    timer.start()
+    attach_ts_ns(logs)
+    timer.lap("ts_ns")
+    metrics.inc("lines_total", state["index"])
+    metrics.inc("parse_errors_total", state["parse_errors"])
+    return logs
+
+# --- Потоковое чтение загрузки ---
+UPLOAD_CHUNK_SIZE = 64 * 1024  # сколько байт читаем из UploadFile за раз
+UPLOAD_SUFFIXES = (".json", ".json.gz", ".json.zst")  # сжатые загрузки распаковываются на лету
+
+class LineSplitter:
+    """
+    Режет поток байт загрузки на полные строки: feed(кусок) -> строки, закончившиеся в куске,
+    close() -> последняя строка без перевода строки. В памяти — только хвост незавершённой строки.
+    Сжатые данные (gzip / zstd, по магическим байтам) распаковываются по мере поступления.
+    """
+    def __init__(self):
+        self._decompressor = Decompressor()
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._tail: List[str] = []  # части строки, которая ещё не закончилась
+
+    def feed(self, chunk: bytes) -> List[str]:
+        text = self._decoder.decode(self._decompressor.decompress(chunk))
+        if "\n" not in text:
+            self._tail.append(text)
+            return []
+        lines = text.split("\n")
+        lines[0] = "".join(self._tail) + lines[0]
+        self._tail = [lines.pop()]
+        return lines
+
+    def close(self) -> List[str]:
+        last = "".join(self._tail) + self._decoder.decode(self._decompressor.flush(), final=True)
+        self._tail = []
+        return [last] if last else []
+
+async def iter_upload_lines(file: UploadFile, sha256=None) -> AsyncIterator[List[str]]:
+    """
+    Читает UploadFile кусками и отдаёт списки полных строк из каждого куска (см. LineSplitter).
+    sha256 (hashlib) — дополняется байтами загрузки (до распаковки) по мере чтения.
+    """
+    splitter = LineSplitter()
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        if sha256 is not None:
+            sha256.update(chunk)
+        lines = splitter.feed(chunk)
+        if lines:
+            yield lines
+    last = splitter.close()
+    if last:
+        yield last
+
+async def parse_upload_batches(file: UploadFile, metrics: Optional[Metrics] = None,
+                               line_stages: bool = False, sha256=None) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    Разобранные записи загрузки пачками — по одной на прочитанный кусок файла.
+    metrics — время разбора пачек (стадия parse) и счётчики строк/ошибок; line_stages=True —
+    вместо parse время по стадиям каждой строки (см. new_parse_state), это дороже.
+    sha256 — считать хэш загрузки в том же проходе (см. iter_upload_lines).
+    """
+    state = new_parse_state(metrics if line_stages else None)
+    timer = metrics.timer() if metrics is not None and not line_stages else None
+    try:
+        async for lines in iter_upload_lines(file, sha256):
+            if timer: timer.start()
+            batch = [parse_log_line(line.strip(), state) for line in lines if line.strip()]
+            if timer: timer.lap("parse")
+            if batch:
+                yield batch
+    finally:
+        if metrics is not None:
+            metrics.inc("lines_total", state["index"])
+            metrics.inc("parse_errors_total", state["parse_errors"])
+
+def to_ndjson(logs: List[Dict[str, Any]]) -> bytes:
+    return "".join(json.dumps(log, ensure_ascii=False) + "\n" for log in logs).encode("utf-8")
+
+# --- Кэш результатов разбора (одинаковые загрузки не разбираются заново) ---
+# Ключ — sha256 байт загрузки, его считает сервер (клиентскому хэшу не верим: по чужому хэшу
+# выдался бы чужой результат). Загрузку Starlette к вызову обработчика уже сохранил во временный
+# файл, так что хэш — одно чтение этого файла до выбора между кэшем и разбором.
+# В кэше — записи до плагинов (плагины прогоняются при каждой выдаче: их конфигурация и ответы
+# могут меняться) и данные диаграммы Ганта.
+CACHE_MEMORY_BYTES = int(os.environ.get("CACHE_MEMORY_BYTES", str(256 << 20)))   # 0 — кэш выключен
+CACHE_DISK_BYTES = int(os.environ.get("CACHE_DISK_BYTES", str(2 << 30)))         # 0 — без дискового уровня
+CACHE_DIR = os.environ.get("CACHE_DIR") or os.path.join(tempfile.gettempdir(), "tflog_cache")
+CACHE_MAX_ENTRY = int(os.environ.get("CACHE_MAX_ENTRY_BYTES", str(512 << 20)))   # больший результат не кэшируется
+HASH_CHUNK_SIZE = 1 << 20
+# Версия результата разбора: поднимать при любом изменении того, что попадает в кэш (new_parse_state,
+# parse_log_line, attach_ts_ns, LineSplitter, timestamps.py, формат записи в кэше) — результаты
+# других версий не используются
+PARSER_VERSION = "4"
+RESULT_CACHE = (ResultCache(CACHE_MEMORY_BYTES, CACHE_DIR, CACHE_DISK_BYTES, version=PARSER_VERSION)
+                if CACHE_MEMORY_BYTES > 0 else None)
+_cache_tasks = set()  # фоновые сохранения в кэш (ссылки, чтобы их не собрал GC)
+
+def hash_upload(src) -> str:
+    """sha256 загрузки (файловый объект UploadFile.file); после чтения файл снова в начале."""
+    sha256 = hashlib.sha256()
+    while chunk := src.read(HASH_CHUNK_SIZE):
+        sha256.update(chunk)
+    src.seek(0)
+    return sha256.hexdigest()
+
+def gantt_cache_key(digest: str) -> str:
+    return digest + "-gantt"
+
+def iter_pickled(f) -> Iterator[Any]:
+    """Объекты, записанные в f подряд через pickle.dump (так хранятся пачки записей в кэше)."""
+    while True:
+        try:
+            yield pickle.load(f)  # записывали сами (ResultSpool)
+        except EOFError:
+            return
+
+class ResultSpool:
+    """
+    Пачки записей до плагинов — для кэша: каждая сразу сериализуется во временный файл, так что
+    копия результата не держится в памяти. Больше limit байт — копия бросается (файл удаляется).
+    """
+    def __init__(self, limit: int):
+        fd, self.path = tempfile.mkstemp(prefix="tflog_result_", suffix=".tmp")
+        self._file = os.fdopen(fd, "wb")
+        self.limit = limit
+
+    def add(self, batch: List[Dict[str, Any]]) -> bool:
+        """False — результат вышел за limit, копия брошена."""
+        pickle.dump(batch, self._file, protocol=pickle.HIGHEST_PROTOCOL)
+        if self._file.tell() > self.limit:
+            self.discard()
+            return False
+        return True
+
+    def close(self) -> None:
+        self._file.close()
+
+    def discard(self) -> None:
+        self._file.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+def store_parse_result(digest: str, path: str) -> None:
+    """Пачки записей из файла ResultSpool и диаграмма Ганта по ним — в кэш (вызывается в потоке)."""
+    # Для диаграммы нужны только записи запросов и три их поля — все записи в память не читаем
+    rows = []
+    with open(path, "rb") as f:
+        for batch in iter_pickled(f):
+            rows.extend({"tf_req_id": log["tf_req_id"], "tf_resource_type": log["tf_resource_type"],
+                         "timestamp": log["timestamp"]} for log in batch if log["tf_req_id"])
+    gantt = build_gantt_data(rows)
+    RESULT_CACHE.put_file(digest, path)
+    RESULT_CACHE.put(gantt_cache_key(digest), json.dumps({"gantt": gantt}, ensure_ascii=False).encode("utf-8"))
+
+async def iter_cached_batches(blob: bytes) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Пачки записей из кэша: разбираются по одной, по мере выдачи."""
+    for batch in iter_pickled(io.BytesIO(blob)):
+        yield batch
+
+async def stream_parsed_logs(file: UploadFile, digest: Optional[str] = None,
+                             cached: Optional[bytes] = None) -> AsyncIterator[bytes]:
+    """
+    Парсит загрузку по мере чтения, прогоняет через конвейер плагинов и отдаёт записи в NDJSON.
+    cached — результат из кэша (см. store_parse_result): разбор пропускается, плагины — нет.
+    Иначе, если задан digest (sha256 загрузки), разобранные пачки до плагинов копятся в ResultSpool
+    и после успешной выдачи сохраняются в кэш под ним.
+    """
+    started = time.perf_counter()
+    timer = METRICS.timer() if METRICS is not None else None
+    spool = ResultSpool(CACHE_MAX_ENTRY) if digest is not None and cached is None else None
+    completed = False
 
-# --- gRPC-плагин (агрегация ошибок) ---
-def apply_grpc_plugin(logs: List[Dict]) -> List[Dict]:
+    async def tee(batches: AsyncIterator[List[Dict[str, Any]]]) -> AsyncIterator[List[Dict[str, Any]]]:
+        nonlocal spool
+        async for batch in batches:
+            # Сериализуем до плагинов: плагины и attach_ts_ns меняют записи
+            if spool is not None and not spool.add(batch):
+                spool = None  # слишком большой результат — не кэшируем
+            yield batch
+
+    source = (iter_cached_batches(cached) if cached is not None
+              else tee(parse_upload_batches(file, METRICS, METRICS_STAGES)))
     try:
-        with grpc.insecure_channel("localhost:50051") as channel:
-            stub = plugin_pb2_grpc.LogProcessorStub(channel)
-            batch = plugin_pb2.LogBatch(entries=[
-                plugin_pb2.LogEntry(
-                    timestamp=log["timestamp"],
-                    level=log["level"],
-                    message=log["message"],
-                    tf_req_id=log["tf_req_id"] or "",
-                    tf_resource_type=log["tf_resource_type"] or "",
-                    section=log["section"] or ""
-                ) for log in logs
-            ])
-            response = stub.Process(batch)
-            return [{
-                "index": i,
-                "timestamp": e.timestamp,
-                "level": e.level,
-                "message": e.message,
-                "section": e.section or None,
-                "sectionStart": False,
-                "isParsed": True,
-                "tf_req_id": e.tf_req_id or None,
-                "tf_resource_type": e.tf_resource_type or None,
-                "http_req_body": None,
-                "http_res_body": None,
-            } for i, e in enumerate(response.entries)]
+        async for processed in run_pipeline(source, PLUGIN_PIPELINE):
+            if timer: timer.start()
+            attach_ts_ns(processed)
+            if timer: timer.lap("ts_ns")
+            data = to_ndjson(processed)
+            if timer: timer.lap("serialize")
+            yield data
+        completed = True
+    except Exception as e:
+        if METRICS is not None:
+            METRICS.inc("upload_errors_total")
+        # Статус ответа уже отправлен — сообщаем об ошибке последней строкой потока
+        yield (json.dumps({"error": f"Parse error: {str(e)}"}, ensure_ascii=False) + "\n").encode("utf-8")
+    finally:
+        if spool is not None and not completed:  # ошибка или клиент оборвал выдачу
+            spool.discard()
+            spool = None
+        if METRICS is not None:
+            METRICS.inc("uploads_total")
+            if getattr(file, "size", None) is not None:  # размер выставляет Starlette при разборе формы
+                METRICS.observe("upload_bytes", file.size, buckets=SIZE_BUCKETS)
+            METRICS.observe("parse_seconds", time.perf_counter() - started)
+    if spool is not None:
+        spool.close()
+        task = asyncio.create_task(asyncio.to_thread(store_parse_result, digest, spool.path))
+        _cache_tasks.add(task)
+        task.add_done_callback(_cache_tasks.discard)
+
+# --- gRPC-плагины: конвейер ---
+PLUGIN_ADDR = os.environ.get("PLUGIN_ADDR", "localhost:50051")
+PLUGIN_BATCH_SIZE = int(os.environ.get("PLUGIN_BATCH_SIZE", "1000"))          # записей в LogBatch
+PLUGIN_MAX_IN_FLIGHT = int(os.environ.get("PLUGIN_MAX_IN_FLIGHT", "4"))      # пачек без ответа в потоке
+PLUGIN_CHANNELS = int(os.environ.get("PLUGIN_CHANNELS", "2"))                # размер пула каналов плагина
+PLUGIN_STREAMING = os.environ.get("PLUGIN_STREAMING", "1") != "0"            # 0 — только унарный Process
+PLUGIN_DEADLINE = float(os.environ.get("PLUGIN_DEADLINE", "10"))             # сек на ответ по одной пачке
+PLUGIN_CHANNEL_OPTIONS = [
+    ("grpc.max_send_message_length", 64 * 1024 * 1024),
+    ("grpc.max_receive_message_length", 64 * 1024 * 1024),
+    ("grpc.keepalive_time_ms", 30000),
+    # Канал живёт долго: после перезапуска плагина переподключаемся за секунды, а не за минуты
+    ("grpc.initial_reconnect_backoff_ms", 200),
+    ("grpc.max_reconnect_backoff_ms", 2000),
+]
+# Поля LogEntry, которые плагин может поменять; section/tf_* — пустая строка означает None
+PLUGIN_FIELDS = ("timestamp", "level", "message", "tf_req_id", "tf_resource_type", "section")
+_OPTIONAL_FIELDS = {"tf_req_id", "tf_resource_type", "section"}
+
+class ChannelPool:
+    """
+    Долгоживущие каналы к плагину, раздаются по кругу. Создаются при первом обращении,
+    закрываются при остановке API. loop_bound=True — для aio-каналов: они привязаны к event loop,
+    в котором созданы, и пересоздаются, если get() вызван из другого loop.
+    """
+    def __init__(self, factory: Callable[[], Any], size: int, loop_bound: bool = False):
+        self._factory = factory
+        self._size = max(1, size)
+        self._loop_bound = loop_bound
+        self._loop = None
+        self._channels: List[Any] = []
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def get(self):
+        loop = asyncio.get_running_loop() if self._loop_bound else None
+        with self._lock:
+            if not self._channels or loop is not self._loop:
+                self._channels = [self._factory() for _ in range(self._size)]
+                self._loop = loop
+            channel = self._channels[self._next % self._size]
+            self._next += 1
+            return channel
+
+    def close(self) -> List[Any]:
+        """Закрывает каналы; для aio-каналов возвращает корутины close(), их нужно дождаться."""
+        with self._lock:
+            channels, self._channels = self._channels, []
+        return [channel.close() for channel in channels]
+
+class Plugin:
+    """Один плагин конвейера: адрес, дедлайн на пачку и свой пул aio-каналов."""
+    def __init__(self, name: str, addr: str, deadline: float = PLUGIN_DEADLINE,
+                 streaming: bool = PLUGIN_STREAMING, channels: int = PLUGIN_CHANNELS):
+        self.name = name
+        self.addr = addr
+        self.deadline = deadline
+        self.streaming = streaming
+        self.channels = ChannelPool(
+            lambda: grpc.aio.insecure_channel(addr, options=PLUGIN_CHANNEL_OPTIONS), channels, loop_bound=True)
+        # Плагин ответил UNIMPLEMENTED на ProcessStream — дальше только унарный Process
+        self.stream_unsupported = threading.Event()
+
+    def stub(self) -> "plugin_pb2_grpc.LogProcessorStub":
+        return plugin_pb2_grpc.LogProcessorStub(self.channels.get())
+
+def load_pipeline(spec: Optional[str]) -> List[List[Plugin]]:
+    """
+    Конвейер из JSON (переменная PLUGIN_PIPELINE): список стадий, стадия — список плагинов
+    (или один плагин), плагин — {"addr": ..., "name": ..., "deadline": сек, "streaming": bool,
+    "channels": n}. Плагины стадии работают параллельно, стадии — друг за другом:
+        [[{"name": "errors", "addr": "localhost:50051"}, {"name": "filter", "addr": "localhost:50052"}],
+         {"name": "redact", "addr": "localhost:50053", "deadline": 2}]
+    Без PLUGIN_PIPELINE — один плагин PLUGIN_ADDR.
+    """
+    if not spec:
+        return [[Plugin("plugin", PLUGIN_ADDR)]]
+    pipeline = []
+    for n, stage in enumerate(json.loads(spec)):
+        if isinstance(stage, dict):
+            stage = [stage]
+        pipeline.append([Plugin(name=conf.get("name") or f"stage{n}.{i}", addr=conf["addr"],
+                                deadline=float(conf.get("deadline", PLUGIN_DEADLINE)),
+                                streaming=bool(conf.get("streaming", PLUGIN_STREAMING)),
+                                channels=int(conf.get("channels", PLUGIN_CHANNELS)))
+                         for i, conf in enumerate(stage)])
+    return pipeline
+
+PLUGIN_PIPELINE = load_pipeline(os.environ.get("PLUGIN_PIPELINE"))
+
+def to_log_batch(logs: List[Dict]) -> "plugin_pb2.LogBatch":
+    return plugin_pb2.LogBatch(entries=[
+        plugin_pb2.LogEntry(
+            timestamp=log["timestamp"],
+            level=log["level"],
+            message=log["message"],
+            tf_req_id=log["tf_req_id"] or "",
+            tf_resource_type=log["tf_resource_type"] or "",
+            section=log["section"] or "",
+            index=log["index"],
+        ) for log in logs
+    ])
+
+def entry_changes(log: Dict, entry: "plugin_pb2.LogEntry") -> Dict[str, Any]:
+    """Поля, которые плагин поменял в записи (его аннотации)."""
+    changes = {}
+    for field in PLUGIN_FIELDS:
+        value = getattr(entry, field)
+        if field in _OPTIONAL_FIELDS:
+            value = value or None
+        if value != log[field]:
+            changes[field] = value
+    return changes
+
+def merge_results(batch: List[Dict], stage: List[Plugin],
+                  responses: List[Optional["plugin_pb2.LogBatch"]]) -> List[Dict]:
+    """
+    Сводит ответы плагинов стадии на одну пачку обратно в записи, в исходном порядке.
+
+    Ответ сопоставляется с записями по LogEntry.index; плагин, который index не заполняет,
+    но вернул столько же записей, — по позиции. Запись, которой нет в ответе, отфильтрована
+    плагином и выпадает. Изменённые поля применяются в порядке плагинов в конфиге
+    (при конфликте побеждает последний) и сохраняются в log["annotations"][имя плагина].
+    None вместо ответа — плагин недоступен или не уложился в дедлайн: записи идут как есть.
+    """
+    dropped = set()
+    updates: List[tuple] = []
+    for plugin, response in zip(stage, responses):
+        if response is None:
+            continue
+        entries = response.entries
+        if len(entries) == len(batch) and any(e.index != log["index"] for e, log in zip(entries, batch)):
+            by_index = {log["index"]: e for log, e in zip(batch, entries)}
+        else:
+            by_index = {e.index: e for e in entries}
+        for log in batch:
+            entry = by_index.get(log["index"])
+            if entry is None:
+                dropped.add(log["index"])
+                continue
+            changes = entry_changes(log, entry)
+            if changes:
+                updates.append((log, plugin.name, changes))
+    # Все плагины стадии сравниваются с одним и тем же входом — применяем после сравнения
+    for log, name, changes in updates:
+        log.update(changes)
+        log.setdefault("annotations", {})[name] = changes
+    return [log for log in batch if log["index"] not in dropped]
+
+async def rebatch(batches: AsyncIterator[List[Dict]], size: int) -> AsyncIterator[List[Dict]]:
+    """
+    Перекладывает записи в пачки по size (последняя — остаток). Первая пачка уходит сразу, какой
+    пришла (но не больше size): клиент получает первые записи, не дожидаясь полной пачки.
+    """
+    buf: List[Dict] = []
+    first = True
+    try:
+        async for batch in batches:
+            buf.extend(batch)
+            while len(buf) >= size or (first and buf):
+                first = False
+                yield buf[:size]
+                buf = buf[size:]
+    except Exception:
+        if buf:
+            yield buf  # разобранное до ошибки тоже уходит клиенту
+        raise
+    if buf:
+        yield buf
+
+async def process_unary(plugin: Plugin, part: List[Dict]) -> Optional["plugin_pb2.LogBatch"]:
+    """Унарный Process для одной пачки; None, если плагин недоступен или не уложился в дедлайн."""
+    started = time.perf_counter()
+    try:
+        response = await plugin.stub().Process(to_log_batch(part), timeout=plugin.deadline)
     except grpc.RpcError:
-        # Если плагин недоступен — возвращаем как есть
-        return logs
+        if METRICS is not None:
+            METRICS.inc("plugin_fallbacks_total", plugin=plugin.name)
+        return None
+    if METRICS is not None:
+        METRICS.observe("plugin_rpc_seconds", time.perf_counter() - started, plugin=plugin.name, method="Process")
+    return response
+
+async def process_stream(plugin: Plugin, batches: AsyncIterator[List[Dict]]
+                         ) -> AsyncIterator[Optional["plugin_pb2.LogBatch"]]:
+    """
+    Прогоняет пачки через плагин и отдаёт ровно один результат на каждую пачку, в исходном
+    порядке: ответ плагина (LogBatch) или None (см. merge_results).
+
+    Основной путь — двунаправленный ProcessStream. Backpressure: без ответа может висеть
+    не больше PLUGIN_MAX_IN_FLIGHT пачек, дальше вход ждёт плагин. Если плагин не поддерживает
+    поток (UNIMPLEMENTED), поток оборвался или ответ не пришёл за plugin.deadline, оставшиеся
+    пачки идут унарным Process с тем же дедлайном.
+    """
+    if not plugin.streaming or plugin.stream_unsupported.is_set():
+        async for part in batches:
+            yield await process_unary(plugin, part)
+        return
+
+    call = plugin.stub().ProcessStream()
+    # Отправленные пачки без ответа (пачка, время отправки); None — конец входа.
+    # maxsize и есть окно backpressure.
+    pending: asyncio.Queue = asyncio.Queue(maxsize=PLUGIN_MAX_IN_FLIGHT)
+
+    async def writer():
+        streaming = True
+        try:
+            async for part in batches:
+                await pending.put((part, time.perf_counter()))
+                if streaming:
+                    try:
+                        await call.write(to_log_batch(part))
+                    except (grpc.RpcError, asyncio.InvalidStateError):
+                        streaming = False  # остаток заберёт читатель через унарный путь
+        finally:
+            if streaming and not call.done():
+                # И при ошибке входа: плагин дообработает отправленное, поток закроется штатно
+                try:
+                    await call.done_writing()
+                except (grpc.RpcError, asyncio.InvalidStateError):
+                    pass
+            await pending.put(None)
+
+    write_task = asyncio.create_task(writer())
+    try:
+        try:
+            while True:
+                response = await asyncio.wait_for(call.read(), plugin.deadline)
+                if response is grpc.aio.EOF:
+                    break
+                sent = pending.get_nowait()
+                if sent is None:
+                    pending.put_nowait(None)  # лишний ответ плагина — игнорируем
+                    continue
+                if METRICS is not None:
+                    METRICS.observe("plugin_rpc_seconds", time.perf_counter() - sent[1],
+                                    plugin=plugin.name, method="ProcessStream")
+                yield response
+        except asyncio.TimeoutError:
+            call.cancel()  # плагин не уложился — поток бросаем
+        except grpc.RpcError as e:
+            if e.code() == grpc.StatusCode.UNIMPLEMENTED:
+                plugin.stream_unsupported.set()
+
+        # Всё, на что плагин не ответил по потоку, — унарным вызовом
+        while (sent := await pending.get()) is not None:
+            yield await process_unary(plugin, sent[0])
+        await write_task  # ошибка входа всплывает здесь
+    finally:
+        if not write_task.done():
+            write_task.cancel()
+        call.cancel()
+
+async def _drain(queue: asyncio.Queue) -> AsyncIterator[List[Dict]]:
+    while (item := await queue.get()) is not None:
+        yield item
+
+async def run_stage(stage: List[Plugin], batches: AsyncIterator[List[Dict]]) -> AsyncIterator[List[Dict]]:
+    """
+    Одна стадия: каждая пачка параллельно уходит во все плагины стадии, ответы сводятся
+    merge_results. Время стадии — время самого медленного плагина, а не сумма.
+    """
+    queues = [asyncio.Queue(maxsize=PLUGIN_MAX_IN_FLIGHT) for _ in stage]
+    originals: asyncio.Queue = asyncio.Queue()  # ограничена очередями плагинов
+
+    async def feeder():
+        try:
+            async for batch in batches:
+                await originals.put(batch)
+                for queue in queues:
+                    await queue.put(batch)
+        finally:
+            for queue in queues:
+                await queue.put(None)
+            await originals.put(None)
+
+    results = [process_stream(plugin, _drain(queue)) for plugin, queue in zip(stage, queues)]
+    feed_task = asyncio.create_task(feeder())
+    try:
+        while (batch := await originals.get()) is not None:
+            responses = await asyncio.gather(*(r.__anext__() for r in results))
+            merged = merge_results(batch, stage, responses)
+            if merged:
+                yield merged
+        await feed_task  # ошибка входа всплывает здесь
+    finally:
+        if not feed_task.done():
+            feed_task.cancel()
+        for r in results:
+            await r.aclose()
+
+async def run_pipeline(batches: AsyncIterator[List[Dict]],
+                       pipeline: List[List[Plugin]]) -> AsyncIterator[List[Dict]]:
+    """Пачки записей через все стадии конвейера по очереди (выход стадии — вход следующей)."""
+    stream = rebatch(batches, PLUGIN_BATCH_SIZE)
+    for stage in pipeline:
+        stream = run_stage(stage, stream)
+    async for batch in stream:
+        yield batch
+
+# --- Фоновые задания разбора (POST /jobs) ---
+# Разбор — чистый CPU: в event loop он задерживал бы все остальные запросы. Задание (разбор
+# и плагины) целиком идёт в пуле процессов, в API остаются только приём файла и отдача результата.
+JOBS_WORKERS = int(os.environ.get("JOBS_WORKERS", str(min(4, os.cpu_count() or 1))))    # процессов разбора
+JOBS_MAX_ACTIVE = int(os.environ.get("JOBS_MAX_ACTIVE", str(JOBS_WORKERS * 4)))         # в очереди + в работе
+JOBS_MAX_UPLOAD = int(os.environ.get("JOBS_MAX_UPLOAD", str(4 << 30)))                  # байт на загрузку
+JOBS_NICE = int(os.environ.get("JOBS_NICE", "10"))   # приоритет процессов разбора ниже, чем у API
+JOBS_TTL = float(os.environ.get("JOBS_TTL", "3600"))            # сек, сколько хранить результат готового задания
+JOBS_DIR = os.environ.get("JOBS_DIR")  # по умолчанию — временная папка, создаётся при первом задании
+JOBS_PROGRESS_INTERVAL = 0.25  # сек между сообщениями воркера о прогрессе
+JOBS_RETRY_AFTER = 5           # сек, подсказка клиенту при 429
+JOB_DONE_STATUSES = ("done", "failed")
+
+JOBS: Dict[str, Dict[str, Any]] = {}  # id -> задание (см. new_job); меняется только в event loop
+_jobs_dir: Optional[str] = None
+_job_pool: Optional[ProcessPoolExecutor] = None
+_job_progress = None        # multiprocessing.Queue: (id, прочитано байт, строк) от воркеров
+_job_tasks = set()          # asyncio-задачи заданий (ссылки, чтобы их не собрал GC)
+_progress_worker_queue = None  # в процессе пула — очередь прогресса (см. _init_job_worker)
+
+def jobs_dir() -> str:
+    global _jobs_dir
+    if _jobs_dir is None:
+        if JOBS_DIR:
+            os.makedirs(JOBS_DIR, exist_ok=True)
+        _jobs_dir = JOBS_DIR or tempfile.mkdtemp(prefix="tflog_jobs_")
+    return _jobs_dir
+
+def new_job(filename: str) -> Dict[str, Any]:
+    job_id = uuid.uuid4().hex
+    return {
+        "id": job_id,
+        "status": "queued",   # queued -> running -> done / failed
+        "filename": filename,
+        "created": time.time(),
+        "started": None,
+        "finished": None,
+        "progress": {"bytes_read": 0, "bytes_total": 0, "lines": 0},
+        "summary": None,
+        "error": None,
+        "upload_path": os.path.join(jobs_dir(), f"{job_id}.upload"),
+        "result_path": os.path.join(jobs_dir(), f"{job_id}.ndjson"),
+    }
+
+def job_view(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Задание для ответа API: без путей на диске, с долей прочитанного."""
+    view = {k: v for k, v in job.items() if not k.endswith("_path")}
+    progress = dict(job["progress"])
+    total = progress["bytes_total"]
+    progress["fraction"] = 1.0 if job["status"] == "done" else (
+        round(progress["bytes_read"] / total, 4) if total else 0.0)
+    view["progress"] = progress
+    view["queue_position"] = None
+    if job["status"] == "queued":
+        view["queue_position"] = sum(1 for j in JOBS.values()
+                                     if j["status"] == "queued" and j["created"] < job["created"])
+    if job["status"] == "done":
+        view["result"] = f"/jobs/{job['id']}/result"
+    return view
+
+def _init_job_worker(progress_queue) -> None:
+    global _progress_worker_queue
+    _progress_worker_queue = progress_queue
+    if JOBS_NICE and hasattr(os, "nice"):
+        os.nice(JOBS_NICE)  # при нехватке CPU ядро отдаёт его сначала event loop API
+
+def run_parse_job(job_id: str, path_in: str, path_out: str) -> Tuple[Dict[str, Any], Optional[Dict]]:
+    """
+    Воркер пула: задание целиком — разбор загруженного файла (как /upload, с распаковкой
+    gzip / zstd) и конвейер плагинов, результат — NDJSON path_out. У процесса свой event loop
+    и свои каналы к плагинам, так что API не тратит на задание ни процессорного времени, ни GIL.
+    Возвращает (сводка, снимок метрик задания) — снимок родитель сливает в свои METRICS.
+    """
+    global METRICS
+    if METRICS is not None:
+        METRICS = Metrics()  # в процессе пула — свои метрики на каждое задание
+    summary = asyncio.run(_run_parse_job(job_id, path_in, path_out))
+    return summary, METRICS.snapshot() if METRICS is not None else None
+
+async def _run_parse_job(job_id: str, path_in: str, path_out: str) -> Dict[str, Any]:
+    started = time.perf_counter()
+    state = new_parse_state(METRICS if METRICS_STAGES else None)
+    levels: Dict[str, int] = {}
+    sections: Dict[str, int] = {}
+    records = 0
+
+    def report(bytes_read: int) -> None:
+        if _progress_worker_queue is not None:
+            _progress_worker_queue.put((job_id, bytes_read, state["index"]))
+
+    async def batches() -> AsyncIterator[List[Dict[str, Any]]]:
+        splitter = LineSplitter()
+        bytes_read = 0
+        reported = time.perf_counter()
+        with open(path_in, "rb") as fin:
+            while chunk := fin.read(UPLOAD_CHUNK_SIZE):
+                bytes_read += len(chunk)
+                batch = [parse_log_line(line.strip(), state) for line in splitter.feed(chunk) if line.strip()]
+                if batch:
+                    yield batch
+                if time.perf_counter() - reported >= JOBS_PROGRESS_INTERVAL:
+                    report(bytes_read)
+                    reported = time.perf_counter()
+        batch = [parse_log_line(line.strip(), state) for line in splitter.close() if line.strip()]
+        if batch:
+            yield batch
+
+    report(0)  # задание взято воркером
+    try:
+        with open(path_out, "wb") as fout:
+            async for processed in run_pipeline(batches(), PLUGIN_PIPELINE):
+                attach_ts_ns(processed)
+                for log in processed:
+                    levels[log["level"]] = levels.get(log["level"], 0) + 1
+                    if log["section"]:
+                        sections[log["section"]] = sections.get(log["section"], 0) + 1
+                records += len(processed)
+                fout.write(to_ndjson(processed))
+    finally:
+        # Каналы привязаны к loop этого задания — закрываем вместе с ним
+        await asyncio.gather(*(c for stage in PLUGIN_PIPELINE for plugin in stage for c in plugin.channels.close()))
+    if METRICS is not None:
+        METRICS.inc("lines_total", state["index"])
+        METRICS.inc("parse_errors_total", state["parse_errors"])
+    return {
+        "lines": state["index"],
+        "records": records,  # после плагинов (фильтр может отбросить часть записей)
+        "parse_errors": state["parse_errors"],
+        "level_counts": levels,
+        "section_counts": sections,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+def _apply_job_progress(job_id: str, bytes_read: int, lines: int) -> None:
+    job = JOBS.get(job_id)
+    if job is None:
+        return
+    if job["status"] == "queued":  # первое сообщение воркера — задание взято в работу
+        job["status"] = "running"
+        job["started"] = time.time()
+        if METRICS is not None:
+            METRICS.observe("job_wait_seconds", job["started"] - job["created"])
+    if job["status"] == "running":
+        job["progress"] = {**job["progress"], "bytes_read": bytes_read, "lines": lines}
+
+def _read_job_progress(progress_queue, loop: asyncio.AbstractEventLoop) -> None:
+    """Поток API: передаёт прогресс из очереди воркеров в event loop (None — остановка)."""
+    while (item := progress_queue.get()) is not None:
+        try:
+            loop.call_soon_threadsafe(_apply_job_progress, *item)
+        except RuntimeError:  # loop уже закрыт
+            break
+
+def job_pool() -> ProcessPoolExecutor:
+    """Пул создаётся при первом задании. spawn, а не fork: форк процесса с живыми gRPC-каналами небезопасен."""
+    global _job_pool, _job_progress
+    if _job_pool is None:
+        ctx = multiprocessing.get_context("spawn")
+        _job_progress = ctx.Queue()
+        threading.Thread(target=_read_job_progress, args=(_job_progress, asyncio.get_running_loop()),
+                         name="job-progress", daemon=True).start()
+        _job_pool = ProcessPoolExecutor(max_workers=JOBS_WORKERS, mp_context=ctx,
+                                        initializer=_init_job_worker, initargs=(_job_progress,))
+    return _job_pool
+
+def active_jobs() -> int:
+    return sum(1 for job in JOBS.values() if job["status"] not in JOB_DONE_STATUSES)
+
+def remove_job_files(job: Dict[str, Any]) -> None:
+    for key in ("upload_path", "result_path"):
+        try:
+            os.remove(job[key])
+        except FileNotFoundError:
+            pass
+
+def expire_jobs() -> None:
+    """Удаляет готовые задания старше JOBS_TTL вместе с файлами."""
+    now = time.time()
+    for job_id, job in list(JOBS.items()):
+        if job["status"] in JOB_DONE_STATUSES and now - job["finished"] > JOBS_TTL:
+            remove_job_files(job)
+            del JOBS[job_id]
+
+async def run_job(job: Dict[str, Any]) -> None:
+    """Ждёт задание из пула процессов и переносит его итог в JOBS; event loop при этом свободен."""
+    started = time.perf_counter()
+    try:
+        future = job_pool().submit(run_parse_job, job["id"], job["upload_path"], job["result_path"])
+        job["summary"], snapshot = await asyncio.wrap_future(future)
+        if snapshot is not None:
+            METRICS.merge(snapshot)
+        job["started"] = job["started"] or time.time()  # сообщение о старте могло не успеть дойти
+        job["progress"] = {**job["progress"], "bytes_read": job["progress"]["bytes_total"],
+                           "lines": job["summary"]["lines"]}
+        job["status"] = "done"
+    except Exception as e:
+        job["status"] = "failed"
+        job["error"] = f"{type(e).__name__}: {e}"
+        if METRICS is not None:
+            METRICS.inc("jobs_failed_total")
+    finally:
+        job["finished"] = time.time()
+        if job["status"] == "done":
+            os.remove(job["upload_path"])  # результат хранится до JOBS_TTL
+        else:
+            remove_job_files(job)
+        if METRICS is not None:
+            METRICS.observe("job_seconds", time.perf_counter() - started)
+
+def save_upload(src, path: str, limit: int) -> int:
+    """Копирует загрузку на диск; ValueError, если она больше limit байт."""
+    size = 0
+    with open(path, "wb") as dst:
+        while chunk := src.read(1 << 20):
+            size += len(chunk)
+            if size > limit:
+                raise ValueError(size)
+            dst.write(chunk)
+    return size
+
+# --- Хранилище прогонов (SQLite: страницы записей, поиск и диаграмма Ганта на сервере) ---
+STORE_PATH = os.environ.get("STORE_PATH") or os.path.join(tempfile.gettempdir(), "tflog_runs.sqlite3")
+STORE_ENABLED = os.environ.get("STORE", "1") != "0"
+STORE_PAGE_SIZE = int(os.environ.get("STORE_PAGE_SIZE", "500"))     # записей на страницу по умолчанию
+STORE_MAX_PAGE_SIZE = int(os.environ.get("STORE_MAX_PAGE_SIZE", "5000"))
+# Сек без новых пачек, после которых чужой незавершённый прогон считается брошенным и удаляется
+STORE_STALE_AFTER = float(os.environ.get("STORE_STALE_AFTER", str(STALE_AFTER)))
+
+_log_store: Optional[LogStore] = None
+
+def log_store() -> LogStore:
+    """База открывается при первом обращении (процессы пула заданий импортируют api, но её не трогают)."""
+    global _log_store
+    if not STORE_ENABLED:
+        raise HTTPException(status_code=404, detail="Run store is disabled (STORE=0)")
+    if _log_store is None:
+        _log_store = LogStore(STORE_PATH, stale_after=STORE_STALE_AFTER)
+    return _log_store
+
+async def ingest_run(file: UploadFile, run_id: int) -> Tuple[int, str]:
+    """
+    Разбирает загрузку (как /upload: с распаковкой и плагинами) и пишет записи в хранилище пачками.
+    Возвращает (число записей, sha256 загрузки — посчитан в том же проходе).
+    """
+    store = log_store()
+    seq = 0
+    sha256 = hashlib.sha256()
+    async for processed in run_pipeline(parse_upload_batches(file, METRICS, METRICS_STAGES, sha256),
+                                        PLUGIN_PIPELINE):
+        attach_ts_ns(processed)
+        seq = await asyncio.to_thread(store.add_logs, run_id, seq, processed)
+    return seq, sha256.hexdigest()
+
+def parse_ts_param(name: str, value: Optional[str]) -> Optional[int]:
+    """Граница времени из параметра запроса (ISO 8601) в epoch ns."""
+    if value is None:
+        return None
+    ns = int(parse_ts_column([value])[0])
+    if ns == NAT:
+        raise HTTPException(status_code=400, detail=f"Bad {name}: expected an ISO 8601 timestamp")
+    return ns
+
+def get_run_or_404(run_id: int, counts: bool = False) -> Dict[str, Any]:
+    run = log_store().get_run(run_id, counts)
+    if run is None:
+        raise HTTPException(status_code=404, detail="Run not found")
+    return run
 
 # --- Экспорт: подготовка данных для диаграммы Ганта ---
+def ts_ns_column(logs: List[Dict]) -> np.ndarray:
+    """Колонка epoch ns по логам: берёт ts_ns, разобранный при приёме, иначе разбирает timestamp."""
+    if all("ts_ns" in log for log in logs):
+        return np.fromiter((NAT if log["ts_ns"] is None else log["ts_ns"] for log in logs),
+                           dtype=np.int64, count=len(logs))
+    return parse_ts_column([log.get("timestamp") for log in logs])
+
+def _gantt_iso(log: Dict, ns: int) -> str:
+    try:
+        return datetime.fromisoformat(log["timestamp"].replace("Z", "+00:00")).isoformat()
+    except (AttributeError, KeyError, ValueError):
+        return np.datetime64(ns, "ns").astype(datetime).replace(tzinfo=timezone.utc).isoformat()
+
 def build_gantt_data(logs: List[Dict]) -> List[Dict]:
     """Строит хронологию запросов по tf_req_id с длительностью"""
-    req_map = {}
-    for log in logs:
+    # Коды tf_req_id в порядке первого появления; ресурс — из первой записи запроса
+    req_codes: Dict[str, int] = {}
+    resources = []
+    codes = np.full(len(logs), -1, dtype=np.int64)
+    for i, log in enumerate(logs):
         req_id = log.get("tf_req_id")
         if not req_id:
             continue
-        if req_id not in req_map:
-            req_map[req_id] = {"start": None, "end": None, "resource": log.get("tf_resource_type")}
-        ts = log.get("timestamp")
-        if ts != "N/A":
-            try:
-                dt = datetime.fromisoformat(ts.replace("Z", "+00:00"))
-                if req_map[req_id]["start"] is None or dt < req_map[req_id]["start"]:
-                    req_map[req_id]["start"] = dt
-                if req_map[req_id]["end"] is None or dt > req_map[req_id]["end"]:
-                    req_map[req_id]["end"] = dt
-            except:
-                pass
+        code = req_codes.get(req_id)
+        if code is None:
+            code = req_codes[req_id] = len(resources)
+            resources.append(log.get("tf_resource_type"))
+        codes[i] = code
+    ts = ts_ns_column(logs)
 
+    # Дальше всё векторно: сортировка по (запрос, время) и первые элементы групп
+    idx = np.flatnonzero((codes >= 0) & (ts != NAT))
+    if idx.size == 0:
+        return []
+    c, t = codes[idx], ts[idx]
+    by_start = np.lexsort((idx, t, c))   # min ts, при равенстве — более ранняя запись
+    by_end = np.lexsort((idx, -t, c))    # max ts, при равенстве — более ранняя запись
+    c_sorted = c[by_start]
+    first = np.ones(c_sorted.size, dtype=bool)
+    first[1:] = c_sorted[1:] != c_sorted[:-1]
+    start_idx, end_idx = idx[by_start][first], idx[by_end][first]
+    start_ns, end_ns = ts[start_idx], ts[end_idx]
+    # Как timedelta.total_seconds(): микросекунды / 10**6, затем * 1000 с отбрасыванием дроби
+    duration_ms = np.trunc((end_ns - start_ns) // 1000 / 10**6 * 1000).astype(np.int64)
+
+    req_ids = list(req_codes)
     gantt = []
-    for req_id, data in req_map.items():
-        if data["start"] and data["end"]:
-            gantt.append({
-                "tf_req_id": req_id,
-                "tf_resource_type": data["resource"],
-                "start": data["start"].isoformat(),
-                "end": data["end"].isoformat(),
-                "duration_ms": int((data["end"] - data["start"]).total_seconds() * 1000)
-            })
+    for code, si, ei, s_ns, e_ns, dur in zip(c_sorted[first].tolist(), start_idx.tolist(), end_idx.tolist(),
+                                             start_ns.tolist(), end_ns.tolist(), duration_ms.tolist()):
+        gantt.append({
+            "tf_req_id": req_ids[code],
+            "tf_resource_type": resources[code],
+            "start": _gantt_iso(logs[si], s_ns),
+            "end": _gantt_iso(logs[ei], e_ns),
+            "duration_ms": dur,
+        })
     return gantt
 
 # --- Модели ---
@@ -131,17 +991,192 @@ class ExportRequest(BaseModel):
     logs: List[Dict[str, Any]]
 
 # --- Эндпоинты ---
+@app.on_event("shutdown")
+async def close_plugin_channels():
+    await asyncio.gather(*(c for stage in PLUGIN_PIPELINE for plugin in stage for c in plugin.channels.close()))
+
+@app.on_event("shutdown")
+async def stop_job_pool():
+    if _job_pool is not None:
+        _job_pool.shutdown(wait=False, cancel_futures=True)
+        _job_progress.put(None)
+    for job in JOBS.values():
+        remove_job_files(job)
+    if _jobs_dir is not None and not JOBS_DIR:
+        shutil.rmtree(_jobs_dir, ignore_errors=True)
+
+@app.get("/metrics")
+async def get_metrics():
+    if METRICS is None:
+        raise HTTPException(status_code=404, detail="Metrics are disabled (METRICS=0)")
+    return PlainTextResponse(METRICS.render_prometheus(), media_type="text/plain; version=0.0.4")
+
 @app.post("/upload")
 async def upload_log(file: UploadFile = File(...)):
-    if not file.filename.endswith(".json"):
-        raise HTTPException(status_code=400, detail="Only .json files allowed")
-    content = await file.read()
+    """
+    Ответ — NDJSON записей. Заголовок X-Content-SHA256 — sha256 загрузки, посчитанный сервером:
+    по нему же ищется готовый результат в кэше (X-Cache: hit / miss), и его клиент передаёт
+    в /api/gantt?sha256= (X-Gantt) — результат при промахе сохраняется после полной выдачи.
+    """
+    if not file.filename.endswith(UPLOAD_SUFFIXES):
+        raise HTTPException(status_code=400, detail="Only .json files allowed (optionally .json.gz / .json.zst)")
+    digest = await asyncio.to_thread(hash_upload, file.file)
+    headers = {**STREAM_HEADERS, "X-Content-SHA256": digest}
+    cached = None
+    if RESULT_CACHE is not None:
+        cached = await asyncio.to_thread(RESULT_CACHE.get, digest)
+        if METRICS is not None:
+            METRICS.inc("cache_lookups_total", result="hit" if cached is not None else "miss")
+        headers.update({"X-Cache": "hit" if cached is not None else "miss",
+                        "X-Gantt": f"/api/gantt?sha256={digest}"})
+    # Ответ — NDJSON: записи уходят клиенту по мере разбора, память не зависит от размера файла
+    return StreamingResponse(stream_parsed_logs(file, digest if RESULT_CACHE is not None else None, cached),
+                             media_type="application/x-ndjson",
+                             headers=headers)
+
+@app.get("/cache")
+async def cache_info():
+    """Статистика кэша результатов: попадания по уровням, промахи, заполненность, версия парсера."""
+    if RESULT_CACHE is None:
+        raise HTTPException(status_code=404, detail="Result cache is disabled (CACHE_MEMORY_BYTES=0)")
+    return await asyncio.to_thread(RESULT_CACHE.info)
+
+@app.post("/jobs", status_code=202)
+async def create_job(file: UploadFile = File(...)):
+    """
+    Фоновый разбор: файл сохраняется, разбор идёт в пуле процессов, ответ — сразу (id задания).
+    Приём ограничен: не больше JOBS_MAX_ACTIVE заданий в очереди и в работе (иначе 429
+    с Retry-After) и не больше JOBS_MAX_UPLOAD байт на файл (иначе 413).
+    """
+    if not file.filename.endswith(UPLOAD_SUFFIXES):
+        raise HTTPException(status_code=400, detail="Only .json files allowed (optionally .json.gz / .json.zst)")
+    expire_jobs()
+    if active_jobs() >= JOBS_MAX_ACTIVE:
+        if METRICS is not None:
+            METRICS.inc("jobs_rejected_total", reason="queue_full")
+        raise HTTPException(status_code=429, detail=f"Too many jobs in progress ({JOBS_MAX_ACTIVE}), retry later",
+                            headers={"Retry-After": str(JOBS_RETRY_AFTER)})
+    if getattr(file, "size", None) is not None and file.size > JOBS_MAX_UPLOAD:
+        if METRICS is not None:
+            METRICS.inc("jobs_rejected_total", reason="too_large")
+        raise HTTPException(status_code=413, detail=f"Upload is larger than {JOBS_MAX_UPLOAD} bytes")
+
+    job = new_job(file.filename)
+    JOBS[job["id"]] = job  # место занято до первого await — лимит не обойти параллельными запросами
     try:
-        logs = parse_log_content(content.decode("utf-8"))
-        processed_logs = apply_grpc_plugin(logs)
-        return JSONResponse({"logs": processed_logs})
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Parse error: {str(e)}")
+        job["progress"]["bytes_total"] = await asyncio.to_thread(
+            save_upload, file.file, job["upload_path"], JOBS_MAX_UPLOAD)
+    except ValueError:
+        del JOBS[job["id"]]
+        remove_job_files(job)
+        if METRICS is not None:
+            METRICS.inc("jobs_rejected_total", reason="too_large")
+        raise HTTPException(status_code=413, detail=f"Upload is larger than {JOBS_MAX_UPLOAD} bytes")
+    except BaseException:
+        del JOBS[job["id"]]
+        remove_job_files(job)
+        raise
+    if METRICS is not None:
+        METRICS.inc("jobs_submitted_total")
+        METRICS.observe("upload_bytes", job["progress"]["bytes_total"], buckets=SIZE_BUCKETS)
+    task = asyncio.create_task(run_job(job))
+    _job_tasks.add(task)
+    task.add_done_callback(_job_tasks.discard)
+    return JSONResponse(job_view(job), status_code=202, headers={"Location": f"/jobs/{job['id']}"})
+
+@app.get("/jobs")
+async def list_jobs():
+    expire_jobs()
+    return {"active": active_jobs(), "max_active": JOBS_MAX_ACTIVE,
+            "jobs": [job_view(job) for job in JOBS.values()]}
+
+def get_job_or_404(job_id: str) -> Dict[str, Any]:
+    job = JOBS.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found (unknown id or expired)")
+    return job
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    return job_view(get_job_or_404(job_id))
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    """Записи готового задания в NDJSON — как ответ /upload (409, пока задание не готово)."""
+    job = get_job_or_404(job_id)
+    if job["status"] != "done":
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    return FileResponse(job["result_path"], media_type="application/x-ndjson",
+                        filename=os.path.splitext(job["filename"])[0] + ".ndjson")
+
+@app.post("/runs", status_code=201)
+async def create_run(file: UploadFile = File(...)):
+    """Разбирает загрузку и сохраняет записи в хранилище; дальше — GET /runs/{id}/logs и /runs/{id}/gantt."""
+    if not file.filename.endswith(UPLOAD_SUFFIXES):
+        raise HTTPException(status_code=400, detail="Only .json files allowed (optionally .json.gz / .json.zst)")
+    store = log_store()
+    run_id = await asyncio.to_thread(store.create_run, file.filename)
+    try:
+        records, digest = await ingest_run(file, run_id)  # digest — тот же ключ, что у кэша результатов /upload
+    except BaseException as e:
+        await asyncio.to_thread(store.delete_run, run_id)
+        if isinstance(e, Exception):
+            raise HTTPException(status_code=400, detail=f"Parse error: {str(e)}")
+        raise
+    await asyncio.to_thread(store.finish_run, run_id, records, digest)
+    if METRICS is not None:
+        METRICS.inc("runs_stored_total")
+    run = await asyncio.to_thread(get_run_or_404, run_id, True)
+    return JSONResponse(run, status_code=201, headers={"Location": f"/runs/{run_id}"})
+
+@app.get("/runs")
+async def list_runs():
+    return {"runs": await asyncio.to_thread(log_store().list_runs)}
+
+@app.get("/runs/{run_id}")
+async def get_run(run_id: int):
+    """Прогон со сводкой: записи по уровням и секциям, число ошибок разбора."""
+    return await asyncio.to_thread(get_run_or_404, run_id, True)
+
+@app.delete("/runs/{run_id}", status_code=204)
+async def delete_run(run_id: int):
+    if not await asyncio.to_thread(log_store().delete_run, run_id):
+        raise HTTPException(status_code=404, detail="Run not found")
+    return Response(status_code=204)
+
+@app.get("/runs/{run_id}/logs")
+async def get_run_logs(run_id: int, level: Optional[str] = None, section: Optional[str] = None,
+                       tf_req_id: Optional[str] = None, resource_type: Optional[str] = None,
+                       q: Optional[str] = None, since: Optional[str] = None, until: Optional[str] = None,
+                       cursor: Optional[int] = None, limit: int = STORE_PAGE_SIZE):
+    """
+    Страница записей прогона с фильтрами (точное совпадение полей, q — полнотекстовый запрос FTS5
+    по сообщению, since / until — ISO 8601). Следующая страница — тот же запрос с cursor=next_cursor;
+    next_cursor = null — страниц больше нет.
+    """
+    if not 1 <= limit <= STORE_MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be in 1..{STORE_MAX_PAGE_SIZE}")
+    since_ns, until_ns = parse_ts_param("since", since), parse_ts_param("until", until)
+    store = log_store()
+    await asyncio.to_thread(get_run_or_404, run_id)
+    filters = {"level": level, "section": section, "tf_req_id": tf_req_id, "tf_resource_type": resource_type}
+    try:
+        records, next_cursor = await asyncio.to_thread(
+            store.query, run_id, filters, q, since_ns, until_ns, -1 if cursor is None else cursor, limit)
+    except sqlite3.OperationalError as e:  # синтаксис запроса FTS5
+        raise HTTPException(status_code=400, detail=f"Bad query: {e}")
+    # Записи уже лежат JSON-строками — собираем ответ из них, не разбирая
+    body = '{"run_id":%d,"logs":[%s],"next_cursor":%s}' % (
+        run_id, ",".join(records), "null" if next_cursor is None else next_cursor)
+    return Response(body.encode("utf-8"), media_type="application/json")
+
+@app.get("/runs/{run_id}/gantt")
+async def get_run_gantt(run_id: int):
+    """Диаграмма Ганта прогона по хранилищу — клиенту не нужно присылать логи обратно."""
+    store = log_store()
+    await asyncio.to_thread(get_run_or_404, run_id)
+    gantt = await asyncio.to_thread(lambda: build_gantt_data(store.request_rows(run_id)))
+    return {"run_id": run_id, "gantt": gantt}
 
 @app.post("/api/export")
 async def export_logs(data: ExportRequest):
@@ -153,10 +1188,14 @@ async def export_logs(data: ExportRequest):
     }
 
 @app.get("/api/gantt")
-async def get_gantt_data(logs: List[Dict] = None):
-    # В реальном проекте — хранение состояния. Здесь — заглушка.
-    # Для демо: передавайте логи через POST или храните в памяти.
-    raise HTTPException(status_code=405, detail="Use POST /api/gantt with logs")
+async def get_gantt_data(sha256: Optional[str] = None):
+    # Диаграмма для файла, уже загруженного через /upload (sha256 — заголовок X-Content-SHA256 ответа)
+    if sha256 is None:
+        raise HTTPException(status_code=405, detail="Use POST /api/gantt with logs or GET /api/gantt?sha256=...")
+    blob = await asyncio.to_thread(RESULT_CACHE.get, gantt_cache_key(sha256)) if RESULT_CACHE is not None else None
+    if blob is None:
+        raise HTTPException(status_code=404, detail="No cached result for this upload, upload it again")
+    return Response(blob, media_type="application/json")
 
 @app.post("/api/gantt")
 async def post_gantt_data(data: ExportRequest):
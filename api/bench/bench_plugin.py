@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+bench_plugin.py
+Бенчмарк конвейера gRPC-плагинов против локальных плагинов-заглушек с разной задержкой
+на пачку: последовательные унарные вызовы (как раньше) против цепочки стадий и параллельной
+стадии (fan-out), потоком и унарно. Заодно проверяет, что результаты совпадают с эталоном.
+
+Запуск (из папки api/):  python bench/bench_plugin.py [../logs/tf.json] [--copies 3] [--delays 50,100,200]
+Если plugin_pb2 ещё не сгенерирован, он генерируется из plugin.proto во временную папку.
+"""
+
+import argparse
+import asyncio
+import copy
+import multiprocessing
+import re
+import sys
+import tempfile
+import time
+from concurrent import futures
+from pathlib import Path
+
+API_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(API_DIR))
+
+try:
+    import plugin_pb2  # noqa: F401
+except ImportError:
+    from grpc_tools import protoc
+    gen_dir = tempfile.mkdtemp(prefix='plugin_pb2_')
+    protoc.main(['protoc', f'-I{API_DIR}', f'--python_out={gen_dir}', f'--grpc_python_out={gen_dir}',
+                 str(API_DIR / 'plugin.proto')])
+    sys.path.insert(0, gen_dir)
+
+import grpc  # noqa: E402
+import plugin_pb2  # noqa: E402
+import plugin_pb2_grpc  # noqa: E402
+
+import api  # noqa: E402
+
+
+# ---------- Плагины-заглушки ----------
+# Правки независимы друг от друга, поэтому цепочка и fan-out дают одинаковый результат.
+def mark_errors(e):
+    if 'error' in e.message.lower():
+        e.level = 'error'
+    return e
+
+def drop_some(e):
+    return None if e.tf_req_id.endswith('0') else e
+
+def redact_digits(e):
+    e.message = re.sub(r'\d', '#', e.message)
+    return e
+
+STAND_INS = {'errors': mark_errors, 'filter': drop_some, 'redact': redact_digits}
+
+class StandInPlugin(plugin_pb2_grpc.LogProcessorServicer):
+    def __init__(self, fn, delay, streaming=True):
+        self.fn, self.delay, self.streaming = fn, delay, streaming
+
+    def _process(self, batch):
+        time.sleep(self.delay)  # «работа» плагина над пачкой
+        out = plugin_pb2.LogBatch()
+        for e in batch.entries:
+            e = self.fn(e)
+            if e is not None:
+                out.entries.append(e)
+        return out
+
+    def Process(self, request, context):
+        return self._process(request)
+
+    def ProcessStream(self, request_iterator, context):
+        if not self.streaming:
+            context.abort(grpc.StatusCode.UNIMPLEMENTED, 'unary only')
+        for batch in request_iterator:
+            yield self._process(batch)
+
+def start_server(addr, servicer):
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=8), options=api.PLUGIN_CHANNEL_OPTIONS)
+    plugin_pb2_grpc.add_LogProcessorServicer_to_server(servicer, server)
+    server.add_insecure_port(addr)
+    server.start()
+    return server
+
+def serve_stand_ins(addrs, delays, ready):
+    """Отдельный процесс с заглушками: плагины не делят GIL с клиентом."""
+    servers = []
+    for (name, fn), delay in zip(STAND_INS.items(), delays):
+        servers.append(start_server(addrs[name], StandInPlugin(fn, delay)))
+        servers.append(start_server(addrs[name + '-unary'], StandInPlugin(fn, delay, streaming=False)))
+    ready.set()
+    servers[0].wait_for_termination()
+
+
+# ---------- Эталоны ----------
+def reference(logs, names):
+    """Ожидаемый результат, посчитанный без gRPC."""
+    out = []
+    for log in copy.deepcopy(logs):
+        entry = api.to_log_batch([log]).entries[0]
+        annotations = {}
+        for name in names:
+            before = plugin_pb2.LogEntry()
+            before.CopyFrom(entry)
+            result = STAND_INS[name](entry)
+            if result is None:
+                break
+            changes = api.entry_changes(log, result)
+            if changes:
+                annotations[name] = {k: v for k, v in changes.items()
+                                     if api.entry_changes(log, before).get(k) != v}
+        else:
+            log.update({k: v for changes in annotations.values() for k, v in changes.items()})
+            if annotations:
+                log['annotations'] = annotations
+            out.append(log)
+    return out
+
+def ref_sequential(logs, stubs):
+    """Как было: по пачке, плагины по очереди, каждый вызов синхронный."""
+    count = 0
+    for start in range(0, len(logs), api.PLUGIN_BATCH_SIZE):
+        batch = api.to_log_batch(logs[start:start + api.PLUGIN_BATCH_SIZE])
+        for stub in stubs:
+            batch = stub.Process(batch)
+        count += len(batch.entries)
+    return count
+
+
+async def chunks(logs, size):
+    """Пачки, как их отдаёт parse_upload_batches (по куску загрузки)."""
+    for start in range(0, len(logs), size):
+        yield logs[start:start + size]
+
+async def run(logs, pipeline, upload_batch, repeat):
+    # Все прогоны в одном event loop: aio-каналы пула к нему привязаны
+    best, first, out = float('inf'), None, None
+    for _ in range(repeat):
+        out, t_first = [], None
+        t0 = time.perf_counter()
+        async for batch in api.run_pipeline(chunks(copy.deepcopy(logs), upload_batch), pipeline):
+            if t_first is None:
+                t_first = time.perf_counter() - t0
+            out.extend(batch)
+        elapsed = time.perf_counter() - t0
+        if elapsed < best:
+            best, first = elapsed, t_first
+    await asyncio.gather(*(c for stage in pipeline for plugin in stage for c in plugin.channels.close()))
+    return best, first, out
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[1])
+    parser.add_argument('input', nargs='?', default=str(API_DIR.parent / 'logs' / 'tf.json'))
+    parser.add_argument('--copies', type=int, default=3, help="сколько раз повторить лог")
+    parser.add_argument('--upload-batch', type=int, default=200,
+                        help="записей в куске загрузки (как из iter_upload_lines)")
+    parser.add_argument('--delays', default='50,100,200',
+                        help="задержка плагинов errors,filter,redact на пачку, мс")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--port', type=int, default=50151)
+    args = parser.parse_args()
+
+    delays = [float(d) / 1000 for d in args.delays.split(',')]
+    addrs = {}
+    for i, name in enumerate(STAND_INS):
+        addrs[name] = f'localhost:{args.port + i}'
+        addrs[name + '-unary'] = f'localhost:{args.port + 10 + i}'
+    ready = multiprocessing.Event()
+    server_proc = multiprocessing.Process(target=serve_stand_ins, args=(addrs, delays, ready), daemon=True)
+    server_proc.start()
+    ready.wait()
+
+    content = Path(args.input).read_text(encoding='utf-8')
+    logs = api.parse_log_content("\n".join([content] * args.copies))
+    for log in logs:
+        log.pop('ts_ns', None)
+    names = list(STAND_INS)
+    expected = reference(logs, names)
+    print(f"Input: {args.input} x{args.copies} = {len(logs)} записей; LogBatch по {api.PLUGIN_BATCH_SIZE}, "
+          f"задержка плагинов {args.delays} мс на пачку")
+
+    channels = [grpc.insecure_channel(addrs[name], options=api.PLUGIN_CHANNEL_OPTIONS) for name in names]
+    stubs = [plugin_pb2_grpc.LogProcessorStub(ch) for ch in channels]
+    t_seq = float('inf')
+    for _ in range(args.repeat):
+        t0 = time.perf_counter()
+        ref_sequential(logs, stubs)
+        t_seq = min(t_seq, time.perf_counter() - t0)
+    print(f"  {'последовательно, унарно':34s} {t_seq * 1e3:9.1f} ms")
+
+    def plugins(suffix='', **kw):
+        return [api.Plugin(name, addrs[name + suffix], **kw) for name in names]
+
+    slowest = names[delays.index(max(delays))]
+    scenarios = {
+        f'один плагин ({slowest})': ([[api.Plugin(slowest, addrs[slowest])]], None),
+        'цепочка из 3 стадий, поток': ([[p] for p in plugins()], expected),
+        'fan-out 3 плагина, поток': ([plugins()], expected),
+        'fan-out 3 плагина, унарно': ([plugins('-unary')], expected),
+    }
+    for name, (pipeline, want) in scenarios.items():
+        t, first, out = asyncio.run(run(logs, pipeline, args.upload_batch, args.repeat))
+        if want is not None and out != want:
+            print(f"[!] {name}: результат расходится с эталоном")
+            sys.exit(1)
+        print(f"  {name:34s} {t * 1e3:9.1f} ms, первая пачка через {first * 1e3:7.1f} ms")
+    print("Результаты совпадают с эталоном.")
+
+    for ch in channels:
+        ch.close()
+    server_proc.terminate()
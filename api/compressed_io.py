@@ -0,0 +1,165 @@
+"""
+compressed_io.py
+Прозрачное чтение и запись сжатых логов (gzip / zstd).
+
+- detect_codec(head) — формат по магическим байтам начала файла (расширение не важно):
+  'gzip', 'zstd' или None;
+- open_input(path) — текстовый поток строк файла; сжатый файл распаковывается потоково,
+  распакованная копия на диск не пишется; open_input_bytes(path) — то же без декодирования;
+- open_output(path, codec) — текстовый поток записи со сжатием на лету;
+  codec=None — по расширению path (.gz / .zst), без него — без сжатия;
+- compress_block(data, codec) — блок, который можно дописать к сжатому файлу того же кодека;
+- Decompressor — инкрементальная распаковка кусков (загрузка в API приходит кусками);
+- decompress_bytes(data) — то же для данных, которые уже целиком в памяти.
+
+gzip — из стандартной библиотеки, zstd — пакет zstandard (необязательная зависимость:
+без него .zst даёт понятную ошибку, всё остальное работает). Файлы из нескольких
+gzip-членов / zstd-фреймов (склеенные cat'ом, pigz, pzstd) читаются целиком.
+"""
+
+import gzip
+import io
+import zlib
+from pathlib import Path
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+CODECS = ('gzip', 'zstd')
+CODEC_SUFFIXES = {'.gz': 'gzip', '.zst': 'zstd'}
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+
+def detect_codec(head):
+    """'gzip' / 'zstd' по первым байтам файла, None — не сжат."""
+    if head.startswith(GZIP_MAGIC):
+        return 'gzip'
+    if head.startswith(ZSTD_MAGIC):
+        return 'zstd'
+    return None
+
+
+def file_codec(path):
+    with open(path, 'rb') as f:
+        return detect_codec(f.read(len(ZSTD_MAGIC)))
+
+
+def codec_for_path(path):
+    """Кодек по расширению выходного файла: x.jsonl.gz -> 'gzip', x.jsonl -> None."""
+    return CODEC_SUFFIXES.get(Path(path).suffix.lower())
+
+
+def _zstd():
+    if zstandard is None:
+        raise RuntimeError("для zstd нужен пакет zstandard: pip install zstandard")
+    return zstandard
+
+
+def open_input_bytes(path):
+    """Бинарный поток распакованных данных (несжатый файл открывается как есть)."""
+    codec = file_codec(path)
+    if codec is None:
+        return open(path, 'rb')
+    if codec == 'gzip':
+        return gzip.open(path, 'rb')
+    reader = _zstd().ZstdDecompressor().stream_reader(open(path, 'rb'), read_across_frames=True, closefd=True)
+    return io.BufferedReader(reader)
+
+
+def open_input(path, encoding='utf-8', errors='strict'):
+    """Текстовый поток (универсальные переводы строк, как у open()) — сжатый или нет."""
+    codec = file_codec(path)
+    if codec is None:
+        return open(path, 'r', encoding=encoding, errors=errors)
+    if codec == 'gzip':
+        return gzip.open(path, 'rt', encoding=encoding, errors=errors)
+    reader = _zstd().ZstdDecompressor().stream_reader(open(path, 'rb'), read_across_frames=True, closefd=True)
+    return io.TextIOWrapper(io.BufferedReader(reader), encoding=encoding, errors=errors)
+
+
+def open_output(path, codec=None):
+    """Текстовый поток записи UTF-8 с '\\n'; codec — 'gzip' / 'zstd' / None (по расширению)."""
+    codec = codec or codec_for_path(path)
+    if codec is None:
+        return open(path, 'w', encoding='utf-8', newline='\n')
+    if codec == 'gzip':
+        return gzip.open(path, 'wt', encoding='utf-8', newline='\n', compresslevel=GZIP_LEVEL)
+    if codec == 'zstd':
+        writer = _zstd().ZstdCompressor(level=ZSTD_LEVEL).stream_writer(open(path, 'wb'), closefd=True)
+        return io.TextIOWrapper(writer, encoding='utf-8', newline='\n')
+    raise ValueError(f"неизвестный кодек: {codec!r} (есть: {', '.join(CODECS)})")
+
+
+def compress_block(data, codec):
+    """data одним gzip-членом / zstd-фреймом (codec=None — как есть); такие блоки можно склеивать."""
+    if codec is None:
+        return data
+    if codec == 'gzip':
+        return gzip.compress(data, compresslevel=GZIP_LEVEL)
+    if codec == 'zstd':
+        return _zstd().ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    raise ValueError(f"неизвестный кодек: {codec!r} (есть: {', '.join(CODECS)})")
+
+
+class Decompressor:
+    """
+    Инкрементальная распаковка: decompress(chunk) -> распакованные байты, в конце flush().
+    Кодек определяется по первым байтам потока; несжатые данные проходят как есть.
+    """
+
+    def __init__(self):
+        self.codec = None
+        self._head = b''      # начало потока, пока не набралось байт на магию
+        self._started = False
+        self._obj = None
+
+    def _new_obj(self):
+        if self.codec == 'gzip':
+            return zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+        return _zstd().ZstdDecompressor().decompressobj()
+
+    def decompress(self, chunk):
+        if not self._started:
+            self._head += chunk
+            if len(self._head) < len(ZSTD_MAGIC):
+                return b''
+            chunk, self._head = self._head, b''
+            self._started = True
+            self.codec = detect_codec(chunk)
+            if self.codec is not None:
+                self._obj = self._new_obj()
+        if self._obj is None:
+            return chunk
+        if self._obj.eof:  # прошлый кусок закончился ровно на границе члена / фрейма
+            self._obj = self._new_obj()
+        out = [self._obj.decompress(chunk)]
+        # Следующий gzip-член / zstd-фрейм начинается сразу за концом предыдущего
+        while self._obj.eof and self._obj.unused_data:
+            rest = self._obj.unused_data
+            self._obj = self._new_obj()
+            out.append(self._obj.decompress(rest))
+        return b''.join(out)
+
+    def flush(self):
+        """Остаток потока; ValueError, если сжатые данные оборваны."""
+        if not self._started:
+            self._started = True
+            return self._head  # поток короче магии — точно не сжат
+        if self._obj is None:
+            return b''
+        if not self._obj.eof:
+            raise ValueError(f"сжатые данные ({self.codec}) оборваны")
+        return b''
+
+
+def decompress_bytes(data):
+    """Распакованные data (несжатые возвращаются как есть)."""
+    if detect_codec(data) is None:
+        return data
+    d = Decompressor()
+    return d.decompress(data) + d.flush()
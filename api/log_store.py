@@ -0,0 +1,269 @@
+"""
+log_store.py
+Хранилище разобранных прогонов в SQLite: записи лога с индексами по полям фильтров
+и полнотекстовым индексом FTS5 по сообщениям.
+
+Клиенту не нужно держать у себя весь лог и пересылать его обратно: страницы записей,
+сводка и диаграмма Ганта считаются на сервере (GET /runs/... в api.py), и объём ответа
+зависит от размера страницы, а не от размера лога.
+
+Пагинация по ключу (keyset): курсор — порядковый номер (seq) последней отданной записи,
+следующая страница — seq > курсор по индексу (run_id, <поле фильтра>, seq). OFFSET не нужен,
+поэтому сотая страница стоит столько же, сколько первая.
+
+Запись хранится целиком JSON-строкой (колонка record) и отдаётся без повторной сериализации;
+поля фильтров продублированы отдельными колонками. Если SQLite собран без FTS5, поиск
+по тексту идёт через LIKE (полным просмотром записей прогона).
+
+Соединение своё в каждом потоке (методы зовут из asyncio.to_thread). Запись идёт под общей
+блокировкой (у SQLite один писатель), чтение в режиме WAL ей не мешает.
+
+Базу могут делить несколько процессов API (uvicorn --workers). Прогон в приёме помечен
+владельцем (хост:pid) и временем последней пачки (heartbeat); при старте удаляются только
+брошенные прогоны — владелец на этом хосте умер или пачек не было дольше stale_after секунд
+(проверяется при старте и при создании каждого прогона).
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+FILTER_COLUMNS = ('level', 'section', 'tf_req_id', 'tf_resource_type')
+STALE_AFTER = 600.0  # сек без новых пачек, после которых приём прогона считается оборванным
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    sha256 TEXT,
+    status TEXT NOT NULL,               -- ingesting -> done
+    created REAL NOT NULL,
+    finished REAL,
+    records INTEGER NOT NULL DEFAULT 0,
+    owner TEXT,                         -- хост:pid процесса, который принимает прогон
+    heartbeat REAL                      -- время последней принятой пачки
+);
+CREATE TABLE IF NOT EXISTS logs (
+    id INTEGER PRIMARY KEY,             -- rowid, на него ссылается logs_fts
+    run_id INTEGER NOT NULL,
+    seq INTEGER NOT NULL,               -- порядок записи в прогоне, ключ пагинации
+    ts_ns INTEGER,
+    timestamp TEXT,
+    level TEXT,
+    section TEXT,
+    tf_req_id TEXT,
+    tf_resource_type TEXT,
+    is_parsed INTEGER NOT NULL,
+    message TEXT NOT NULL,
+    record TEXT NOT NULL                -- запись целиком, JSON
+);
+CREATE UNIQUE INDEX IF NOT EXISTS logs_run_seq ON logs (run_id, seq);
+CREATE INDEX IF NOT EXISTS logs_run_level ON logs (run_id, level, seq);
+CREATE INDEX IF NOT EXISTS logs_run_section ON logs (run_id, section, seq);
+CREATE INDEX IF NOT EXISTS logs_run_req ON logs (run_id, tf_req_id, seq);
+CREATE INDEX IF NOT EXISTS logs_run_resource ON logs (run_id, tf_resource_type, seq);
+CREATE INDEX IF NOT EXISTS logs_run_ts ON logs (run_id, ts_ns);
+"""
+# Внешнее содержимое: текст не дублируется, FTS хранит только индекс по logs.message
+FTS_SCHEMA = "CREATE VIRTUAL TABLE IF NOT EXISTS logs_fts USING fts5(message, content='logs', content_rowid='id')"
+
+INSERT_LOG = """
+INSERT INTO logs (run_id, seq, ts_ns, timestamp, level, section, tf_req_id, tf_resource_type,
+                  is_parsed, message, record)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def _text(value):
+    """Значение поля для колонки: строки как есть, прочее (число, объект из JSON) — JSON-строкой."""
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _owner():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def _owner_gone(owner):
+    """Процесс-владелец точно не работает: он с этого хоста, и pid не существует."""
+    host, _, pid = (owner or '').rpartition(':')
+    if host != socket.gethostname() or not pid.isdigit():
+        return False  # чужой хост — судим только по heartbeat
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except OSError:  # есть, но чужой (EPERM)
+        return False
+    return False
+
+
+class LogStore:
+    def __init__(self, path, stale_after=STALE_AFTER):
+        self.path = path
+        self.stale_after = stale_after
+        self.owner = _owner()
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        conn = self._conn()
+        with self._write_lock:
+            conn.executescript(SCHEMA)
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(runs)')}
+            for column, sql_type in (('owner', 'TEXT'), ('heartbeat', 'REAL')):  # база старой версии
+                if column not in columns:
+                    conn.execute(f'ALTER TABLE runs ADD COLUMN {column} {sql_type}')
+            try:
+                conn.execute(FTS_SCHEMA)
+                self.fts = True
+            except sqlite3.OperationalError:  # SQLite без FTS5
+                self.fts = False
+            conn.commit()
+        # Свой хост:pid у прогона при старте — это прежний процесс с тем же pid (pid 1 в контейнере)
+        self._delete_stale(mine_are_stale=True)
+
+    def stale_runs(self, mine_are_stale=False):
+        """Прогоны, приём которых оборвался: владелец умер или давно не было пачек."""
+        deadline = time.time() - self.stale_after
+        rows = self._conn().execute("SELECT id, owner, coalesce(heartbeat, created) FROM runs "
+                                    "WHERE status = 'ingesting'").fetchall()
+        return [run_id for run_id, owner, heartbeat in rows
+                if heartbeat < deadline or (owner == self.owner and mine_are_stale)
+                or (owner != self.owner and _owner_gone(owner))]
+
+    def _delete_stale(self, mine_are_stale=False):
+        for run_id in self.stale_runs(mine_are_stale):
+            self.delete_run(run_id)
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = NORMAL')  # в WAL: после сбоя питания теряется хвост, не целостность
+            self._local.conn = conn
+        return conn
+
+    # --- запись ---
+    def create_run(self, name, sha256=None):
+        self._delete_stale()
+        conn = self._conn()
+        with self._write_lock:
+            now = time.time()
+            run_id = conn.execute("INSERT INTO runs (name, sha256, status, created, owner, heartbeat) "
+                                  "VALUES (?, ?, 'ingesting', ?, ?, ?)",
+                                  (name, sha256, now, self.owner, now)).lastrowid
+            conn.commit()
+        return run_id
+
+    def add_logs(self, run_id, seq, logs):
+        """Пачка записей (как в ответе /upload, с ts_ns) с номерами seq, seq+1, ...; вернёт следующий seq."""
+        rows = [(run_id, seq + i, log.get('ts_ns'), _text(log.get('timestamp')), _text(log.get('level')),
+                 _text(log.get('section')), _text(log.get('tf_req_id')), _text(log.get('tf_resource_type')),
+                 bool(log.get('isParsed', True)), _text(log.get('message')) or '',
+                 json.dumps(log, ensure_ascii=False))
+                for i, log in enumerate(logs)]
+        conn = self._conn()
+        with self._write_lock:
+            conn.executemany(INSERT_LOG, rows)
+            if self.fts:
+                conn.execute('INSERT INTO logs_fts (rowid, message) '
+                             'SELECT id, message FROM logs WHERE run_id = ? AND seq >= ?', (run_id, seq))
+            conn.execute('UPDATE runs SET heartbeat = ? WHERE id = ?', (time.time(), run_id))
+            conn.commit()
+        return seq + len(rows)
+
+    def finish_run(self, run_id, records, sha256=None):
+        """sha256 — хэш загрузки: он известен только после разбора (считается по ходу чтения)."""
+        conn = self._conn()
+        with self._write_lock:
+            conn.execute("UPDATE runs SET status = 'done', finished = ?, records = ?, "
+                         "sha256 = coalesce(?, sha256) WHERE id = ?", (time.time(), records, sha256, run_id))
+            conn.commit()
+
+    def delete_run(self, run_id):
+        """False — прогона нет."""
+        conn = self._conn()
+        with self._write_lock:
+            if self.fts:  # из индекса с внешним содержимым удаляют, передав прежний текст
+                conn.execute("INSERT INTO logs_fts (logs_fts, rowid, message) "
+                             "SELECT 'delete', id, message FROM logs WHERE run_id = ?", (run_id,))
+            conn.execute('DELETE FROM logs WHERE run_id = ?', (run_id,))
+            deleted = conn.execute('DELETE FROM runs WHERE id = ?', (run_id,)).rowcount
+            conn.commit()
+        return bool(deleted)
+
+    # --- чтение ---
+    def _run_row(self, row):
+        run_id, name, sha256, status, created, finished, records = row
+        return {'id': run_id, 'name': name, 'sha256': sha256, 'status': status,
+                'created': created, 'finished': finished, 'records': records}
+
+    def list_runs(self):
+        rows = self._conn().execute('SELECT id, name, sha256, status, created, finished, records '
+                                    'FROM runs ORDER BY id').fetchall()
+        return [self._run_row(row) for row in rows]
+
+    def get_run(self, run_id, counts=False):
+        """Прогон или None; counts=True — ещё число записей по уровням и секциям и ошибки разбора."""
+        conn = self._conn()
+        row = conn.execute('SELECT id, name, sha256, status, created, finished, records '
+                           'FROM runs WHERE id = ?', (run_id,)).fetchone()
+        if row is None:
+            return None
+        run = self._run_row(row)
+        if counts:
+            # Группировка идёт по индексам (run_id, level, ...) / (run_id, section, ...) без чтения записей
+            run['level_counts'] = dict(conn.execute(
+                'SELECT level, count(*) FROM logs WHERE run_id = ? GROUP BY level', (run_id,)).fetchall())
+            run['section_counts'] = dict(conn.execute(
+                'SELECT section, count(*) FROM logs WHERE run_id = ? AND section IS NOT NULL GROUP BY section',
+                (run_id,)).fetchall())
+            run['parse_errors'] = conn.execute(
+                'SELECT count(*) FROM logs WHERE run_id = ? AND is_parsed = 0', (run_id,)).fetchone()[0]
+        return run
+
+    def query(self, run_id, filters=None, q=None, since_ns=None, until_ns=None, cursor=-1, limit=500):
+        """
+        Страница записей прогона: ([JSON-строки записей], курсор следующей страницы или None).
+        filters — {колонка из FILTER_COLUMNS: значение}; q — запрос FTS5 по сообщению
+        (без FTS5 — подстрока); since_ns / until_ns — границы ts_ns включительно.
+        Синтаксическая ошибка в q — sqlite3.OperationalError.
+        """
+        where = ['run_id = ?', 'seq > ?']
+        params = [run_id, cursor]
+        for column, value in (filters or {}).items():
+            if column not in FILTER_COLUMNS:
+                raise ValueError(f'unknown filter: {column}')
+            if value is not None:
+                where.append(f'{column} = ?')
+                params.append(value)
+        if since_ns is not None:
+            where.append('ts_ns >= ?')
+            params.append(since_ns)
+        if until_ns is not None:
+            where.append('ts_ns <= ?')
+            params.append(until_ns)
+        if q:
+            if self.fts:
+                where.append('id IN (SELECT rowid FROM logs_fts WHERE logs_fts MATCH ?)')
+                params.append(q)
+            else:
+                where.append("message LIKE ? ESCAPE '\\'")
+                params.append('%' + q.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+        params.append(limit + 1)  # лишняя запись — признак, что есть следующая страница
+        rows = self._conn().execute(f"SELECT seq, record FROM logs WHERE {' AND '.join(where)} "
+                                    f"ORDER BY seq LIMIT ?", params).fetchall()
+        next_cursor = rows[limit - 1][0] if len(rows) > limit else None
+        return [record for _, record in rows[:limit]], next_cursor
+
+    def request_rows(self, run_id):
+        """Записи с tf_req_id (поля диаграммы Ганта) в порядке прогона."""
+        rows = self._conn().execute(
+            "SELECT tf_req_id, tf_resource_type, timestamp, ts_ns FROM logs "
+            "WHERE run_id = ? AND tf_req_id IS NOT NULL AND tf_req_id != '' ORDER BY seq", (run_id,)).fetchall()
+        return [{'tf_req_id': req_id, 'tf_resource_type': resource, 'timestamp': timestamp, 'ts_ns': ts_ns}
+                for req_id, resource, timestamp, ts_ns in rows]
@@ -0,0 +1,249 @@
+"""
+metrics.py
+Инструментирование разбора логов: таймеры стадий, счётчики, гистограммы и сэмплирующий
+профилировщик.
+
+- Metrics — накопитель: секунды по стадиям (json_loads, guess_timestamp, serialize …),
+  счётчики (строки, байты, ошибки разбора) и гистограммы (размер загрузки, задержка
+  разбора, время ответа плагина). Выводится таблицей (report) или в текстовом формате
+  Prometheus (render_prometheus).
+- StageTimer — «секундомер с кругами» для горячего цикла: lap(stage) добавляет к стадии
+  время с предыдущей отметки, один perf_counter() на стадию.
+- SamplingProfiler — фоновый поток раз в interval снимает стек целевого потока; результат —
+  свёрнутые стеки (формат flamegraph.pl / speedscope) и топ функций по собственному времени.
+
+Выключенное инструментирование — это metrics=None: код разбора проверяет `if timer:`
+и не вызывает ничего, поэтому накладные расходы — одна проверка на стадию.
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+
+# Границы гистограмм по умолчанию (секунды)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# Размеры (байты): 1 КБ … 1 ГБ
+SIZE_BUCKETS = tuple(1 << p for p in range(10, 31, 2))
+
+
+class StageTimer:
+    __slots__ = ('stages', 't')
+
+    def __init__(self, stages):
+        self.stages = stages  # stage -> секунды (defaultdict(float) из Metrics)
+        self.t = time.perf_counter()
+
+    def start(self):
+        self.t = time.perf_counter()
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        self.stages[stage] += now - self.t
+        self.t = now
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # последняя ячейка — +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        i = 0
+        for bound in self.buckets:
+            if value <= bound:
+                break
+            i += 1
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _labels_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+class Metrics:
+    def __init__(self):
+        self.stages = defaultdict(float)
+        self.counters = defaultdict(int)   # (name, labels) -> значение
+        self.histograms = {}               # (name, labels) -> Histogram
+        self.help = {}                     # name -> описание для # HELP
+        self._lock = threading.Lock()
+
+    def timer(self):
+        return StageTimer(self.stages)
+
+    def describe(self, name, text):
+        self.help[name] = text
+
+    def inc(self, name, n=1, **labels):
+        self.counters[(name, _labels_key(labels))] += n
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = (name, _labels_key(labels))
+        with self._lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = Histogram(buckets)
+            hist.observe(value)
+
+    def snapshot(self):
+        """Состояние в простых типах: для передачи из воркера пула процессов (pickle)."""
+        with self._lock:
+            histograms = {key: (h.buckets, list(h.counts), h.sum, h.count)
+                          for key, h in self.histograms.items()}
+        return {
+            'stages': dict(self.stages),
+            'counters': dict(self.counters),
+            'histograms': histograms,
+        }
+
+    def merge(self, snapshot):
+        for stage, seconds in snapshot['stages'].items():
+            self.stages[stage] += seconds
+        for key, value in snapshot['counters'].items():
+            self.counters[key] += value
+        with self._lock:
+            for key, (buckets, counts, total, count) in snapshot['histograms'].items():
+                hist = self.histograms.get(key)
+                if hist is None:
+                    hist = self.histograms[key] = Histogram(buckets)
+                hist.counts = [a + b for a, b in zip(hist.counts, counts)]
+                hist.sum += total
+                hist.count += count
+
+    def counter(self, name, **labels):
+        return self.counters.get((name, _labels_key(labels)), 0)
+
+    def report(self):
+        """Таблица стадий (секунды и доля) и счётчики — для вывода в консоль."""
+        lines = []
+        total = sum(self.stages.values())
+        if total:
+            lines.append(f"{'stage':20s} {'seconds':>10s} {'share':>7s}")
+            for stage, seconds in sorted(self.stages.items(), key=lambda kv: -kv[1]):
+                lines.append(f"{stage:20s} {seconds:10.3f} {seconds / total:7.1%}")
+        for (name, labels), value in sorted(self.counters.items()):
+            label_text = ','.join(f'{k}={v}' for k, v in labels)
+            lines.append(f"{name}{'{' + label_text + '}' if labels else ''}: {value}")
+        return '\n'.join(lines)
+
+    def render_prometheus(self, namespace='tflog'):
+        """Текстовый формат экспозиции Prometheus (text/plain; version=0.0.4)."""
+        out = []
+
+        def header(name, kind):
+            if name in self.help:
+                out.append(f'# HELP {name} {self.help[name]}')
+            out.append(f'# TYPE {name} {kind}')
+
+        if self.stages:
+            name = f'{namespace}_stage_seconds_total'
+            self.help.setdefault(name, 'Cumulative time spent in each parsing stage.')
+            header(name, 'counter')
+            for stage, seconds in sorted(self.stages.items()):
+                out.append(f'{name}{{stage="{stage}"}} {seconds:.6f}')
+
+        by_name = defaultdict(list)
+        for (name, labels), value in self.counters.items():
+            by_name[name].append((labels, value))
+        for short, series in sorted(by_name.items()):
+            name = f'{namespace}_{short}'
+            header(name, 'counter')
+            for labels, value in sorted(series):
+                out.append(f'{name}{_render_labels(labels)} {value}')
+
+        with self._lock:
+            hists = sorted(self.histograms.items())
+        by_name = defaultdict(list)
+        for (name, labels), hist in hists:
+            by_name[name].append((labels, hist))
+        for short, series in by_name.items():
+            name = f'{namespace}_{short}'
+            header(name, 'histogram')
+            for labels, hist in series:
+                cumulative = 0
+                for bound, count in zip(hist.buckets + ('+Inf',), hist.counts):
+                    cumulative += count
+                    le = bound if bound == '+Inf' else repr(float(bound))
+                    out.append(f'{name}_bucket{_render_labels(labels + (("le", le),))} {cumulative}')
+                out.append(f'{name}_sum{_render_labels(labels)} {hist.sum:.6f}')
+                out.append(f'{name}_count{_render_labels(labels)} {hist.count}')
+        return '\n'.join(out) + '\n'
+
+
+def _render_labels(labels):
+    if not labels:
+        return ''
+    parts = []
+    for k, v in labels:
+        v = str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{k}="{v}"')
+    return '{' + ','.join(parts) + '}'
+
+
+class SamplingProfiler:
+    """
+    Сэмплирующий профилировщик одного потока (по умолчанию — того, что его создал).
+    Стек снимается через sys._current_frames(), в сам профилируемый код ничего не встраивается;
+    цена — фоновый поток, который раз в interval ненадолго берёт GIL.
+    """
+
+    def __init__(self, interval=0.005, thread_id=None):
+        self.interval = interval
+        self.thread_id = thread_id or threading.get_ident()
+        self.stacks = Counter()  # 'f1;f2;f3' (от корня к листу) -> число сэмплов
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                # Номер текущей строки, а не начала функции: вызовы C-функций (json.dumps,
+                # re.search) стека Python не оставляют, их время видно по строке вызова
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+                self.samples += 1
+
+    def write_folded(self, path):
+        """Свёрнутые стеки: `f1;f2;f3 N` на строку (flamegraph.pl, speedscope, inferno)."""
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+
+    def top(self, n=15):
+        """[(функция:строка, сэмплов, доля)] по собственному времени (лист стека)."""
+        own = Counter()
+        for stack, count in self.stacks.items():
+            own[stack.rsplit(';', 1)[-1]] += count
+        return [(func, count, count / self.samples) for func, count in own.most_common(n)]
@@ -0,0 +1,176 @@
+"""
+result_cache.py
+Кэш результатов разбора по содержимому загрузки (sha256 байт файла).
+
+Два уровня:
+- память — LRU с бюджетом в байтах (OrderedDict: ключ -> сериализованная запись);
+- диск — вытесненное из памяти записывается файлом в папку кэша (тоже с бюджетом в байтах,
+  вытесняется самый давно использованный файл; mtime обновляется при каждом попадании).
+  Попадание на диске поднимает запись обратно в память.
+
+Записи хранятся байтами, поэтому бюджет считается точно, а выдача — это копия:
+вызывающий код может менять полученные объекты. Кэш ничего не знает о формате записи.
+
+version — версия парсера: папка на диске своя для каждой версии, папки других версий
+удаляются при старте, так что после изменения парсера старые результаты не всплывут.
+Методы синхронные (диск): из event loop их зовут через asyncio.to_thread.
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+CACHE_SUFFIX = '.bin'
+
+
+class ResultCache:
+    def __init__(self, memory_bytes, disk_dir=None, disk_bytes=0, version=''):
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes if disk_dir else 0
+        self.version = version
+        self._memory = OrderedDict()  # ключ -> bytes, от давнего к свежему
+        self._memory_used = 0
+        self._lock = threading.Lock()
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'stores': 0,
+                      'memory_evictions': 0, 'disk_evictions': 0}
+        self.disk_dir = None
+        if self.disk_bytes:
+            self.disk_dir = os.path.join(disk_dir, f'v-{version}')
+            os.makedirs(self.disk_dir, exist_ok=True)
+            for name in os.listdir(disk_dir):  # результаты других версий парсера
+                path = os.path.join(disk_dir, name)
+                if name.startswith('v-') and path != self.disk_dir:
+                    shutil.rmtree(path, ignore_errors=True)
+
+    # --- диск ---
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key + CACHE_SUFFIX)
+
+    def _disk_entries(self):
+        """[(mtime, размер, путь)] файлов кэша, от давних к свежим."""
+        entries = []
+        for entry in os.scandir(self.disk_dir):
+            if entry.name.endswith(CACHE_SUFFIX):
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, entry.path))
+        entries.sort()
+        return entries
+
+    def _disk_put(self, key, blob):
+        if not self.disk_dir or len(blob) > self.disk_bytes:
+            return
+        fd, tmp = tempfile.mkstemp(dir=self.disk_dir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(blob)
+        self._disk_add(key, tmp)
+
+    def _disk_add(self, key, tmp):
+        """Файл tmp из папки кэша становится записью key; лишнее вытесняется."""
+        os.replace(tmp, self._disk_path(key))  # атомарно: читатель не увидит половину файла
+        entries = self._disk_entries()
+        used = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if used <= self.disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            used -= size
+            self.stats['disk_evictions'] += 1
+
+    def _disk_get(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, 'rb') as f:
+                blob = f.read()
+            os.utime(path)  # свежий mtime — не вытеснять первым
+        except FileNotFoundError:
+            return None
+        return blob
+
+    # --- общий интерфейс ---
+    def get(self, key):
+        """Сериализованная запись или None."""
+        with self._lock:
+            blob = self._memory.get(key)
+            if blob is not None:
+                self._memory.move_to_end(key)
+                self.stats['memory_hits'] += 1
+                return blob
+        blob = self._disk_get(key)
+        if blob is None:
+            with self._lock:
+                self.stats['misses'] += 1
+            return None
+        with self._lock:
+            self.stats['disk_hits'] += 1
+        self._memory_put(key, blob)
+        return blob
+
+    def put(self, key, blob):
+        with self._lock:
+            self.stats['stores'] += 1
+        if len(blob) > self.memory_bytes:
+            self._disk_put(key, blob)  # в память не влезает — сразу на диск
+        else:
+            self._memory_put(key, blob)
+
+    def put_file(self, key, path):
+        """
+        Как put, но запись уже лежит файлом path (его забирает кэш): в память читается, только
+        если влезает в её бюджет, иначе файл переносится на диск, не проходя через память.
+        """
+        size = os.path.getsize(path)
+        if size <= self.memory_bytes:
+            with open(path, 'rb') as f:
+                blob = f.read()
+            os.remove(path)
+            self.put(key, blob)
+            return
+        with self._lock:
+            self.stats['stores'] += 1
+        if not self.disk_dir or size > self.disk_bytes:
+            os.remove(path)
+            return
+        fd, tmp = tempfile.mkstemp(dir=self.disk_dir, suffix='.tmp')
+        os.close(fd)
+        shutil.move(path, tmp)  # на том же диске — просто переименование
+        self._disk_add(key, tmp)
+
+    def _memory_put(self, key, blob):
+        spilled = []
+        with self._lock:
+            old = self._memory.pop(key, None)
+            if old is not None:
+                self._memory_used -= len(old)
+            self._memory[key] = blob
+            self._memory_used += len(blob)
+            while self._memory_used > self.memory_bytes:
+                old_key, old_blob = self._memory.popitem(last=False)
+                self._memory_used -= len(old_blob)
+                self.stats['memory_evictions'] += 1
+                spilled.append((old_key, old_blob))
+        for old_key, old_blob in spilled:  # вытесненное из памяти — на диск (если его там ещё нет)
+            if self.disk_dir and not os.path.exists(self._disk_path(old_key)):
+                self._disk_put(old_key, old_blob)
+
+    def info(self):
+        """Статистика и заполненность уровней (для GET /cache и метрик)."""
+        with self._lock:
+            info = dict(self.stats, memory_entries=len(self._memory), memory_used=self._memory_used,
+                        memory_budget=self.memory_bytes, version=self.version)
+        if self.disk_dir:
+            entries = self._disk_entries()
+            info.update(disk_entries=len(entries), disk_used=sum(size for _, size, _ in entries),
+                        disk_budget=self.disk_bytes, disk_dir=self.disk_dir)
+        lookups = info['memory_hits'] + info['disk_hits'] + info['misses']
+        info['hit_ratio'] = round((info['memory_hits'] + info['disk_hits']) / lookups, 4) if lookups else None
+        return info
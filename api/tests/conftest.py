@@ -0,0 +1,66 @@
+"""
+Общие помощники тестов API: api.py импортируется как при запуске (плоские имена из api/),
+настройки из окружения — до импорта: кэш, хранилище прогонов и задания во временной папке,
+плагин на порту, где никто не слушает (пачки проходят без изменений, как при недоступном плагине).
+plugin_pb2 генерируется из plugin.proto, если его нет.
+"""
+
+import importlib.util
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pytest
+
+API_DIR = Path(__file__).resolve().parents[1]
+LOGS_DIR = API_DIR.parent / 'logs'
+SAMPLE_LOG = LOGS_DIR / 'tf.json'
+OTHER_LOG = LOGS_DIR / '5. tflog.json'
+
+_tmp = tempfile.mkdtemp(prefix='tflog_api_tests_')
+os.environ.update({
+    'CACHE_DIR': os.path.join(_tmp, 'cache'),
+    'STORE_PATH': os.path.join(_tmp, 'runs.sqlite3'),
+    'JOBS_DIR': os.path.join(_tmp, 'jobs'),
+    'JOBS_WORKERS': '1',
+    'PLUGIN_ADDR': 'localhost:1',
+    'PLUGIN_DEADLINE': '1',
+    'METRICS': '1',
+})
+os.environ.pop('PLUGIN_PIPELINE', None)
+
+sys.path.insert(0, str(API_DIR))
+if importlib.util.find_spec('plugin_pb2') is None:
+    from grpc_tools import protoc
+    protoc.main(['protoc', f'-I{API_DIR}', f'--python_out={_tmp}', f'--grpc_python_out={_tmp}',
+                 str(API_DIR / 'plugin.proto')])
+    sys.path.insert(0, _tmp)
+
+import api  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def client():
+    with TestClient(api.app) as c:
+        yield c
+
+
+def ndjson(content):
+    return [json.loads(line) for line in content.splitlines()]
+
+
+def upload(client, path, name=None, **kwargs):
+    """POST /upload -> ответ; файл читается целиком, имя — как у файла, если не задано."""
+    return client.post('/upload', files={'file': (name or path.name, path.read_bytes())}, **kwargs)
+
+
+def wait_cached(digest, timeout=30.0):
+    """Результат в кэш кладёт фоновая задача после выдачи ответа /upload — ждём её."""
+    deadline = time.monotonic() + timeout
+    while api.RESULT_CACHE.get(digest) is None:
+        assert time.monotonic() < deadline, 'result was not cached'
+        time.sleep(0.05)
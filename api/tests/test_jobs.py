@@ -0,0 +1,56 @@
+"""Фоновые задания (/jobs): результат готового задания совпадает с ответом /upload; лимиты приёма."""
+
+import time
+
+import api
+from conftest import SAMPLE_LOG, ndjson, upload
+
+
+def wait_job(client, job_id, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        job = client.get(f'/jobs/{job_id}').json()
+        if job['status'] in api.JOB_DONE_STATUSES:
+            return job
+        assert time.monotonic() < deadline, f'job is still {job["status"]}'
+        time.sleep(0.05)
+
+
+def test_job_result_matches_upload(client):
+    r = client.post('/jobs', files={'file': ('tf.json', SAMPLE_LOG.read_bytes())})
+    assert r.status_code == 202
+    job_id = r.json()['id']
+    assert r.headers['location'] == f'/jobs/{job_id}'
+    assert r.json()['progress']['bytes_total'] == SAMPLE_LOG.stat().st_size
+
+    job = wait_job(client, job_id)
+    assert job['status'] == 'done', job['error']
+    assert job['progress']['fraction'] == 1.0
+    assert job['result'] == f'/jobs/{job_id}/result'
+    assert job_id in {j['id'] for j in client.get('/jobs').json()['jobs']}
+
+    result = client.get(job['result'])
+    assert result.status_code == 200
+    records = ndjson(result.content)
+    assert records == ndjson(upload(client, SAMPLE_LOG).content)
+    assert job['summary']['records'] == len(records)
+
+
+def test_unknown_job(client):
+    assert client.get('/jobs/no-such-job').status_code == 404
+    assert client.get('/jobs/no-such-job/result').status_code == 404
+
+
+def test_queue_full_is_429(client, monkeypatch):
+    monkeypatch.setattr(api, 'JOBS_MAX_ACTIVE', 0)
+    r = client.post('/jobs', files={'file': ('tf.json', SAMPLE_LOG.read_bytes())})
+    assert r.status_code == 429
+    assert r.headers['retry-after'] == str(api.JOBS_RETRY_AFTER)
+
+
+def test_too_large_upload_is_413(client, monkeypatch):
+    monkeypatch.setattr(api, 'JOBS_MAX_UPLOAD', 1000)
+    jobs = set(api.JOBS)
+    r = client.post('/jobs', files={'file': ('tf.json', SAMPLE_LOG.read_bytes())})
+    assert r.status_code == 413
+    assert set(api.JOBS) == jobs  # отказ не занимает место в очереди
@@ -0,0 +1,36 @@
+"""GET /metrics: текст в формате Prometheus, счётчики растут на загрузках и попаданиях в кэш."""
+
+import re
+
+import api
+from conftest import SAMPLE_LOG, upload, wait_cached
+
+
+def sample(text, name):
+    """Значение строки name (с метками, как в выдаче) или 0, если её ещё нет."""
+    match = re.search(rf'^{re.escape(name)} (\S+)$', text, re.MULTILINE)
+    return float(match.group(1)) if match else 0.0
+
+
+def test_metrics_count_uploads_and_cache_lookups(client):
+    before = client.get('/metrics').text
+    data = SAMPLE_LOG.read_bytes() + b'\n' * 4
+    wait_cached(client.post('/upload', files={'file': ('tf.json', data)}).headers['x-content-sha256'])
+    client.post('/upload', files={'file': ('tf.json', data)})
+
+    r = client.get('/metrics')
+    assert r.status_code == 200
+    assert r.headers['content-type'].startswith('text/plain; version=0.0.4')
+    after = r.text
+    assert '# HELP tflog_upload_bytes Size of uploaded log files.' in after
+    assert sample(after, 'tflog_uploads_total') - sample(before, 'tflog_uploads_total') == 2
+    for result in ('hit', 'miss'):
+        name = f'tflog_cache_lookups_total{{result="{result}"}}'
+        assert sample(after, name) - sample(before, name) == 1
+    assert sample(after, 'tflog_parse_seconds_count') - sample(before, 'tflog_parse_seconds_count') == 2
+
+
+def test_metrics_disabled(client, monkeypatch):
+    monkeypatch.setattr(api, 'METRICS', None)
+    assert client.get('/metrics').status_code == 404
+    assert upload(client, SAMPLE_LOG).status_code == 200
@@ -0,0 +1,140 @@
+"""
+Хранилище прогонов (/runs): записи прогона совпадают с ответом /upload, страницы по курсору
+в сумме дают все записи ровно по разу, фильтры — как отбор по полю; оборванный приём
+чистит только прогоны умерших или замолчавших процессов (LogStore).
+"""
+
+import subprocess
+import sys
+import time
+
+import pytest
+
+from conftest import API_DIR, SAMPLE_LOG, ndjson, upload
+from log_store import LogStore
+
+
+@pytest.fixture(scope='module')
+def run(client):
+    records = ndjson(upload(client, SAMPLE_LOG).content)
+    created = client.post('/runs', files={'file': ('tf.json', SAMPLE_LOG.read_bytes())})
+    assert created.status_code == 201
+    run = created.json()
+    yield run, records
+    client.delete(f'/runs/{run["id"]}')
+
+
+def pages(client, run_id, **params):
+    """Все страницы /runs/{id}/logs подряд, по next_cursor."""
+    records, cursor, count = [], None, 0
+    while True:
+        page = client.get(f'/runs/{run_id}/logs', params={**params, **({'cursor': cursor} if cursor is not None else {})})
+        assert page.status_code == 200
+        body = page.json()
+        records.extend(body['logs'])
+        count += 1
+        cursor = body['next_cursor']
+        if cursor is None:
+            return records, count
+
+
+def test_run_summary(client, run):
+    run, records = run
+    assert run['status'] == 'done'
+    assert run['records'] == len(records)
+    assert client.get(f'/runs/{run["id"]}').json() == run
+    assert run['id'] in {r['id'] for r in client.get('/runs').json()['runs']}
+
+
+@pytest.mark.parametrize('limit', [1000, 333])
+def test_keyset_pages_cover_every_record_once(client, run, limit):
+    run, records = run
+    found, count = pages(client, run['id'], limit=limit)
+    assert found == records
+    assert count == -(-len(records) // limit)
+
+
+@pytest.mark.parametrize('param, field', [
+    ('level', 'level'),
+    ('section', 'section'),
+    ('tf_req_id', 'tf_req_id'),
+    ('resource_type', 'tf_resource_type'),
+])
+def test_filter_matches_field(client, run, param, field):
+    run, records = run
+    values = sorted({r[field] for r in records} - {None})
+    assert values
+    for value in values[:5]:
+        found, _ = pages(client, run['id'], limit=200, **{param: value})
+        assert found == [r for r in records if r[field] == value]
+
+
+def test_time_filter(client, run):
+    run, records = run
+    timed = [r for r in records if r['ts_ns'] is not None]
+    since, until = timed[len(timed) // 4], timed[len(timed) // 2]
+    found, _ = pages(client, run['id'], since=since['timestamp'], until=until['timestamp'])
+    assert found == [r for r in timed if since['ts_ns'] <= r['ts_ns'] <= until['ts_ns']]
+
+
+def test_run_gantt_matches_post(client, run):
+    run, records = run
+    gantt = client.get(f'/runs/{run["id"]}/gantt').json()
+    assert gantt['gantt'] == client.post('/api/gantt', json={'logs': records}).json()['gantt']
+
+
+def test_bad_requests(client, run):
+    run, _ = run
+    assert client.get(f'/runs/{run["id"]}/logs', params={'limit': 0}).status_code == 400
+    assert client.get(f'/runs/{run["id"]}/logs', params={'since': 'yesterday'}).status_code == 400
+    assert client.get('/runs/999999/logs').status_code == 404
+
+
+def test_delete_run(client):
+    run_id = client.post('/runs', files={'file': ('tf.json', SAMPLE_LOG.read_bytes())}).json()['id']
+    assert client.delete(f'/runs/{run_id}').status_code == 204
+    assert client.get(f'/runs/{run_id}').status_code == 404
+    assert client.delete(f'/runs/{run_id}').status_code == 404
+
+
+# --- LogStore: оборванный приём ---
+def other_worker_run(path, name, hold):
+    """Прогон name, который начал другой процесс; hold=True — процесс ещё жив (вернётся и он)."""
+    code = ('import sys, time\n'
+            f'sys.path.insert(0, {str(API_DIR)!r})\n'
+            'from log_store import LogStore\n'
+            f'LogStore({str(path)!r}).create_run({name!r})\n'
+            'print(flush=True)\n'
+            + ('time.sleep(60)\n' if hold else ''))
+    proc = subprocess.Popen([sys.executable, '-c', code], stdout=subprocess.PIPE, text=True)
+    proc.stdout.readline()
+    if not hold:
+        proc.wait()
+    return proc
+
+
+def run_names(store):
+    # id удалённого прогона SQLite отдаёт следующему — сравниваем по именам
+    return {r['name'] for r in store.list_runs()}
+
+
+def test_stale_runs_are_removed(tmp_path):
+    path = tmp_path / 'runs.sqlite3'
+    store = LogStore(str(path))
+    live = other_worker_run(path, 'live', hold=True)
+    try:
+        other_worker_run(path, 'dead', hold=False)
+        store.create_run('mine')
+        quiet = store.create_run('quiet')
+        store._conn().execute('UPDATE runs SET heartbeat = ? WHERE id = ?', (time.time() - 3600, quiet))
+        store._conn().commit()
+
+        store.create_run('next')  # перед новым прогоном убираются оборванные
+        # живой чужой процесс и свой текущий приём не трогаем
+        assert run_names(store) == {'live', 'mine', 'next'}
+    finally:
+        live.kill()
+        live.wait()
+
+    # после перезапуска с тем же pid свои незавершённые прогоны — оборванные; чужой теперь тоже
+    assert run_names(LogStore(str(path))) == set()
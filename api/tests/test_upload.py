@@ -0,0 +1,93 @@
+"""
+/upload: потоковая выдача NDJSON совпадает с разбором файла целиком (parse_log_content),
+повторная загрузка того же содержимого отдаётся из кэша результатов — по sha256, посчитанному
+сервером, а не по заголовку клиента; диаграмма Ганта из кэша — как POST /api/gantt.
+"""
+
+import asyncio
+import gzip
+import hashlib
+
+import pytest
+
+import api
+from conftest import OTHER_LOG, SAMPLE_LOG, ndjson, upload, wait_cached
+
+
+@pytest.fixture(scope='module')
+def reference():
+    return ndjson(api.to_ndjson(api.parse_log_content(SAMPLE_LOG.read_text(encoding='utf-8'))))
+
+
+def test_upload_matches_parse_log_content(client, reference):
+    r = upload(client, SAMPLE_LOG, name='fresh-copy.json', headers={'Accept-Encoding': 'gzip'})
+    assert r.status_code == 200
+    assert r.headers['content-type'] == 'application/x-ndjson'
+    # потоковый ответ GZipMiddleware не сжимает: записи уходят клиенту сразу, без буфера
+    assert r.headers['content-encoding'] == 'identity'
+    assert ndjson(r.content) == reference
+
+
+def test_compressed_upload(client, reference):
+    r = client.post('/upload', files={'file': ('tf.json.gz', gzip.compress(SAMPLE_LOG.read_bytes()))})
+    assert r.status_code == 200
+    assert ndjson(r.content) == reference
+
+
+def test_wrong_suffix_is_rejected(client):
+    assert upload(client, SAMPLE_LOG, name='tf.txt').status_code == 400
+
+
+def test_reupload_is_served_from_cache(client, reference):
+    data = SAMPLE_LOG.read_bytes() + b'\n'  # своё содержимое — не зависит от других тестов
+    digest = hashlib.sha256(data).hexdigest()
+    first = client.post('/upload', files={'file': ('a.json', data)})
+    assert first.headers['x-content-sha256'] == digest
+    assert first.headers['x-cache'] == 'miss'
+    wait_cached(digest)
+
+    # клиент ничего не передаёт: ключ — sha256 содержимого, имя файла не важно
+    second = client.post('/upload', files={'file': ('b.json', data)})
+    assert second.headers['x-cache'] == 'hit'
+    assert second.headers['x-content-sha256'] == digest
+    assert second.content == first.content
+    assert ndjson(second.content) == reference
+
+
+def test_client_digest_header_is_ignored(client):
+    digest = hashlib.sha256(SAMPLE_LOG.read_bytes() + b'\n\n').hexdigest()
+    client.post('/upload', files={'file': ('a.json', SAMPLE_LOG.read_bytes() + b'\n\n')})
+    wait_cached(digest)
+
+    # чужой sha256 в заголовке не подменяет результат другого файла
+    other = OTHER_LOG.read_bytes()
+    r = upload(client, OTHER_LOG, headers={'X-Content-SHA256': digest})
+    assert r.headers['x-cache'] == 'miss'
+    assert r.headers['x-content-sha256'] == hashlib.sha256(other).hexdigest()
+    assert ndjson(r.content) == ndjson(api.to_ndjson(api.parse_log_content(other.decode('utf-8'))))
+
+
+def test_cached_gantt_matches_post(client):
+    data = SAMPLE_LOG.read_bytes() + b'\n\n\n'
+    r = client.post('/upload', files={'file': ('a.json', data)})
+    digest = r.headers['x-content-sha256']
+    assert r.headers['x-gantt'] == f'/api/gantt?sha256={digest}'
+    wait_cached(digest)
+
+    cached = client.get(r.headers['x-gantt'])
+    assert cached.status_code == 200
+    assert cached.json() == client.post('/api/gantt', json={'logs': ndjson(r.content)}).json()
+    assert cached.json()['gantt']
+    assert client.get('/api/gantt', params={'sha256': '0' * 64}).status_code == 404
+
+
+def test_rebatch_sends_first_batch_at_once():
+    async def batches():
+        for n in (7, 993, 250):
+            yield [{'index': i} for i in range(n)]
+
+    async def sizes():
+        return [len(batch) async for batch in api.rebatch(batches(), 1000)]
+
+    # первая пачка не ждёт, пока наберётся 1000 записей
+    assert asyncio.run(sizes()) == [7, 1000, 243]
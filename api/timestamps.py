@@ -0,0 +1,107 @@
+"""
+timestamps.py
+Разбор ISO-меток времени в целые epoch-наносекунды (int64).
+
+- parse_ts_ns(ts) — одна метка (datetime.fromisoformat), None если не разобрать;
+- parse_ts_column(values) — колонка меток в numpy int64 (NaT = NAT). Раскладка Terraform
+  `2025-09-09T10:55:44.205291+03:00` разбирается векторно по байтам фиксированных позиций,
+  всё остальное — через parse_ts_ns.
+Метки без часового пояса считаются UTC. Сравнение и сортировка целых ns корректны
+при любых смещениях, в отличие от лексического сравнения строк.
+"""
+
+from datetime import datetime, timezone
+
+NAT = -(1 << 63)  # то же значение, что numpy.datetime64('NaT') в int64
+_NS_MAX = (1 << 63) - 1
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# Раскладка @timestamp Terraform: YYYY-MM-DDTHH:MM:SS.ffffff±HH:MM
+TF_TS_LEN = 32
+_TF_SEPARATORS = {4: b'-', 7: b'-', 10: b'T', 13: b':', 16: b':', 19: b'.', 29: b':'}
+_TF_DIGITS = [0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15, 17, 18, 20, 21, 22, 23, 24, 25, 27, 28, 30, 31]
+_MONTH_DAYS = [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+
+
+def _fromisoformat(ts):
+    # 'Z' (UTC) fromisoformat понимает только с Python 3.11 — раньше такая метка не разбиралась бы
+    return datetime.fromisoformat(ts.replace('Z', '+00:00'))
+
+
+def parse_ts_ns(ts):
+    """ISO-строка -> epoch ns (int) или None (в том числе вне диапазона int64 ns, ~1678–2262 гг.)."""
+    if not ts or not isinstance(ts, str):
+        return None
+    try:
+        dt = _fromisoformat(ts)
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    delta = dt - _EPOCH
+    ns = (delta.days * 86400 + delta.seconds) * 1_000_000_000 + delta.microseconds * 1000
+    return ns if NAT < ns <= _NS_MAX else None
+
+
+def ts_offset(ts):
+    """Часовой пояс метки (tzinfo) или None — нужен, чтобы показывать время как в логе."""
+    try:
+        return _fromisoformat(ts).tzinfo
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def parse_ts_column(values):
+    """
+    Список меток (строки/None) -> numpy.ndarray int64 epoch ns, NAT там, где метки нет.
+    Результат можно смотреть как datetime64[ns]: column.view('datetime64[ns]').
+    """
+    import numpy as np
+
+    n = len(values)
+    out = np.full(n, NAT, dtype=np.int64)
+    if n == 0:
+        return out
+
+    # Векторный путь: строки ровно в раскладке Terraform
+    buf = np.array([v.encode('ascii', 'replace') if isinstance(v, str) and len(v) == TF_TS_LEN else b''
+                    for v in values], dtype=f'S{TF_TS_LEN}')
+    b = buf.view(np.uint8).reshape(n, TF_TS_LEN)
+    ok = np.ones(n, dtype=bool)
+    for pos, sep in _TF_SEPARATORS.items():
+        ok &= b[:, pos] == sep[0]
+    ok &= (b[:, 26] == ord('+')) | (b[:, 26] == ord('-'))
+    digits = b[:, _TF_DIGITS].astype(np.int64) - ord('0')
+    ok &= ((digits >= 0) & (digits <= 9)).all(axis=1)
+
+    d = dict(zip(_TF_DIGITS, digits.T))
+    num = lambda *pos: sum(d[p] * 10 ** (len(pos) - 1 - i) for i, p in enumerate(pos))
+    year, month, day = num(0, 1, 2, 3), num(5, 6), num(8, 9)
+    hour, minute, sec = num(11, 12), num(14, 15), num(17, 18)
+    micros = num(20, 21, 22, 23, 24, 25)
+    off = (num(27, 28) * 60 + num(30, 31)) * 60 * np.where(b[:, 26] == ord('-'), -1, 1)
+
+    leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    month_days = np.array(_MONTH_DAYS, dtype=np.int64)[np.clip(month, 1, 12) - 1] + ((month == 2) & leap)
+    ok &= (month >= 1) & (month <= 12) & (day >= 1) & (day <= month_days)
+    ok &= (year > 1678) & (year < 2262)  # остальное (край диапазона int64 ns) — через parse_ts_ns
+    ok &= (hour < 24) & (minute < 60) & (sec < 60) & (num(27, 28) < 24) & (num(30, 31) < 60)
+
+    # days from civil (H. Hinnant)
+    y = year - (month <= 2)
+    era = y // 400
+    yoe = y - era * 400
+    doy = (153 * (month + np.where(month > 2, -3, 9)) + 2) // 5 + day - 1
+    doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+    days = era * 146097 + doe - 719468
+
+    fast = ((days * 86400 + hour * 3600 + minute * 60 + sec - off) * 1_000_000_000 + micros * 1000)
+    out[ok] = fast[ok]
+
+    # Всё, что не подошло под раскладку, — по одной метке
+    for i in np.flatnonzero(~ok):
+        ns = parse_ts_ns(values[i])
+        if ns is not None:
+            out[i] = ns
+    return out
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+bench_matcher.py
+Микро-бенчмарк detect_section/guess_level: прежние `any(p.lower() in msg ...)`-сканы
+против однопроходного PhraseMatcher. Заодно проверяет, что результаты совпадают.
+
+Запуск (из папки py/):  python bench/bench_matcher.py [../logs/tf.json] [--repeat 20]
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import main  # noqa: E402
+
+
+# ---------- Эталон: реализация до PhraseMatcher ----------
+def ref_guess_level(obj):
+    for key in ('@level', 'level', 'log.level'):
+        if key in obj and obj[key]:
+            return str(obj[key]).lower(), False
+    msg = (obj.get('@message') or obj.get('message') or '').lower()
+    for kw, lvl in main.LEVEL_KEYWORDS.items():
+        if kw in msg:
+            return lvl, True
+    return 'info', False
+
+def ref_detect_section(obj, current_section):
+    msg = (obj.get('@message') or obj.get('message') or '').lower()
+    if 'cli args' in msg or 'cli command args' in msg:
+        if 'plan' in msg and current_section != 'plan':
+            return 'plan'
+        if 'apply' in msg and current_section != 'apply':
+            return 'apply'
+    if any(p.lower() in msg for p in main.PLAN_START_PHRASES) and current_section != 'plan':
+        return 'plan'
+    if any(p.lower() in msg for p in main.APPLY_START_PHRASES) and current_section != 'apply':
+        return 'apply'
+    if any(p.lower() in msg for p in main.PLAN_END_PHRASES) and current_section == 'plan':
+        return None
+    if any(p.lower() in msg for p in main.APPLY_END_PHRASES) and current_section == 'apply':
+        return None
+    return current_section
+
+
+def load_objects(path):
+    objs = []
+    with open(path, encoding='utf-8') as f:
+        for raw_line in f:
+            raw_line = raw_line.strip()
+            if raw_line:
+                objs.append(main.parse_line(raw_line)[0])
+    return objs
+
+def run(objs, detect_section, guess_level):
+    out = []
+    for state in main.SECTION_STATES:
+        for obj in objs:
+            out.append((detect_section(obj, state), guess_level(obj)))
+    return out
+
+def bench(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[1])
+    parser.add_argument('input', nargs='?', default=str(Path(__file__).resolve().parents[2] / 'logs' / 'tf.json'))
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    objs = load_objects(args.input)
+    datasets = {
+        'как есть': objs,
+        # Ветка guess_level по сообщению: те же строки без явного @level
+        'без @level': [{k: v for k, v in o.items() if k != '@level'} for o in objs],
+    }
+    calls = len(objs) * len(main.SECTION_STATES)
+    print(f"Input: {args.input} ({calls} вызовов detect_section + guess_level на набор)")
+
+    for name, data in datasets.items():
+        expected = run(data, ref_detect_section, ref_guess_level)
+        actual = run(data, main.detect_section, main.guess_level)
+        mismatches = sum(a != b for a, b in zip(expected, actual))
+        if mismatches:
+            print(f"[!] {name}: {mismatches} расхождений с эталоном")
+            sys.exit(1)
+
+        t_ref = bench(lambda: run(data, ref_detect_section, ref_guess_level), args.repeat)
+        t_new = bench(lambda: run(data, main.detect_section, main.guess_level), args.repeat)
+
+        print(f"\n[{name}] результаты совпадают с эталоном")
+        print(f"  any(... in msg):  {t_ref * 1e3:8.2f} ms  ({calls / t_ref / 1e6:.2f} M/s)")
+        print(f"  PhraseMatcher:    {t_new * 1e3:8.2f} ms  ({calls / t_new / 1e6:.2f} M/s)")
+        print(f"  speedup: x{t_ref / t_new:.2f}")
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+bench_suite.py
+Воспроизводимый бенчмарк парсеров и фильтров на синтетических логах (см. gen_tflog.py).
+
+Что меряется (каждый замер — в отдельном процессе, чтобы пиковая память была честной):
+- process_file       (py/main.py)              — пропускная способность, МБ/с и строк/с;
+- parse_log_content  (api/api.py)              — то же;
+- load_and_parse     (py/streamlit/explorer.py) — то же;
+- filter_records     (py/streamlit/explorer.py) — задержка запросов: полный скан,
+                                                  SearchIndex, SearchIndex + колонка времени
+                                                  и маска по категориальному DataFrame;
+- build_gantt_data   (api/api.py)              — задержка одного вызова.
+Для каждого — пиковый RSS процесса и RSS после импортов (база).
+
+Логи генерируются один раз и кэшируются в --data-dir (имя зависит от размера и seed).
+Результат — JSON с метаданными (коммит, Python, CPU); --compare старый.json печатает
+отношение времён, чтобы сравнивать коммиты.
+
+Запуск (из папки py/):
+    python bench/bench_suite.py --sizes 10MB,100MB [--only process_file,filter_records]
+    python bench/bench_suite.py --sizes 10MB --compare bench/results/abc1234.json
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+REPO = BENCH_DIR.parents[1]
+PY_DIR = REPO / 'py'
+APP_DIR = REPO / 'py' / 'streamlit'
+API_DIR = REPO / 'api'
+
+sys.path.insert(0, str(BENCH_DIR))
+from gen_tflog import generate, parse_size  # noqa: E402
+
+BENCHMARKS = ['process_file', 'parse_log_content', 'load_and_parse', 'filter_records', 'build_gantt_data']
+MB = 1024 * 1024
+
+
+def rss_mb():
+    """Пиковый RSS текущего процесса (ru_maxrss: КБ в Linux, байты в macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (MB if sys.platform == 'darwin' else 1024), 1)
+
+def count_lines(path):
+    with open(path, 'rb') as f:
+        return sum(chunk.count(b'\n') for chunk in iter(lambda: f.read(MB), b''))
+
+def latency_stats(samples):
+    samples = sorted(samples)
+    return {
+        'n': len(samples),
+        'p50_ms': round(statistics.median(samples) * 1e3, 3),
+        'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1e3, 3),
+        'max_ms': round(samples[-1] * 1e3, 3),
+    }
+
+def throughput(seconds, path, lines):
+    size = os.path.getsize(path)
+    return {'seconds': round(seconds, 4), 'mb_per_s': round(size / MB / seconds, 2),
+            'lines_per_s': round(lines / seconds)}
+
+def import_api():
+    """api.py целиком (FastAPI, gRPC); plugin_pb2 генерируется из plugin.proto, если его нет."""
+    sys.path.insert(0, str(API_DIR))
+    if importlib.util.find_spec('plugin_pb2') is None:
+        from grpc_tools import protoc
+        gen_dir = tempfile.mkdtemp(prefix='plugin_pb2_')
+        protoc.main(['protoc', f'-I{API_DIR}', f'--python_out={gen_dir}', f'--grpc_python_out={gen_dir}',
+                     str(API_DIR / 'plugin.proto')])
+        sys.path.insert(0, gen_dir)
+    import api
+    return api
+
+
+# ---------- Замеры (выполняются в дочернем процессе) ----------
+def bench_process_file(path, args):
+    sys.path.insert(0, str(PY_DIR))
+    import main
+    base = rss_mb()
+    with tempfile.TemporaryDirectory() as tmp:
+        t0 = time.perf_counter()
+        _, _, stats = main.process_file(path, Path(tmp) / 'parsed.jsonl', workers=args.workers)
+        seconds = time.perf_counter() - t0
+    return {'baseline_rss_mb': base, 'workers': args.workers, 'lines': stats['total_lines'],
+            'parsed_errors': stats['parsed_errors'], **throughput(seconds, path, stats['total_lines'])}
+
+def bench_parse_log_content(path, args):
+    api = import_api()
+    base = rss_mb()
+    content = Path(path).read_text(encoding='utf-8')
+    t0 = time.perf_counter()
+    logs = api.parse_log_content(content)
+    seconds = time.perf_counter() - t0
+    return {'baseline_rss_mb': base, 'records': len(logs), **throughput(seconds, path, len(logs))}
+
+def bench_load_and_parse(path, args):
+    sys.path.insert(0, str(APP_DIR))
+    import explorer
+    base = rss_mb()
+    t0 = time.perf_counter()
+    records = explorer.load_and_parse(path)
+    seconds = time.perf_counter() - t0
+    return {'baseline_rss_mb': base, 'records': len(records), **throughput(seconds, path, len(records))}
+
+def filter_queries(records, rng):
+    """Набор типичных запросов к UI, выбранных из самих данных (детерминированно по seed)."""
+    req_ids = sorted({r['tf_req_id'] for r in records if r['tf_req_id']})
+    types = sorted({r['raw'].get('tf_resource_type') for r in records if r['raw'].get('tf_resource_type')})
+    stamps = sorted(r['timestamp'] for r in records if r['timestamp'])
+    queries = []
+    if req_ids:
+        queries.append(('tf_req_id', {'tf_req_id': rng.choice(req_ids)}))
+    if types:
+        queries.append(('tf_resource_type', {'tf_resource_type': rng.choice(types)}))
+    queries.append(('q: error', {'q': 'error'}))
+    queries.append(('q: two words', {'q': 'provider schema'}))
+    if stamps:
+        lo, hi = stamps[len(stamps) * 45 // 100], stamps[len(stamps) * 55 // 100]
+        queries.append(('date range 10%', {'date_from': lo, 'date_to': hi}))
+        if types:
+            queries.append(('type + q + dates', {'tf_resource_type': types[0], 'q': 'schema',
+                                                 'date_from': lo, 'date_to': hi}))
+    return queries
+
+def bench_filter_records(path, args):
+    sys.path.insert(0, str(APP_DIR))
+    import explorer
+    from search_index import SearchIndex
+    from timestamps import parse_ts_column
+    base = rss_mb()
+    records = explorer.load_and_parse(path)
+    t0 = time.perf_counter()
+    index = SearchIndex(records)
+    index_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    ts_ns = parse_ts_column([r['timestamp'] for r in records])
+    column_s = time.perf_counter() - t0
+    tz = explorer.log_tz(records)
+    t0 = time.perf_counter()
+    frame = explorer.records_frame(records, ts_ns)
+    frame_s = time.perf_counter() - t0
+
+    # режим -> функция запроса, возвращает число найденных записей
+    modes = {
+        'scan': lambda query: len(explorer.filter_records(records, **query)),
+        'index': lambda query: len(explorer.filter_records(records, **query, index=index, tz=tz)),
+        'index+ts_column': lambda query: len(explorer.filter_records(records, **query, index=index,
+                                                                     ts_ns=ts_ns, tz=tz)),
+        'frame_mask': lambda query: int(explorer.filter_mask(frame, index, **query, tz=tz).sum()),
+    }
+    queries = filter_queries(records, random.Random(args.seed))
+    result = {'baseline_rss_mb': base, 'records': len(records), 'index_build_s': round(index_s, 4),
+              'ts_column_s': round(column_s, 4), 'frame_build_s': round(frame_s, 4), 'queries': {}, 'latency': {}}
+    for mode, run_query in modes.items():
+        all_samples = []
+        for name, query in queries:
+            samples = []
+            for _ in range(args.repeat):
+                t0 = time.perf_counter()
+                found = run_query(query)
+                samples.append(time.perf_counter() - t0)
+            result['queries'].setdefault(name, {'matches': found})[mode] = latency_stats(samples)
+            all_samples += samples
+        result['latency'][mode] = latency_stats(all_samples)
+    return result
+
+def bench_build_gantt_data(path, args):
+    api = import_api()
+    base = rss_mb()
+    logs = api.parse_log_content(Path(path).read_text(encoding='utf-8'))
+    samples = []
+    for _ in range(args.repeat):
+        t0 = time.perf_counter()
+        gantt = api.build_gantt_data(logs)
+        samples.append(time.perf_counter() - t0)
+    return {'baseline_rss_mb': base, 'records': len(logs), 'requests': len(gantt),
+            'latency': latency_stats(samples), 'records_per_s': round(len(logs) / min(samples))}
+
+RUNNERS = {name: globals()[f'bench_{name}'] for name in BENCHMARKS}
+
+
+# ---------- Родительский процесс ----------
+def git_commit():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO,
+                             capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=REPO,
+                               capture_output=True, text=True).stdout.strip()
+        return out + ('-dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def ensure_input(size, seed, data_dir):
+    data_dir.mkdir(parents=True, exist_ok=True)
+    path = data_dir / f'synthetic_{size}_{seed}.json'  # size в байтах: 10MB и 10M — один файл
+    if not path.exists():
+        print(f"[*] Generating {path.name} ...", flush=True)
+        tmp = path.with_suffix('.tmp')
+        generate(tmp, size, seed=seed)
+        tmp.replace(path)
+    return path
+
+def run_child(name, path, args):
+    cmd = [sys.executable, __file__, '--child', name, '--input', str(path),
+           '--repeat', str(args.repeat), '--workers', str(args.workers), '--seed', str(args.seed)]
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    if proc.returncode != 0:
+        return {'error': (proc.stderr.strip().splitlines() or ['?'])[-1]}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+def summary(result):
+    if 'error' in result:
+        return f"ОШИБКА: {result['error']}"
+    parts = []
+    if 'mb_per_s' in result:
+        parts.append(f"{result['seconds']:.2f} s, {result['mb_per_s']:.1f} MB/s, {result['lines_per_s']} lines/s")
+    if isinstance(result.get('latency'), dict):
+        lat = result['latency']
+        if 'p50_ms' in lat:
+            parts.append(f"p50 {lat['p50_ms']} ms, p95 {lat['p95_ms']} ms")
+        else:
+            parts.append(', '.join(f"{mode} p50 {v['p50_ms']} ms" for mode, v in lat.items()))
+    parts.append(f"peak RSS {result['peak_rss_mb']} MB")
+    return '; '.join(parts)
+
+def key_metric(result):
+    """Одно число «меньше — лучше» для --compare."""
+    if 'seconds' in result:
+        return result['seconds']
+    lat = result.get('latency') or {}
+    if 'p50_ms' in lat:
+        return lat['p50_ms']
+    return lat.get('index+ts_column', {}).get('p50_ms')
+
+def compare(results, baseline_path):
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {(r['benchmark'], r['size']): r for r in json.load(f)['results']}
+    print(f"\n--- Сравнение с {baseline_path} (время: новое / старое; < 1 — быстрее) ---")
+    for r in results:
+        old = baseline.get((r['benchmark'], r['size']))
+        if not old or 'error' in r or 'error' in old:
+            continue
+        new_v, old_v = key_metric(r), key_metric(old)
+        if new_v and old_v:
+            print(f"  {r['benchmark']:18s} {r['size']:>8s}  x{new_v / old_v:.2f}   "
+                  f"RSS {old['peak_rss_mb']} -> {r['peak_rss_mb']} MB")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[1])
+    parser.add_argument('--sizes', default='10MB', help="размеры логов через запятую (по умолчанию 10MB)")
+    parser.add_argument('--only', help=f"замеры через запятую из: {', '.join(BENCHMARKS)}")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=5, help="повторов для замеров задержки")
+    parser.add_argument('--workers', type=int, default=1, help="workers для process_file")
+    parser.add_argument('--data-dir', default=str(BENCH_DIR / 'data'), help="кэш сгенерированных логов")
+    parser.add_argument('--out', help="куда сохранить JSON (по умолчанию bench/results/<коммит>.json)")
+    parser.add_argument('--compare', help="JSON прошлого прогона для сравнения")
+    parser.add_argument('--child', choices=BENCHMARKS, help=argparse.SUPPRESS)
+    parser.add_argument('--input', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        result = RUNNERS[args.child](args.input, args)
+        result['peak_rss_mb'] = rss_mb()
+        print(json.dumps(result))
+        sys.exit(0)
+
+    names = args.only.split(',') if args.only else BENCHMARKS
+    unknown = set(names) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"неизвестные замеры: {', '.join(sorted(unknown))}")
+
+    commit = git_commit()
+    meta = {
+        'commit': commit,
+        'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'args': {k: v for k, v in vars(args).items() if k not in ('child', 'input')},
+    }
+    results = []
+    for size_text in args.sizes.split(','):
+        size = parse_size(size_text)
+        path = ensure_input(size, args.seed, Path(args.data_dir))
+        input_bytes = os.path.getsize(path)
+        lines = count_lines(path)
+        print(f"\n=== {size_text.strip()}: {path.name}, {input_bytes / MB:.1f} MB, {lines} lines ===", flush=True)
+        for name in names:
+            result = run_child(name, path, args)
+            result.update(benchmark=name, size=size_text.strip(), input_bytes=input_bytes, input_lines=lines)
+            results.append(result)
+            print(f"  {name:18s} {summary(result)}", flush=True)
+
+    out = Path(args.out) if args.out else BENCH_DIR / 'results' / f"{commit or 'results'}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, 'w', encoding='utf-8') as f:
+        json.dump({'meta': meta, 'results': results}, f, ensure_ascii=False, indent=2)
+    print(f"\n[*] Results saved to {out}")
+    if args.compare:
+        compare(results, args.compare)
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+gen_tflog.py
+Генератор синтетических Terraform JSON-логов заданного размера (10 МБ … 10 ГБ и больше).
+
+Строки берутся из образца (по умолчанию logs/tf.json), поэтому распределение ключей то же:
+tf_req_id / tf_rpc / tf_resource_type, HTTP-запросы с телами, EXTRA_VALUE_AT_END и т.д.
+Образец режется на пролог (до первого запроса к провайдеру), эпилог и блоки —
+подряд идущие строки одного tf_req_id. Лог собирается из прогонов «пролог → случайные
+блоки → эпилог»: каждый экземпляр блока получает свежие tf_req_id / tf_http_trans_id,
+а время идёт вперёд с исходными интервалами между строками. Небольшая доля строк
+обрезается — это битый JSON, как в реальных логах при падении процесса.
+
+Строки образца заранее сериализованы в шаблоны, поэтому генерация идёт со скоростью
+склейки строк. При одном и том же --seed результат побайтно одинаковый.
+
+Запуск (из папки py/):  python bench/gen_tflog.py synthetic_100mb.json --size 100MB [--seed 1]
+"""
+
+import argparse
+import json
+import random
+import re
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+DEFAULT_SAMPLE = Path(__file__).resolve().parents[2] / 'logs' / 'tf.json'
+
+# Слоты шаблона: значения, которые меняются от строки к строке
+SLOT_TS = 'T'        # @timestamp: 2025-09-09T10:55:44.205291+03:00
+SLOT_TS_MS = 'M'     # timestamp провайдера: 2025-09-09T10:56:20.572+0300
+SLOT_REQ_ID = 'R'    # tf_req_id
+SLOT_TRANS_ID = 'H'  # tf_http_trans_id
+_SLOT_FIELDS = {'@timestamp': SLOT_TS, 'timestamp': SLOT_TS_MS,
+                'tf_req_id': SLOT_REQ_ID, 'tf_http_trans_id': SLOT_TRANS_ID}
+_SLOT_RE = re.compile(r'\\u0000(\w)\\u0000')
+
+MAX_GAP_US = 50_000  # интервал между строками не больше 50 мс
+_SIZE_RE = re.compile(r'^\s*([\d.]+)\s*([KMGT]?)i?B?\s*$', re.IGNORECASE)
+_SIZE_UNITS = {'': 1, 'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30, 'T': 1 << 40}
+
+
+def parse_size(text):
+    """'10MB', '1.5G', '4096' -> байты"""
+    m = _SIZE_RE.match(text)
+    if not m:
+        raise argparse.ArgumentTypeError(f"не размер: {text!r} (пример: 10MB, 1GB)")
+    return int(float(m.group(1)) * _SIZE_UNITS[m.group(2).upper()])
+
+
+def make_template(obj):
+    """Объект строки -> (части строки, слоты между ними) для быстрой склейки."""
+    obj = dict(obj)
+    for field, slot in _SLOT_FIELDS.items():
+        if obj.get(field):
+            obj[field] = f'\x00{slot}\x00'
+    text = json.dumps(obj, ensure_ascii=False, separators=(',', ':'))
+    pieces = _SLOT_RE.split(text)
+    return pieces[0::2], pieces[1::2]
+
+
+def load_sample(path):
+    """
+    Образец -> (пролог, блоки, эпилог). Строка: (части, слоты, исходный tf_req_id,
+    исходный tf_http_trans_id, интервал до предыдущей строки в мкс).
+    """
+    lines = []
+    prev_ts = None
+    with open(path, encoding='utf-8') as f:
+        for raw in f:
+            raw = raw.strip()
+            if not raw:
+                continue
+            try:
+                obj = json.loads(raw)
+            except json.JSONDecodeError:
+                continue
+            try:
+                ts = datetime.fromisoformat(obj.get('@timestamp'))
+            except (TypeError, ValueError):
+                ts = None
+            gap = 0
+            if ts is not None and prev_ts is not None:
+                gap = min(max(int((ts - prev_ts) / timedelta(microseconds=1)), 0), MAX_GAP_US)
+            prev_ts = ts or prev_ts
+            parts, slots = make_template(obj)
+            lines.append((parts, slots, obj.get('tf_req_id'), obj.get('tf_http_trans_id'), gap))
+    if not lines:
+        raise SystemExit(f"{path}: в образце нет ни одной JSON-строки")
+
+    with_req = [i for i, line in enumerate(lines) if line[2]]
+    if not with_req:
+        return lines, [lines], []
+    first, last = with_req[0], with_req[-1]
+    blocks, current = [], []
+    for line in lines[first:last + 1]:
+        if current and line[2] != current[-1][2]:
+            blocks.append(current)
+            current = []
+        current.append(line)
+    blocks.append(current)
+    return lines[:first], blocks, lines[last + 1:]
+
+
+class Clock:
+    """Время лога: микросекунды от начала + кэш строки до секунды (форматирование дорогое)."""
+
+    def __init__(self, start):
+        self.start = start.replace(microsecond=0)
+        self.offset = start.strftime('%z')                # +0300
+        self.offset_colon = self.offset[:3] + ':' + self.offset[3:]  # +03:00
+        self.us = 0
+        self._second = None
+        self._prefix = ''
+
+    def tick(self, gap_us):
+        self.us += gap_us
+        second = self.us // 1_000_000
+        if second != self._second:
+            self._second = second
+            self._prefix = (self.start + timedelta(seconds=second)).strftime('%Y-%m-%dT%H:%M:%S')
+
+    def iso(self):
+        return f'{self._prefix}.{self.us % 1_000_000:06d}{self.offset_colon}'
+
+    def iso_ms(self):
+        return f'{self._prefix}.{self.us % 1_000_000 // 1000:03d}{self.offset}'
+
+
+def generate(out_path, size, sample=DEFAULT_SAMPLE, seed=1, malformed_rate=0.001, run_size=64 << 20):
+    """Пишет в out_path не меньше size байт синтетического лога; возвращает статистику."""
+    rng = random.Random(seed)
+    prologue, blocks, epilogue = load_sample(sample)
+    start_ts = None
+    with open(sample, encoding='utf-8') as f:
+        for raw in f:
+            try:
+                start_ts = datetime.fromisoformat(json.loads(raw)['@timestamp'])
+                break
+            except (ValueError, KeyError, TypeError):
+                continue
+    clock = Clock(start_ts or datetime.fromisoformat('2025-09-09T10:55:44.205291+03:00'))
+
+    def new_id():
+        h = '%032x' % rng.getrandbits(128)
+        return f'{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}'
+
+    written = n_lines = n_malformed = n_runs = 0
+    buf = []
+    buf_bytes = 0
+
+    def emit(lines, first_gap):
+        nonlocal n_lines, n_malformed, buf_bytes
+        ids = {}
+        for i, (parts, slots, req_id, trans_id, gap) in enumerate(lines):
+            clock.tick(first_gap if i == 0 else gap)
+            values = []
+            for slot in slots:
+                if slot == SLOT_TS:
+                    values.append(clock.iso())
+                elif slot == SLOT_TS_MS:
+                    values.append(clock.iso_ms())
+                elif slot == SLOT_REQ_ID:
+                    values.append(ids.get(req_id) or ids.setdefault(req_id, new_id()))
+                else:
+                    values.append(ids.get(('h', trans_id)) or ids.setdefault(('h', trans_id), new_id()))
+            pieces = [parts[0]]
+            for value, part in zip(values, parts[1:]):
+                pieces.append(value)
+                pieces.append(part)
+            line = ''.join(pieces)
+            if malformed_rate and rng.random() < malformed_rate:
+                line = line[:rng.randrange(1, max(2, len(line) - 1))]  # оборванная запись
+                n_malformed += 1
+            data = (line + '\n').encode('utf-8')
+            buf.append(data)
+            buf_bytes += len(data)
+            n_lines += 1
+        if buf_bytes >= 1 << 20:
+            flush()
+
+    def flush():
+        nonlocal written, buf_bytes
+        fout.write(b''.join(buf))
+        written += buf_bytes
+        buf.clear()
+        buf_bytes = 0
+
+    with open(out_path, 'wb') as fout:
+        while written + buf_bytes < size:
+            n_runs += 1
+            run_start = written + buf_bytes
+            emit(prologue, 1000)
+            while written + buf_bytes < size and written + buf_bytes - run_start < run_size:
+                emit(rng.choice(blocks), rng.randint(1, 2000))
+            emit(epilogue, 1000)
+        flush()
+
+    return {'bytes': written, 'lines': n_lines, 'malformed_lines': n_malformed, 'runs': n_runs,
+            'sample': str(sample), 'seed': seed}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[1])
+    parser.add_argument('output', help="куда писать лог")
+    parser.add_argument('--size', type=parse_size, default=parse_size('10MB'),
+                        help="размер лога: 10MB, 1GB, 10GB … (по умолчанию 10MB)")
+    parser.add_argument('--sample', default=str(DEFAULT_SAMPLE), help="образец (по умолчанию logs/tf.json)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--malformed-rate', type=float, default=0.001,
+                        help="доля оборванных (невалидных JSON) строк (по умолчанию 0.001)")
+    parser.add_argument('--run-size', type=parse_size, default=parse_size('64MB'),
+                        help="размер одного прогона terraform (пролог…эпилог) в логе")
+    args = parser.parse_args()
+
+    stats = generate(args.output, args.size, sample=args.sample, seed=args.seed,
+                     malformed_rate=args.malformed_rate, run_size=args.run_size)
+    json.dump(stats, sys.stdout, ensure_ascii=False, indent=2)
+    print()
@@ -0,0 +1,235 @@
+"""
+columnar.py
+Колоночный вывод разобранных записей: Parquet или Arrow IPC (файл Feather v2).
+
+В отличие от JSONL, запись не сериализуется целиком: поля раскладываются по типизированным
+колонкам, а исходная строка лога кладётся как есть в отдельную колонку raw_json —
+ту, что читать не нужно, пока запись не развернули.
+
+    lineno            int64
+    ts_ns             timestamp[ns, UTC]   — разобранный timestamp (null — нет метки)
+    timestamp         string               — исходная строка метки (с часовым поясом лога)
+    level, section,
+    tf_rpc, tf_resource_type,
+    tf_provider_addr  dictionary<int32, string>
+    tf_req_id, message, raw_json  string
+    _timestamp_guessed, _level_guessed, _section_start, _section_end,
+    has_req_body, has_res_body, parse_error  bool
+
+Словари категорий общие на весь файл и только растут, поэтому Arrow пишет в следующих
+пачках лишь дельты словаря. Arrow-файл без сжатия читается через memory map без копирования,
+Parquet сжат zstd; и тот и другой можно читать только нужными колонками (read_table(columns=…)).
+
+pyarrow — необязательная зависимость: нужен только для этих форматов.
+"""
+
+import json
+from pathlib import Path
+
+from timestamps import NAT, parse_ts_column
+
+try:
+    import numpy as np
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+FORMATS = ('parquet', 'arrow')
+FORMAT_SUFFIXES = {'.parquet': 'parquet', '.arrow': 'arrow', '.feather': 'arrow'}
+PARQUET_MAGIC = b'PAR1'
+ARROW_MAGIC = b'ARROW1'
+BATCH_ROWS = 64 * 1024  # записей в пачке Arrow / группе строк Parquet
+
+CATEGORY_COLUMNS = ('level', 'section', 'tf_rpc', 'tf_resource_type', 'tf_provider_addr')
+TEXT_COLUMNS = ('timestamp', 'tf_req_id', 'message', 'raw_json')
+FLAG_COLUMNS = ('_timestamp_guessed', '_level_guessed', '_section_start', '_section_end',
+                'has_req_body', 'has_res_body', 'parse_error')
+COLUMNS = ('lineno', 'ts_ns', 'timestamp', 'level', 'section', 'tf_rpc', 'tf_resource_type',
+           'tf_provider_addr', 'tf_req_id', 'message') + FLAG_COLUMNS + ('raw_json',)
+
+
+def _require():
+    if pa is None:
+        raise RuntimeError("для Parquet / Arrow нужен пакет pyarrow: pip install pyarrow")
+
+
+def schema():
+    _require()
+    types = {'lineno': pa.int64(), 'ts_ns': pa.timestamp('ns', tz='UTC')}
+    types.update({c: pa.dictionary(pa.int32(), pa.string()) for c in CATEGORY_COLUMNS})
+    types.update({c: pa.string() for c in TEXT_COLUMNS})
+    types.update({c: pa.bool_() for c in FLAG_COLUMNS})
+    return pa.schema([(c, types[c]) for c in COLUMNS])
+
+
+def format_for_path(path):
+    """Формат по расширению выходного файла: .parquet / .arrow / .feather, иначе None (JSONL)."""
+    return FORMAT_SUFFIXES.get(Path(path).suffix.lower())
+
+
+def detect_format(path):
+    """'parquet' / 'arrow' по магическим байтам, None — не колоночный файл."""
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(len(ARROW_MAGIC))
+    except OSError:
+        return None
+    if head.startswith(PARQUET_MAGIC):
+        return 'parquet'
+    if head.startswith(ARROW_MAGIC):
+        return 'arrow'
+    return None
+
+
+def _text(value):
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value, ensure_ascii=False)
+
+
+class ColumnarWriter:
+    """
+    Копит записи build_record пачками по BATCH_ROWS и пишет их колонками.
+    add(record, raw_line) — одна запись; add_batch(batch) — готовая пачка из другого
+    ColumnarWriter (куски параллельного разбора), её категории перекодируются в общие словари.
+    """
+
+    def __init__(self, path, fmt=None, batch_rows=BATCH_ROWS):
+        _require()
+        self.path = Path(path)
+        self.fmt = fmt or format_for_path(path) or 'parquet'
+        self.batch_rows = batch_rows
+        self.schema = schema()
+        self.rows = 0
+        # значение -> код, на весь файл. В Arrow переход от пустого словаря к непустому
+        # считается заменой словаря (в IPC-файле запрещена), поэтому там словарь
+        # с самого начала содержит '' — лишнее значение, на которое может и не быть ссылок.
+        self._dicts = {c: ({'': 0} if self.fmt == 'arrow' else {}) for c in CATEGORY_COLUMNS}
+        self._reset()
+        if self.fmt == 'parquet':
+            self._writer = pq.ParquetWriter(self.path, self.schema, compression='zstd')
+        elif self.fmt == 'arrow':
+            self._writer = ipc.new_file(self.path, self.schema,
+                                        options=ipc.IpcWriteOptions(emit_dictionary_deltas=True))
+        else:
+            raise ValueError(f"неизвестный формат: {self.fmt!r} (есть: {', '.join(FORMATS)})")
+
+    def _reset(self):
+        self._cols = {c: [] for c in COLUMNS if c != 'ts_ns'}
+
+    def add(self, record, raw_line):
+        obj = record['raw_full_json']
+        cols = self._cols
+        cols['lineno'].append(record['lineno'])
+        cols['timestamp'].append(record['timestamp'])  # _text — при сборке пачки, после разбора ts
+        for c, value in (('level', record['level']), ('section', record['section']),
+                         ('tf_rpc', obj.get('tf_rpc')), ('tf_resource_type', obj.get('tf_resource_type')),
+                         ('tf_provider_addr', obj.get('tf_provider_addr'))):
+            if value is not None:
+                codes = self._dicts[c]
+                value = _text(value)
+                code = codes.get(value)
+                if code is None:
+                    code = codes[value] = len(codes)
+                value = code
+            cols[c].append(value)
+        cols['tf_req_id'].append(_text(record['tf_req_id']))
+        cols['message'].append(_text(record['message']))
+        cols['raw_json'].append(raw_line)
+        cols['_timestamp_guessed'].append(record['_timestamp_guessed'])
+        cols['_level_guessed'].append(record['_level_guessed'])
+        cols['_section_start'].append(record['_section_start'])
+        cols['_section_end'].append(record['_section_end'])
+        cols['has_req_body'].append(record['tf_http_req_body'] is not None)
+        cols['has_res_body'].append(record['tf_http_res_body'] is not None)
+        cols['parse_error'].append('_parse_error' in obj)
+        if len(cols['lineno']) >= self.batch_rows:
+            self.flush()
+
+    def _dictionary(self, c):
+        return pa.array(list(self._dicts[c]), type=pa.string())
+
+    def flush(self):
+        cols = self._cols
+        n = len(cols['lineno'])
+        if not n:
+            return
+        ts_ns = parse_ts_column(cols['timestamp'])
+        arrays = []
+        for c in COLUMNS:
+            if c == 'ts_ns':
+                arrays.append(pa.array(ts_ns, type=self.schema.field(c).type, mask=ts_ns == NAT))
+            elif c in CATEGORY_COLUMNS:
+                indices = pa.array(cols[c], type=pa.int32())
+                arrays.append(pa.DictionaryArray.from_arrays(indices, self._dictionary(c)))
+            elif c == 'timestamp':
+                arrays.append(pa.array([_text(v) for v in cols[c]], type=pa.string()))
+            else:
+                arrays.append(pa.array(cols[c], type=self.schema.field(c).type))
+        self._write(pa.record_batch(arrays, schema=self.schema))
+        self._reset()
+
+    def _write(self, batch):
+        if self.fmt == 'parquet':
+            self._writer.write_batch(batch, row_group_size=self.batch_rows)
+        else:
+            self._writer.write_batch(batch)
+        self.rows += batch.num_rows
+
+    def add_batch(self, batch):
+        """Пачка со схемой schema(): категории перекодируются в словари этого файла."""
+        self.flush()  # порядок записей сохраняется
+        arrays = []
+        for c in COLUMNS:
+            column = batch.column(c)
+            if c in CATEGORY_COLUMNS:
+                codes = self._dicts[c]
+                # код куска -> код файла; лишний 0 в конце — для null (пустой словарь тоже)
+                remap = np.array([codes.setdefault(v, len(codes)) for v in column.dictionary.to_pylist()] + [0],
+                                 dtype=np.int32)
+                indices = column.indices
+                mapped = remap[indices.fill_null(0).to_numpy()]
+                column = pa.DictionaryArray.from_arrays(
+                    pa.array(mapped, type=pa.int32(), mask=indices.is_null().to_numpy(zero_copy_only=False)),
+                    self._dictionary(c))
+            arrays.append(column)
+        self._write(pa.record_batch(arrays, schema=self.schema))
+
+    def close(self):
+        self.flush()
+        self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_batches(path):
+    """Пачки Arrow-файла по очереди (memory map, без копирования)."""
+    _require()
+    with pa.memory_map(str(path)) as source:
+        reader = ipc.open_file(source)
+        for i in range(reader.num_record_batches):
+            yield reader.get_batch(i)
+
+
+def read_table(path, columns=None):
+    """
+    Таблица pyarrow из Parquet / Arrow (формат — по магическим байтам).
+    columns — читать только эти колонки: для Parquet остальные не читаются с диска,
+    Arrow отображается в память целиком, но страницы ненужных колонок не подгружаются.
+    """
+    _require()
+    if detect_format(path) == 'arrow':
+        table = ipc.open_file(pa.memory_map(str(path))).read_all()
+        return table.select(list(columns)) if columns else table
+    return pq.read_table(path, columns=list(columns) if columns else None, memory_map=True)
+
+
+def ts_ns_column(table):
+    """Колонка ts_ns как numpy int64 epoch ns (NAT вместо null) — как parse_ts_column."""
+    return table.column('ts_ns').cast(pa.int64()).fill_null(NAT).to_numpy()
@@ -0,0 +1,162 @@
+"""
+line_scanner.py
+Построчное чтение входного лога байтами, без текстового слоя.
+
+Несжатый файл отображается в память (mmap) и режется на строки прямо по страницам файла,
+без буферов TextIOWrapper; строка отдаётся как bytes вместе с её байтовым смещением — его
+хранит сайдкар-индекс (исходная строка потом читается одним seek'ом).
+
+Пройденные страницы отдаются обратно ядру (madvise MADV_DONTNEED) каждые RELEASE_BYTES,
+так что RSS не растёт с размером файла. Сжатый вход (gzip / zstd) отобразить нельзя —
+он читается потоком блоками по READ_BLOCK, смещения у его строк — None.
+
+Строки режутся так же, как их режет текстовый режим open(): '\\n', '\\r\\n' и одиночный '\\r'.
+"""
+
+import mmap
+import os
+from itertools import accumulate, chain, count, repeat, starmap
+from operator import add
+
+from compressed_io import file_codec, open_input_bytes
+
+RELEASE_BYTES = 16 * 1024 * 1024  # сколько пройти, прежде чем отпустить страницы
+SCAN_BLOCK = 64 * 1024            # блок разбиения на строки: помещается в кэш L2
+READ_BLOCK = 1024 * 1024          # блок чтения сжатого потока
+_CAN_RELEASE = hasattr(mmap, 'MADV_DONTNEED')
+
+
+def _split_cr(offset, line):
+    """Строка, в которой есть '\\r': '\\r\\n' в конце — один перевод строки, '\\r' внутри — ещё строки."""
+    if line.endswith(b'\r'):
+        line = line[:-1]
+    for part in line.split(b'\r'):
+        yield offset, part
+        offset += len(part) + 1
+
+
+def scan_lines(path, start=0, end=None, release_bytes=RELEASE_BYTES, block=SCAN_BLOCK):
+    """
+    Итератор (смещение, строка без перевода строки) по строкам несжатого файла в [start, end)
+    — включая пустые, чтобы номера строк совпадали с enumerate(open(path)).
+    start должен быть началом строки, end — концом строки или файла (см. split_into_chunks).
+    Файл режется на строки блоками по block байт (bytes.split), а строки блока отдаются
+    итераторами на C, без цикла Python по строкам.
+    """
+    return chain.from_iterable(starmap(block_lines, scan_blocks(path, start, end, release_bytes, block)))
+
+
+def block_lines(pos, data):
+    """
+    Строки блока scan_blocks / stream_blocks: итератор (смещение, строка); pos=None — смещений нет.
+    """
+    lines = data.split(b'\n')
+    if pos is None:
+        if b'\r' in data:
+            return [(None, part) for line in lines for _, part in _split_cr(0, line)]
+        return zip(repeat(None), lines)
+    # смещение i-й строки = pos + длины предыдущих строк + i переводов строки
+    offsets = map(add, accumulate(map(len, lines), initial=pos), count())
+    if b'\r' in data:
+        return [item for offset, line in zip(offsets, lines) for item in _split_cr(offset, line)]
+    return zip(offsets, lines)
+
+
+def scan_blocks(path, start=0, end=None, release_bytes=RELEASE_BYTES, block=SCAN_BLOCK):
+    """
+    Блоки (смещение, байты) несжатого файла в [start, end): целые строки через '\n', без перевода
+    строки после последней. На строки их делит block_lines; фильтры (main.LineFilter) ищут
+    подстроки сразу по всему блоку и разбивают на строки только его кандидатов.
+    """
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        end = size if end is None else min(end, size)
+        if start >= end:
+            return  # mmap пустого файла невозможен
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if _CAN_RELEASE:
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            released = start - start % mmap.PAGESIZE
+            pos = start
+            while pos < end:
+                # Блок заканчивается на последнем '\n' в окне; строка длиннее окна — целиком
+                stop = min(pos + block, end)
+                if stop < end:
+                    cut = mm.rfind(b'\n', pos, stop)
+                    if cut < 0:
+                        cut = mm.find(b'\n', stop, end)
+                    stop = end if cut < 0 else cut
+                elif mm[end - 1] == 0x0a:
+                    stop = end - 1  # перевод строки в конце файла не начинает новую строку
+                yield pos, mm[pos:stop]
+                pos = stop + 1
+                if _CAN_RELEASE and pos - released >= release_bytes:
+                    upto = min(pos, end) - min(pos, end) % mmap.PAGESIZE
+                    mm.madvise(mmap.MADV_DONTNEED, released, upto - released)
+                    released = upto
+
+
+def stream_lines(stream, block=READ_BLOCK):
+    """(None, строка) для бинарного потока — то же деление на строки, что у scan_lines."""
+    tail = b''
+    while True:
+        data = stream.read(block)
+        if not data:
+            break
+        data = tail + data
+        cut = data.rfind(b'\n')
+        if cut < 0:
+            tail = data
+            continue
+        tail = data[cut + 1:]
+        for line in data[:cut].split(b'\n'):
+            if b'\r' in line:
+                for _, part in _split_cr(0, line):
+                    yield None, part
+            else:
+                yield None, line
+    if tail:
+        for _, part in _split_cr(0, tail):
+            yield None, part
+
+
+def stream_blocks(stream, block=READ_BLOCK):
+    """(None, блок целых строк) бинарного потока — как scan_blocks, но без смещений."""
+    tail = b''
+    while True:
+        data = stream.read(block)
+        if not data:
+            break
+        data = tail + data
+        cut = data.rfind(b'\n')
+        if cut < 0:
+            tail = data
+            continue
+        tail = data[cut + 1:]
+        yield None, data[:cut]
+    if tail:
+        yield None, tail
+
+
+def iter_lines(path):
+    """Строки входного лога: mmap для несжатого файла, потоковая распаковка — для сжатого."""
+    if file_codec(path) is None:
+        return scan_lines(path)
+    return _iter_stream(path)
+
+
+def _iter_stream(path):
+    with open_input_bytes(path) as stream:
+        yield from stream_lines(stream)
+
+
+def iter_blocks(path, block=READ_BLOCK):
+    """Блоки строк входного лога (см. scan_blocks): mmap для несжатого файла, поток — для сжатого."""
+    if file_codec(path) is None:
+        return scan_blocks(path, block=block)
+    return _iter_stream_blocks(path, block)
+
+
+def _iter_stream_blocks(path, block):
+    with open_input_bytes(path) as stream:
+        yield from stream_blocks(stream, block)
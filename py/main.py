@@ -1,9 +1,31 @@
+import argparse
+import glob
+import heapq
+import io
 import json
+import os
 import re
+import shutil
+import tempfile
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
 from datetime import datetime
 from collections import defaultdict
+from itertools import accumulate, count, islice, repeat
+from operator import add, itemgetter
 from pathlib import Path
-import sys
+
+from columnar import FORMATS, ColumnarWriter, format_for_path, read_batches
+from compressed_io import CODECS, codec_for_path, compress_block, file_codec, open_output
+from line_scanner import READ_BLOCK, block_lines, iter_blocks, iter_lines, scan_lines
+from metrics import Metrics, SamplingProfiler
+from phrase_matcher import PhraseMatcher
+from request_groups import GROUP_MEMORY_BYTES, GroupStore, closes_request
+from sampling import ERROR_LEVELS, SAMPLED_LEVELS, Sampler, combine_stats as combine_sampling_stats
+from sidecar_index import IndexWriter, index_entry
+from timestamps import NAT, TF_TS_LEN, parse_ts_ns
 
 ISO_TS_RE = re.compile(
     r'\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(?:[\.,]\d{3,6})?(?:Z|[+-]\d{2}(?::\d{2})?)?'
@@ -19,6 +41,27 @@ PLAN_END_PHRASES = ['Plan is complete', 'Plan is not applyable', 'plan operation
 APPLY_START_PHRASES = ['apply', '"apply"', 'Apply operation', 'starting Apply operation']
 APPLY_END_PHRASES = ['apply operation completed', 'Apply operation completed', 'backend/local: plan calling Plan']
 
+# Все таблицы фраз собраны в один предкомпилированный матчер: сообщение сканируется один раз.
+# Ключевые слова уровней — отдельным матчером: они нужны только когда нет явного @level.
+SECTION_MATCHER = PhraseMatcher({
+    'cli_args': ['cli args', 'cli command args'],
+    'plan': ['plan'],
+    'apply': ['apply'],
+    'plan_start': [p.lower() for p in PLAN_START_PHRASES],
+    'apply_start': [p.lower() for p in APPLY_START_PHRASES],
+    'plan_end': [p.lower() for p in PLAN_END_PHRASES],
+    'apply_end': [p.lower() for p in APPLY_END_PHRASES],
+})
+CLI_ARGS_BIT = SECTION_MATCHER.bits['cli_args']
+PLAN_BIT = SECTION_MATCHER.bits['plan']
+APPLY_BIT = SECTION_MATCHER.bits['apply']
+PLAN_START_BIT = SECTION_MATCHER.bits['plan_start']
+APPLY_START_BIT = SECTION_MATCHER.bits['apply_start']
+PLAN_END_BIT = SECTION_MATCHER.bits['plan_end']
+APPLY_END_BIT = SECTION_MATCHER.bits['apply_end']
+LEVEL_MATCHER = PhraseMatcher({kw: [kw] for kw in LEVEL_KEYWORDS})
+LEVEL_BITS = [(LEVEL_MATCHER.bits[kw], lvl) for kw, lvl in LEVEL_KEYWORDS.items()]
+
 def guess_timestamp(obj):
     """
     Пытается угадать временную метку из объекта лога.
@@ -46,9 +89,9 @@ def guess_level(obj):
         if key in obj and obj[key]:
             return str(obj[key]).lower(), False # Не угадан, найден явно
     # 2) поиск ключевых слов в @message
-    msg = (obj.get('@message') or obj.get('message') or '').lower()
-    for kw, lvl in LEVEL_KEYWORDS.items():
-        if kw in msg:
+    flags = LEVEL_MATCHER.match(obj.get('@message') or obj.get('message') or '')
+    for bit, lvl in LEVEL_BITS: # порядок LEVEL_KEYWORDS = приоритет
+        if flags & bit:
             return lvl, True # Угадан из сообщения
     # 3) дефолт
     return 'info', False # По умолчанию, не угадан
@@ -58,126 +101,517 @@ def detect_section(obj, current_section):
     Определяет текущую секцию (None / 'plan' / 'apply').
     Возвращает новый state (может быть тот же).
     """
-    msg = (obj.get('@message') or obj.get('message') or '').lower()
+    flags = SECTION_MATCHER.match(obj.get('@message') or obj.get('message') or '')
+    if not flags:
+        return current_section  # Ни одной фразы — без изменений
     
     # Приоритет CLI args, так как они более явные
-    if 'cli args' in msg or 'cli command args' in msg:
-        if 'plan' in msg and current_section != 'plan': # Если уже в plan, не переключаем
+    if flags & CLI_ARGS_BIT:
+        if flags & PLAN_BIT and current_section != 'plan': # Если уже в plan, не переключаем
             return 'plan'
-        if 'apply' in msg and current_section != 'apply': # Если уже в apply, не переключаем
+        if flags & APPLY_BIT and current_section != 'apply': # Если уже в apply, не переключаем
             return 'apply'
             
     # По фразам для начала секций
-    if any(p.lower() in msg for p in PLAN_START_PHRASES) and current_section != 'plan':
+    if flags & PLAN_START_BIT and current_section != 'plan':
         return 'plan'
-    if any(p.lower() in msg for p in APPLY_START_PHRASES) and current_section != 'apply':
+    if flags & APPLY_START_BIT and current_section != 'apply':
         return 'apply'
     
     # По фразам для окончания секций
-    if any(p.lower() in msg for p in PLAN_END_PHRASES) and current_section == 'plan':
+    if flags & PLAN_END_BIT and current_section == 'plan':
         return None # Завершаем секцию plan
-    if any(p.lower() in msg for p in APPLY_END_PHRASES) and current_section == 'apply':
+    if flags & APPLY_END_BIT and current_section == 'apply':
         return None # Завершаем секцию apply
         
     return current_section  # Без изменений
 
-def safe_parse_json_field(s):
-    """Если поле пустое — вернуть None. Если строка выглядит как JSON — распарсить."""
-    if not s:
+def body_stub(obj, field):
+    """
+    Заглушка HTTP-тела в записи: без разбора, только признак и размер сырой строки —
+    {'hidden': True, 'size': n} вместо прежнего {'hidden': True, 'value': разобранное тело}.
+    Само тело — строка raw_full_json[field]; раскрывает её тот, кто показывает запись
+    (просмотрщик — через BodyCache, по клику).
+    """
+    raw = obj.get(field)
+    return {'hidden': True, 'size': len(raw) if isinstance(raw, str) else None}
+
+_decode_json = json.JSONDecoder().decode  # то же, что json.loads(str) без именованных аргументов
+
+def parse_line(raw_line):
+    """
+    Разбирает одну (уже очищенную strip()) строку лога.
+    Возвращает (obj, parse_error), где parse_error = True, если строка не валидный JSON.
+    """
+    try:
+        return json.loads(raw_line), False
+    except json.JSONDecodeError as e:
+        # Если строка не валидна, создаем минимальный объект с сообщением и ошибкой
+        return {'@message': raw_line, '_parse_error': str(e)}, True
+
+def parse_raw_line(raw):
+    """
+    Разбирает строку лога в байтах (из line_scanner, без перевода строки).
+    Возвращает (obj, parse_error, raw_line), где raw_line — строка после strip(); obj = None — пустая строка.
+
+    json.loads(bytes) внутри всё равно декодирует строку, причём медленнее, чем bytes.decode(),
+    поэтому строка декодируется здесь и сразу уходит в JSONDecoder.decode — без проверок типа
+    и BOM в json.loads. Всё, что не начинается с '{', и невалидный JSON идут через parse_line:
+    текст ошибки в _parse_error тот же, что при чтении файла в текстовом режиме.
+    """
+    raw_line = raw.decode('utf-8').strip()
+    if raw_line[:1] == '{':
+        try:
+            return _decode_json(raw_line), False, raw_line
+        except ValueError:
+            pass
+    if not raw_line:
+        return None, False, None
+    return (*parse_line(raw_line), raw_line)
+
+def build_record(lineno, obj, ts, ts_guessed, level, level_guessed, old_section, current_section, source=None):
+    """Собирает итоговую запись для выходного JSONL из разобранного объекта; source — метка входного файла."""
+    record = {
+        'lineno': lineno,
+        'timestamp': ts,
+        '_timestamp_guessed': ts_guessed, # Добавлено для демонстрации
+        'level': level,
+        '_level_guessed': level_guessed,   # Добавлено для демонстрации
+        'section': current_section,
+        # Если секция изменилась, помечаем начало/конец
+        '_section_start': (current_section is not None and old_section != current_section),
+        '_section_end': (current_section is None and old_section is not None),
+        'message': obj.get('@message') or obj.get('message'),
+        'raw_full_json': obj, # Сохраняем полный исходный объект для детального анализа
+
+        # HTTP bodies: не раскрываем автоматически, пометим hidden=True
+        # Само тело остаётся строкой в raw_full_json и раскрывается только по запросу (см. body_stub)
+        'tf_http_req_body': body_stub(obj, 'tf_http_req_body') if 'tf_http_req_body' in obj else None,
+        'tf_http_res_body': body_stub(obj, 'tf_http_res_body') if 'tf_http_res_body' in obj else None,
+
+        'tf_req_id': obj.get('tf_req_id') or obj.get('tf_http_trans_id') or None,
+    }
+    if source is not None:
+        record['source'] = source  # последним полем: на это рассчитывает _merge_keys
+    return record
+
+# ---------- Фильтры (выталкивание предикатов в разбор) ----------
+# Строка, не прошедшая фильтр, не декодируется вовсе: подстроки ищутся сразу по блоку байт
+# (bytes.find на C), а JSON разбирается только у строк-кандидатов. Байтовые проверки —
+# необходимое условие, точная проверка — по собранной записи (LineFilter.matches).
+#
+# Секция — состояние, протянутое через весь файл, поэтому отброшенная строка всё равно
+# декодируется, если может её сменить: detect_section меняет секцию только по фразам
+# с 'plan' / 'apply' или по 'cli command args' (одно 'cli args' без plan / apply ничего не меняет).
+# Каждая фраза секций обязана содержать один из триггеров (проверяет tests/test_filters.py).
+SECTION_TRIGGERS = (b'plan', b'apply', b'cli command args')
+# Go (encoding/json) пишет <, > и & как \u003c, \u003e, \u0026, другие кодировщики — ещё и не-ASCII:
+# искомое значение с такими символами может не найтись в байтах строки. Если они есть,
+# строки с \u проходят мимо байтовых проверок и проверяются только по записи
+ESCAPABLE_RE = re.compile(rb'[<>&\x00-\x1f\x7f-\xff]')
+JSON_ESCAPE = b'\\u'
+MESSAGE_KEY = b'"@message"'
+# Строка hclog, уровень которой известен без разбора: один объект '{...}', ключи по алфавиту
+# ("@caller" — единственный перед "@level"), ключ @level один, значение — ASCII без экранирования
+LEVEL_LINE_RE = re.compile(rb'\{(?:"@caller":"[^"\\\n]*",)?"@level":"([\x20\x21\x23-\x5b\x5d-\x7e]+)"'
+                           rb'(?![^\n]*"@level")[^\n]*\}(?:\n|\Z)')
+TS_FIELD_RE = re.compile(rb'"@timestamp" *: *"([^"\\\n]+)"')  # пустая метка — guess_timestamp возьмёт другое поле
+FILTER_BLOCK = READ_BLOCK  # блок поиска: чем больше, тем меньше накладных расходов Python на блок
+
+# Что делать со строкой, отданной LineFilter.lines (третье поле в строках process_file)
+LINE_FULL = 0     # разобрать и проверить запись
+LINE_TRACK = 1    # не подходит, но может сменить секцию — только detect_section
+LINE_QUIET = 2    # как LINE_FULL, но секцию не меняет: вне нужных секций не декодируется
+
+def _line_starts(data, patterns):
+    """Смещения начал строк блока data, в которых есть хотя бы одна из patterns."""
+    found = set()
+    for pattern in patterns:
+        pos = data.find(pattern)
+        while pos >= 0:
+            found.add(data.rfind(b'\n', 0, pos) + 1)
+            end = data.find(b'\n', pos)  # остальные вхождения в этой строке уже не нужны
+            pos = data.find(pattern, end + 1) if end >= 0 else -1
+    return found
+
+def _string_field(lowered, start, key):
+    """
+    Границы (first, last) значения строкового поля key (b'"@message"') в строке блока, которая
+    начинается в start, — или None, если по байтам его не определить: строка не один объект
+    '{...}' (неразобранный JSON), ключ встречается не один раз или записан не как "key":"...".
+    Значение lowered[first:last] — ещё с JSON-экранированием.
+    """
+    end = lowered.find(b'\n', start)
+    end = len(lowered) if end < 0 else end
+    if lowered[start] != 0x7b or lowered[end - 1] != 0x7d:  # '{' ... '}'
+        return None
+    at = lowered.find(key, start, end)
+    first = at + len(key) + 2
+    if at < 0 or lowered.find(key, at + 1, end) >= 0 or lowered[first - 2:first] != b':"':
+        return None
+    last = lowered.find(b'"', first, end)
+    while last > 0:
+        slashes = 0
+        while lowered[last - 1 - slashes] == 0x5c:
+            slashes += 1
+        if slashes % 2 == 0:  # кавычка не экранирована
+            return first, last
+        last = lowered.find(b'"', last + 1, end)
+    return None
+
+def _may_change_section(lowered, start):
+    """
+    Может ли строка блока (в нижнем регистре), где нашёлся один из SECTION_TRIGGERS, сменить
+    секцию. Часто слово стоит не в сообщении, а в других полях ("tf_rpc":"PlanResourceChange"):
+    если строка — один цельный объект с одним непустым @message без триггеров, она секцию не меняет.
+    Всё остальное (неразобранный JSON — там сообщение вся строка) решает detect_section.
+    """
+    bounds = _string_field(lowered, start, MESSAGE_KEY)
+    if bounds is None or bounds[0] == bounds[1]:
+        return True  # пустое @message — detect_section возьмёт поле message
+    return any(lowered.find(t, *bounds) >= 0 for t in SECTION_TRIGGERS)
+
+def _explicit_level(data, lowered, start):
+    """
+    Явный @level строки блока (в нижнем регистре), как его вернёт guess_level, или None — решит разбор.
+    Совпадение с LEVEL_LINE_RE ещё не значит, что строка — JSON: у обрезанной строки, которая
+    случайно кончается на '}', разбор упадёт, и уровень угадает guess_level по тексту. Поэтому
+    строка (исходные байты — нижний регистр мог бы «починить» TRUE или \\U) ещё и декодируется.
+    """
+    m = LEVEL_LINE_RE.match(lowered, start)
+    if m is None:
         return None
-    if isinstance(s, dict): # Если это уже объект JSON, возвращаем как есть
-        return s
     try:
-        return json.loads(s)
-    except json.JSONDecodeError:
-        # Иногда в логах кавычки экранированы или есть другие проблемы.
-        # Пробуем более "мягкие" замены, если это строка.
-        if isinstance(s, str):
-            try:
-                # Попытка заменить одинарные кавычки на двойные
-                return json.loads(s.replace("'", '"'))
-            except json.JSONDecodeError:
-                pass # Пропускаем, если не удалось
-        return s  # Оставляем как строку, если не удалось распарсить
-
-def process_file(path_in, path_out):
+        _decode_json(data[start:m.end()].decode('utf-8'))
+    except ValueError:  # и UnicodeDecodeError
+        return None
+    return m.group(1).decode('ascii')
+
+def _line_blocks(path_in):
+    """
+    Блоки входа для байтовых проверок: (смещение блока, данные, items). Если в блоке есть '\r',
+    строки режутся как у scan_lines ('\r' — тоже перевод строки): данные собираются заново
+    через '\n', items — [(смещение, строка)] по порядку строк; иначе items = None.
+    """
+    for pos, data in iter_blocks(path_in, FILTER_BLOCK):
+        if b'\r' in data:
+            items = list(block_lines(pos, data))
+            yield pos, b'\n'.join(line for _, line in items), items
+        else:
+            yield pos, data, None
+
+def _picked_lines(pos, data, items, starts):
+    """(номер строки в блоке от 0, (смещение, строка), начало строки) для отсортированных начал starts."""
+    n = last = 0
+    for start in starts:
+        n += data.count(b'\n', last, start)
+        last = start
+        if items is not None:
+            yield n, items[n], start
+        else:
+            end = data.find(b'\n', start)
+            yield n, (None if pos is None else pos + start, data[start:end] if end >= 0 else data[start:]), start
+
+def level_words(levels):
+    """
+    Подстроки (в нижнем регистре), без одной из которых строка не получит уровень из levels:
+    явный @level содержит имя уровня, угаданный — одно из ключевых слов guess_level.
+    """
+    words = set(levels) | {kw for kw, lvl in LEVEL_KEYWORDS.items() if lvl in levels}
+    return [w.encode('utf-8') for w in words]
+
+def _all_starts(data):
+    """Смещения начал всех строк блока."""
+    lines = data.split(b'\n')
+    return list(map(add, accumulate(map(len, lines[:-1]), initial=0), count()))
+
+class LineFilter:
+    """
+    Фильтр записей для process_file. Значения внутри одного поля — «или», поля — «и».
+    levels / sections / req_ids / resource_types — допустимые значения (None — без условия;
+    секция вне plan/apply — 'none'); since / until — границы времени записи, epoch ns,
+    включительно (запись без разбираемой метки времени при этом отбрасывается);
+    grep — подстроки исходной строки (как в файле: байты, с учётом регистра).
+    """
+
+    def __init__(self, levels=None, sections=None, req_ids=None, resource_types=None,
+                 since=None, until=None, grep=None):
+        self.levels = {lvl.lower() for lvl in levels} if levels else None
+        self.sections = {None if s == 'none' else s for s in sections} if sections else None
+        self.req_ids = set(req_ids) if req_ids else None
+        self.resource_types = set(resource_types) if resource_types else None
+        self.since = since
+        self.until = until
+        self.grep = [g.encode('utf-8') for g in grep] if grep else None
+        self.lines_seen = 0
+
+        # Байтовые проверки: [(подстроки, искать ли в строке, приведённой к нижнему регистру,
+        # уточнение по строке — check(data, lowered, start) или None)]
+        self._prefilters = []
+        if self.levels and 'info' not in self.levels:  # 'info' — уровень по умолчанию, признака нет
+            self._prefilters.append((level_words(self.levels), True, self._level_possible))
+        for values in (self.req_ids, self.resource_types):
+            if values:
+                self._prefilters.append(([json.dumps(v, ensure_ascii=False).encode('utf-8') for v in values],
+                                         False, None))
+        # grep ищет в байтах строки как есть — экранирование ему не помеха
+        self._escapes = any(ESCAPABLE_RE.search(p[1:-1] if not lower else p)
+                            for patterns, lower, _ in self._prefilters for p in patterns)
+        if self.grep:
+            self._prefilters.append((self.grep, False, None))
+
+    def __bool__(self):
+        return any(v is not None for v in (self.levels, self.sections, self.req_ids, self.resource_types,
+                                           self.since, self.until, self.grep))
+
+    def _level_possible(self, data, lowered, start):
+        level = _explicit_level(data, lowered, start)
+        return level is None or level in self.levels
+
+    def _in_time(self, ts_ns):
+        return (ts_ns is not None and (self.since is None or ts_ns >= self.since)
+                and (self.until is None or ts_ns <= self.until))
+
+    def candidates(self, data):
+        """
+        Байтовые проверки блока: (начала строк, которые могут пройти фильтр, или None — все строки;
+        начала строк, которые могут сменить секцию).
+        """
+        lowered = data.lower()
+        track = {start for start in _line_starts(lowered, SECTION_TRIGGERS) if _may_change_section(lowered, start)}
+        keep = None
+        for patterns, lower, check in self._prefilters:
+            found = _line_starts(lowered if lower else data, patterns)
+            if check is not None:
+                found = {start for start in found if check(data, lowered, start)}
+            keep = found if keep is None else keep & found
+        if self.since is not None or self.until is not None:
+            # @timestamp — главный источник метки (guess_timestamp); строки без него проверит запись.
+            # Первое вхождение в строке — поле верхнего уровня: вложенные объекты идут после него
+            seen, late = set(), set()
+            for m in TS_FIELD_RE.finditer(data):
+                start = data.rfind(b'\n', 0, m.start()) + 1
+                if start not in seen:
+                    seen.add(start)
+                    if not self._in_time(parse_ts_ns(m.group(1).decode('utf-8', 'replace'))):
+                        late.add(start)
+            if late:
+                keep = (set(_all_starts(data)) if keep is None else keep) - late
+        if keep is not None and self._escapes:
+            keep |= _line_starts(data, (JSON_ESCAPE,))
+        return keep, track
+
+    def lines(self, path_in):
+        """
+        Строки path_in, которые нужно декодировать: (номер строки, (смещение, строка), LINE_*).
+        Остальные строки только считаются; их общее число — в lines_seen после обхода.
+        """
+        base = 0
+        for pos, data, items in _line_blocks(path_in):
+            keep, track = self.candidates(data)
+            if keep is None and self.sections is None:
+                yield from zip(count(base + 1), items or block_lines(pos, data), repeat(LINE_FULL))
+            elif keep is None:
+                modes = (LINE_FULL if start in track else LINE_QUIET for start in _all_starts(data))
+                yield from zip(count(base + 1), items or block_lines(pos, data), modes)
+            else:
+                for n, item, start in _picked_lines(pos, data, items, sorted(keep | track)):
+                    if start not in keep:
+                        mode = LINE_TRACK
+                    elif self.sections is not None and start not in track:
+                        mode = LINE_QUIET
+                    else:
+                        mode = LINE_FULL
+                    yield base + n + 1, item, mode
+            base += data.count(b'\n') + 1
+        self.lines_seen = base
+
+    def matches(self, record, raw):
+        """Точная проверка собранной записи (build_record); raw — исходная строка в байтах."""
+        if self.levels is not None and record['level'] not in self.levels:
+            return False
+        if self.sections is not None and record['section'] not in self.sections:
+            return False
+        if self.req_ids is not None and record['tf_req_id'] not in self.req_ids:
+            return False
+        if self.resource_types is not None and record['raw_full_json'].get('tf_resource_type') not in self.resource_types:
+            return False
+        if (self.since is not None or self.until is not None) and not self._in_time(parse_ts_ns(record['timestamp'])):
+            return False
+        if self.grep is not None and not any(g in raw for g in self.grep):
+            return False
+        return True
+
+# ---------- Выборка trace/debug (см. sampling.py) ----------
+RPC_KEY = b'"tf_rpc"'
+
+def observe_sampling(path_in, sampler):
+    """
+    Первый проход выборки по файлу: запросы с ошибками и резервуары tf_rpc (Sampler.observe).
+    Декодируются только строки, в которых по байтам может быть ошибка (или, при резервуарах, tf_rpc
+    у trace/debug-записи) — остальные только считаются, как в LineFilter.lines.
+    """
+    error_words = level_words(ERROR_LEVELS) if sampler.keep_error_requests else ()
+    base = 0
+    for pos, data, items in _line_blocks(path_in):
+        lowered = data.lower()
+        starts = {start for start in _line_starts(lowered, error_words)
+                  if _explicit_level(data, lowered, start) in (None, *ERROR_LEVELS)}
+        if sampler.per_rpc is not None:
+            starts |= {start for start in _line_starts(data, (RPC_KEY,))
+                       if _explicit_level(data, lowered, start) in (None, *SAMPLED_LEVELS)}
+        for n, (_, raw), _ in _picked_lines(pos, data, items, sorted(starts)):
+            obj, _, _ = parse_raw_line(raw)
+            if obj is not None:
+                level, _ = guess_level(obj)
+                sampler.observe(base + n + 1, level, obj.get('tf_req_id') or obj.get('tf_http_trans_id') or None,
+                                obj.get('tf_rpc'))
+        base += data.count(b'\n') + 1
+    sampler.finish_observe()
+
+def open_records_output(path_out, fmt=None, compress=None):
+    """Куда писать записи: ColumnarWriter для parquet / arrow, иначе текстовый JSONL (возможно сжатый)."""
+    if fmt is not None:
+        return ColumnarWriter(path_out, fmt)
+    return open_output(path_out, compress)
+
+def process_file(path_in, path_out, workers=1, index=False, metrics=None, compress=None, fmt=None,
+                 group_memory=GROUP_MEMORY_BYTES, line_filter=None, sampler=None, source=None):
+    """
+    Парсит лог path_in и пишет записи в JSONL path_out.
+    При workers > 1 файл режется на куски по границам строк и разбирается в пуле процессов
+    (см. process_file_parallel); результат идентичен последовательному прогону.
+    index=True — рядом с path_out пишется сайдкар-индекс path_out.idx (см. sidecar_index.py).
+    metrics (metrics.Metrics) — копить время по стадиям и счётчики строк/байт/ошибок;
+    None — инструментирование выключено.
+
+    Сжатый вход (gzip / zstd, по магическим байтам) распаковывается потоково; резать его
+    на куски по смещениям нельзя, поэтому он всегда разбирается последовательно.
+    compress — 'gzip' / 'zstd' для сжатого вывода (None — по расширению path_out: .gz / .zst).
+    fmt — 'parquet' / 'arrow': колоночный вывод вместо JSONL (см. columnar.py; None — по
+    расширению path_out: .parquet / .arrow / .feather).
+
+    Группы по tf_req_id возвращаются как request_groups.GroupStore: в памяти не больше
+    group_memory байт записей, остальное — в сериях на диске, сливаемых при чтении групп.
+
+    line_filter (LineFilter) — писать только подходящие записи; статистика и группы — тоже
+    только по ним, total_lines — по всему файлу. Строки отбрасываются по байтам блока ещё
+    до декодирования, поэтому фильтрованный прогон упирается в чтение файла, а не в разбор
+    JSON, и идёт последовательно (workers не используется).
+
+    sampler (sampling.Sampler) — выборка trace/debug-записей: сначала отдельный проход по файлу
+    (observe_sampling), затем разбор, который пишет только выбранные записи. Итог выборки
+    по уровням — в stats['sampling'] (по нему числа пересчитываются на весь лог).
+
+    source — записать в каждую запись поле source (из какого файла она; см. process_files).
+    """
+    fmt = fmt or format_for_path(path_out)
+    compress = None if fmt else compress or codec_for_path(path_out)
+    if index and (compress or fmt):
+        raise ValueError("сайдкар-индекс хранит смещения в несжатом JSONL: --index несовместим со сжатием и --format")
+    if sampler is not None and sampler.needs_observe:
+        timer = metrics.timer() if metrics is not None else None
+        observe_sampling(path_in, sampler)
+        if timer: timer.lap('sample_observe')
+    if workers and workers > 1 and file_codec(path_in) is None and line_filter is None:
+        return process_file_parallel(path_in, path_out, workers, index=index, metrics=metrics,
+                                     compress=compress, fmt=fmt, group_memory=group_memory, sampler=sampler,
+                                     source=source)
+
     path_in = Path(path_in)
     path_out = Path(path_out)
     
     current_section = None
-    grouped_records = defaultdict(list)  # tf_req_id -> list of records
+    grouped_records = GroupStore(group_memory)  # tf_req_id -> records, с выгрузкой на диск
     
     section_stats = defaultdict(int)
     level_stats = defaultdict(int)
     guessed_ts_count = 0
     guessed_level_count = 0
     parse_error_count = 0
+    lineno = 0
+    record_count = 0
+    index_writer = IndexWriter(path_out, source=path_in) if index else None
+    timer = metrics.timer() if metrics is not None else None
+
+    if line_filter is None:
+        lines = zip(count(1), iter_lines(path_in), repeat(LINE_FULL))
+    else:
+        lines = line_filter.lines(path_in)
 
-    with path_in.open('r', encoding='utf-8') as fin, path_out.open('w', encoding='utf-8') as fout:
-        for lineno, raw_line in enumerate(fin, start=1):
-            raw_line = raw_line.strip()
-            if not raw_line:
+    with open_records_output(path_out, fmt, compress) as fout:
+        for lineno, (offset, raw), mode in lines:
+            if timer: timer.lap('read')
+            if mode == LINE_QUIET and current_section not in line_filter.sections:
                 continue
-            
-            obj = {}
-            try:
-                obj = json.loads(raw_line)
-            except json.JSONDecodeError as e:
-                # Если строка не валидна, создаем минимальный объект с сообщением и ошибкой
-                obj = {'@message': raw_line, '_parse_error': str(e)}
-                parse_error_count += 1
+
+            obj, parse_error, raw_line = parse_raw_line(raw)
+            if obj is None:
+                continue
+            if mode == LINE_TRACK:  # запись не нужна, но секцию сменить может
+                current_section = detect_section(obj, current_section)
+                continue
+            if timer: timer.lap('json_loads')
             
             # Извлечение timestamp и уровня
             ts, ts_guessed = guess_timestamp(obj)
+            if timer: timer.lap('guess_timestamp')
             level, level_guessed = guess_level(obj)
-            
-            if ts_guessed: guessed_ts_count += 1
-            if level_guessed: guessed_level_count += 1
+            if timer: timer.lap('guess_level')
             
             # Определение секции
             old_section = current_section
             current_section = detect_section(obj, current_section)
+            if timer: timer.lap('detect_section')
 
-            record = {
-                'lineno': lineno,
-                'timestamp': ts,
-                '_timestamp_guessed': ts_guessed, # Добавлено для демонстрации
-                'level': level,
-                '_level_guessed': level_guessed,   # Добавлено для демонстрации
-                'section': current_section,
-                # Если секция изменилась, помечаем начало/конец
-                '_section_start': (current_section is not None and old_section != current_section),
-                '_section_end': (current_section is None and old_section is not None),
-                'message': obj.get('@message') or obj.get('message'),
-                'raw_full_json': obj, # Сохраняем полный исходный объект для детального анализа
-                
-                # HTTP bodies: не раскрываем автоматически, пометим hidden=True
-                # Важно: здесь мы сохраняем полную структуру для последующего разворачивания
-                'tf_http_req_body': {
-                    'hidden': True,
-                    'value': safe_parse_json_field(obj.get('tf_http_req_body'))
-                } if 'tf_http_req_body' in obj else None,
-                'tf_http_res_body': {
-                    'hidden': True,
-                    'value': safe_parse_json_field(obj.get('tf_http_res_body'))
-                } if 'tf_http_res_body' in obj else None,
-                
-                'tf_req_id': obj.get('tf_req_id') or obj.get('tf_http_trans_id') or None,
-            }
+            record = build_record(lineno, obj, ts, ts_guessed, level, level_guessed,
+                                  old_section, current_section, source)
+            if timer: timer.lap('build_record')
+            if line_filter is not None and not line_filter.matches(record, raw):
+                continue
+            if sampler is not None and not sampler.keep(lineno, level, record['tf_req_id'], obj.get('tf_rpc'),
+                                                        old_section != current_section):
+                continue
 
-            # Сохраняем обработанную запись в выходной JSONL
-            fout.write(json.dumps(record, ensure_ascii=False) + '\n')
+            # Сохраняем обработанную запись в выходной JSONL (или в колонки)
+            if fmt is not None:
+                fout.add(record, raw_line)
+                if timer: timer.lap('serialize')
+            else:
+                line = json.dumps(record, ensure_ascii=False) + '\n'
+                if timer: timer.lap('serialize')
+                fout.write(line)
+                if index_writer is not None:
+                    index_writer.add(index_entry(record, len(line.encode('utf-8')), offset))
+                if timer: timer.lap('write')
 
             # Обновляем статистику
+            if parse_error: parse_error_count += 1
+            if ts_guessed: guessed_ts_count += 1
+            if level_guessed: guessed_level_count += 1
             if current_section:
                 section_stats[current_section] += 1
             level_stats[level] += 1
+            record_count += 1
 
-            # Группировка для дальнейшего анализа (для чекпоинта 2)
+            # Группировка для дальнейшего анализа (для чекпоинта 2): группа хранит строки JSONL
             if record['tf_req_id']:
-                grouped_records[record['tf_req_id']].append(record)
+                if fmt is not None:
+                    line = json.dumps(record, ensure_ascii=False) + '\n'
+                grouped_records.add(record['tf_req_id'], lineno, line)
+                if closes_request(obj):
+                    grouped_records.complete(record['tf_req_id'])
+            if timer: timer.lap('group')
+
+    if line_filter is not None:
+        lineno = line_filter.lines_seen  # последняя строка могла не дойти до цикла
+    if index_writer is not None:
+        index_writer.write()
+        if timer: timer.lap('write')
+    if metrics is not None:
+        count_run(metrics, path_in, path_out, lineno, record_count, parse_error_count, grouped_records)
                 
-    return path_out, grouped_records, {
+    stats = {
         'total_lines': lineno,
         'parsed_errors': parse_error_count,
         'guessed_timestamps': guessed_ts_count,
@@ -185,34 +619,794 @@ def process_file(path_in, path_out):
         'section_counts': section_stats,
         'level_counts': level_stats,
     }
+    if sampler is not None:
+        stats['sampling'] = sampler.stats()
+    return path_out, grouped_records, stats
+
+def count_run(metrics, path_in, path_out, lines, record_count, parse_errors, groups):
+    """Счётчики прогона: прочитанные/записанные байты, строки, записи, ошибки разбора, выгрузка групп."""
+    metrics.inc('lines_total', lines)
+    metrics.inc('group_spill_runs_total', len(groups.runs))
+    metrics.inc('group_spill_bytes_total', groups.spilled_bytes)
+    metrics.inc('records_total', record_count)
+    metrics.inc('parse_errors_total', parse_errors)
+    metrics.inc('bytes_read_total', os.path.getsize(path_in))
+    metrics.inc('bytes_written_total', os.path.getsize(path_out))
+
+# ---------- Параллельный режим ----------
+# Возможные состояния секции на входе в кусок файла: заранее неизвестно,
+# в какой секции закончился предыдущий кусок, поэтому воркер ведёт все три варианта.
+SECTION_STATES = (None, 'plan', 'apply')
+CHUNK_SIZE = 64 * 1024 * 1024  # верхняя граница размера куска (байт)
+
+def split_into_chunks(path, workers, chunk_size=CHUNK_SIZE):
+    """
+    Режет файл на диапазоны байт [start, end), каждый из которых заканчивается
+    сразу после '\n' (кроме последнего). Кусков не меньше, чем воркеров.
+    """
+    size = os.path.getsize(path)
+    if size == 0:
+        return []
+    target = max(1, min(chunk_size, -(-size // (workers * 4))))
+    chunks = []
+    start = 0
+    with open(path, 'rb') as f:
+        while start < size:
+            end = start + target
+            if end >= size:
+                end = size
+            else:
+                f.seek(end)
+                tail = f.readline()  # дочитываем до конца текущей строки
+                end += len(tail)
+            chunks.append((start, end))
+            start = end
+    return chunks
+
+def _count_chunk_lines(task):
+    """
+    Считает строки в куске так же, как их считает текстовый режим open() (\n, \r, \r\n).
+    Кусок читается блоками по READ_BLOCK, а не целиком, чтобы память не росла с размером куска.
+    """
+    path, start, end = task
+    n = 0
+    last = b''
+    with open(path, 'rb') as f:
+        f.seek(start)
+        left = end - start
+        while left > 0:
+            data = f.read(min(READ_BLOCK, left))
+            if not data:
+                break
+            left -= len(data)
+            n += data.count(b'\n') + data.count(b'\r') - data.count(b'\r\n')
+            if last == b'\r' and data[:1] == b'\n':
+                n -= 1  # '\r\n' на границе блоков
+            last = data[-1:]
+    if last and last not in (b'\n', b'\r'):
+        n += 1  # последняя строка без перевода строки
+    return n
+
+def _parse_chunk(task):
+    """
+    Воркер: разбирает кусок файла, начиная с номера строки first_lineno.
+
+    Пока траектории detect_section для трёх возможных входных состояний не сошлись,
+    записи копятся в prefix вместе с секциями всех трёх траекторий — их допишет
+    родительский процесс, когда узнает реальное состояние на входе. После схождения
+    записи сразу сериализуются во временный файл tmp_out.
+    """
+    (path, start, end, first_lineno, tmp_out, index, with_metrics, compress, fmt, group_memory, spill_dir,
+     sampler, source) = task
+    metrics = Metrics() if with_metrics else None
+    timer = metrics.timer() if metrics is not None else None
+    if sampler is not None:
+        sampler.reset_counts()  # копия могла уйти в процесс, когда родитель уже считал записи префиксов
+
+    states = list(SECTION_STATES)
+    converged = False
+    current_section = None  # известна, когда траектории сошлись
+    # [(record, (секции по траекториям), исходная строка, её смещение, закрывает ли запрос, tf_rpc, ошибка разбора)]
+    prefix = []
+    index_entries = []  # для сайдкар-индекса, только записи после prefix
+    grouped_records = GroupStore(group_memory, spill_dir)  # записи prefix группирует родитель
+    section_stats = defaultdict(int)
+    level_stats = defaultdict(int)
+    guessed_ts_count = 0
+    guessed_level_count = 0
+    parse_error_count = 0
+
+    # Колоночный кусок — Arrow-файл: родитель перекладывает его пачки в итоговый файл
+    with open_records_output(tmp_out, fmt and 'arrow', compress) as fout:
+        for lineno, (offset, raw) in enumerate(scan_lines(path, start, end), start=first_lineno):
+            if timer: timer.lap('read')
+
+            obj, parse_error, raw_line = parse_raw_line(raw)
+            if obj is None:
+                continue
+            if timer: timer.lap('json_loads')
+
+            ts, ts_guessed = guess_timestamp(obj)
+            if timer: timer.lap('guess_timestamp')
+            level, level_guessed = guess_level(obj)
+            if timer: timer.lap('guess_level')
+
+            if converged:
+                old_section = current_section
+                current_section = detect_section(obj, current_section)
+                if timer: timer.lap('detect_section')
+                record = build_record(lineno, obj, ts, ts_guessed, level, level_guessed,
+                                      old_section, current_section, source)
+                if timer: timer.lap('build_record')
+                if sampler is not None and not sampler.keep(lineno, level, record['tf_req_id'], obj.get('tf_rpc'),
+                                                            old_section != current_section):
+                    continue
+                if fmt is not None:
+                    fout.add(record, raw_line)
+                    if timer: timer.lap('serialize')
+                else:
+                    line = json.dumps(record, ensure_ascii=False) + '\n'
+                    if timer: timer.lap('serialize')
+                    fout.write(line)
+                    if index:
+                        index_entries.append(index_entry(record, len(line.encode('utf-8')), offset))
+                    if timer: timer.lap('write')
+                if parse_error: parse_error_count += 1
+                if ts_guessed: guessed_ts_count += 1
+                if level_guessed: guessed_level_count += 1
+                if current_section:
+                    section_stats[current_section] += 1
+                level_stats[level] += 1
+                if record['tf_req_id']:
+                    if fmt is not None:
+                        line = json.dumps(record, ensure_ascii=False) + '\n'
+                    grouped_records.add(record['tf_req_id'], lineno, line)
+                    if closes_request(obj):
+                        grouped_records.complete(record['tf_req_id'])
+            else:
+                old_states = states
+                states = [detect_section(obj, s) for s in old_states]
+                if timer: timer.lap('detect_section')
+                # Секционные поля заполняются родителем, здесь — черновик по первой траектории
+                record = build_record(lineno, obj, ts, ts_guessed, level, level_guessed,
+                                      old_states[0], states[0], source)
+                if timer: timer.lap('build_record')
+                prefix.append((record, tuple(states), raw_line, offset, closes_request(obj), obj.get('tf_rpc'),
+                               parse_error))
+                if states[0] == states[1] == states[2]:
+                    converged = True
+                    current_section = states[0]
+            if timer: timer.lap('group')
+
+    return {
+        'prefix': prefix,
+        # Состояние на выходе из куска, если траектории сошлись (иначе считает родитель)
+        'converged': converged,
+        'exit_section': current_section if converged else None,
+        'index_entries': index_entries,
+        'grouped': grouped_records.export(),
+        'section_counts': section_stats,
+        'level_counts': level_stats,
+        'guessed_timestamps': guessed_ts_count,
+        'guessed_levels': guessed_level_count,
+        'parsed_errors': parse_error_count,
+        'sampling': sampler.counts() if sampler is not None else None,
+        'metrics': metrics.snapshot() if metrics is not None else None,
+    }
+
+def process_file_parallel(path_in, path_out, workers, index=False, metrics=None, compress=None, fmt=None,
+                          group_memory=GROUP_MEMORY_BYTES, sampler=None, source=None):
+    """
+    Параллельная версия process_file: тот же выход, те же grouped_records и статистика.
+
+    1) файл режется на куски по границам строк;
+    2) пул считает строки в кусках, чтобы знать номер первой строки каждого куска;
+    3) пул разбирает куски, родитель по порядку «сшивает» состояние секций
+       и склеивает временные файлы в path_out.
+    При сжатом выводе воркеры сразу пишут сжатые куски, а родитель склеивает их байтами:
+    последовательность gzip-членов / zstd-фреймов — корректный сжатый файл.
+    При колоночном выводе куски — Arrow-файлы, их пачки перекладываются в итоговый файл.
+    С metrics стадии воркеров суммируются по всем процессам (процессорное время, а не
+    время по часам); родитель добавляет свои стадии split / count_lines / stitch.
+    Группы: у каждого воркера бюджет group_memory / workers, серии он пишет в папку
+    родительского GroupStore и передаёт их родителю вместе с остатком памяти.
+    sampler — уже после observe_sampling: решения keep() зависят только от номера строки и записи,
+    поэтому воркеры и родитель (для записей префикса) выбирают те же записи, что и один процесс.
+    """
+    path_in = Path(path_in)
+    path_out = Path(path_out)
+    timer = metrics.timer() if metrics is not None else None
+
+    chunks = split_into_chunks(path_in, workers)
+    if timer: timer.lap('split')
+
+    current_section = None
+    grouped_records = GroupStore(group_memory)
+    section_stats = defaultdict(int)
+    level_stats = defaultdict(int)
+    guessed_ts_count = 0
+    guessed_level_count = 0
+    parse_error_count = 0
+    total_lines = 0
+    record_count = 0
+    index_writer = IndexWriter(path_out, source=path_in) if index else None
+
+    with ProcessPoolExecutor(max_workers=workers) as pool, \
+            tempfile.TemporaryDirectory(prefix='tflog_parse_') as tmp_dir, \
+            (ColumnarWriter(path_out, fmt) if fmt else path_out.open('wb')) as fout:
+        line_counts = list(pool.map(_count_chunk_lines, [(str(path_in), s, e) for s, e in chunks]))
+        if timer: timer.lap('count_lines')
+
+        tasks = []
+        for i, ((start, end), n_lines) in enumerate(zip(chunks, line_counts)):
+            tasks.append((str(path_in), start, end, total_lines + 1,
+                          os.path.join(tmp_dir, f'{i}.part'), index, metrics is not None, compress, fmt,
+                          group_memory // workers, grouped_records.spill_dir(), sampler, source))
+            total_lines += n_lines
+
+        for task, part in zip(tasks, pool.map(_parse_chunk, tasks)):
+            if timer: timer.start()  # ожидание воркеров — не стадия родителя
+            # Дописываем секции в записи префикса по реальному входному состоянию
+            trajectory = SECTION_STATES.index(current_section)
+            prefix_lines = []
+            for record, states, raw_line, offset, closing, rpc, parse_error in part['prefix']:
+                old_section = current_section
+                current_section = states[trajectory]
+                record['section'] = current_section
+                record['_section_start'] = (current_section is not None and old_section != current_section)
+                record['_section_end'] = (current_section is None and old_section is not None)
+                if sampler is not None and not sampler.keep(record['lineno'], record['level'], record['tf_req_id'],
+                                                            rpc, old_section != current_section):
+                    continue
+                if fmt is not None:
+                    fout.add(record, raw_line)
+                else:
+                    line = json.dumps(record, ensure_ascii=False) + '\n'
+                    prefix_lines.append(line)
+                    if index_writer is not None:
+                        index_writer.add(index_entry(record, len(line.encode('utf-8')), offset))
+                if parse_error: parse_error_count += 1
+                if record['_timestamp_guessed']: guessed_ts_count += 1
+                if record['_level_guessed']: guessed_level_count += 1
+                if current_section:
+                    section_stats[current_section] += 1
+                level_stats[record['level']] += 1
+                record_count += 1
+                if record['tf_req_id']:
+                    if fmt is not None:
+                        line = json.dumps(record, ensure_ascii=False) + '\n'
+                    grouped_records.add(record['tf_req_id'], record['lineno'], line)
+                    if closing:
+                        grouped_records.complete(record['tf_req_id'])
+            if part['converged']:
+                current_section = part['exit_section']
+
+            if fmt is not None:
+                for batch in read_batches(task[4]):
+                    fout.add_batch(batch)
+            else:
+                if prefix_lines:
+                    fout.write(compress_block(''.join(prefix_lines).encode('utf-8'), compress))
+                with open(task[4], 'rb') as fpart:
+                    shutil.copyfileobj(fpart, fout)
+            os.remove(task[4])
+            if index_writer is not None:
+                for entry in part['index_entries']:
+                    index_writer.add(entry)
+
+            for sec, n in part['section_counts'].items():
+                section_stats[sec] += n
+            for lvl, n in part['level_counts'].items():
+                level_stats[lvl] += n
+            grouped_records.absorb(part['grouped'])
+            guessed_ts_count += part['guessed_timestamps']
+            guessed_level_count += part['guessed_levels']
+            parse_error_count += part['parsed_errors']
+            record_count += sum(part['level_counts'].values())
+            if sampler is not None:
+                sampler.merge_counts(part['sampling'])
+            if metrics is not None:
+                metrics.merge(part['metrics'])
+            if timer: timer.lap('stitch')
+
+    if index_writer is not None:
+        index_writer.write()
+        if timer: timer.lap('stitch')
+    if metrics is not None:
+        count_run(metrics, path_in, path_out, total_lines, record_count, parse_error_count, grouped_records)
+
+    stats = {
+        'total_lines': total_lines,
+        'parsed_errors': parse_error_count,
+        'guessed_timestamps': guessed_ts_count,
+        'guessed_levels': guessed_level_count,
+        'section_counts': section_stats,
+        'level_counts': level_stats,
+    }
+    if sampler is not None:
+        stats['sampling'] = sampler.stats()
+    return path_out, grouped_records, stats
+
+# ---------- Пакетный режим (несколько логов) ----------
+# Логи одного прогона пайплайна (plan, apply, общий) лежат отдельными файлами. Каждый
+# разбирается в своём процессе, со своим состоянием секций, а записи сливаются в один
+# выход по времени: k-way merge на куче по временным файлам, в памяти — по записи на файл.
+
+BATCH_SUFFIXES = ('.json', '.jsonl', '.log')  # какие файлы брать из папки (и они же .gz / .zst)
+# Начало строки JSONL из build_record: lineno, затем timestamp (null или строка без экранирования)
+RECORD_TS_RE = re.compile(rb'\{"lineno": \d+, "timestamp": (?:null|"([^"\\]*)")')
+REQ_ID_KEY = b', "tf_req_id": '  # последнее поле записи перед source
+REQ_ID_RE = re.compile(rb'null|"([^"\\]*)"')
+_JSON_DECODER = json.JSONDecoder()
+
+def is_batch_input(spec):
+    """Вход — не файл, а папка или glob-шаблон (пакетный режим)."""
+    return not os.path.isfile(spec) and (os.path.isdir(spec) or any(c in spec for c in '*?['))
+
+def _is_log_name(name):
+    name = name.lower()
+    if codec_for_path(name):
+        name = name.rsplit('.', 1)[0]
+    return name.endswith(BATCH_SUFFIXES)
+
+def expand_inputs(spec, exclude=()):
+    """
+    Файлы пакетного режима по порядку имён: логи папки spec (по BATCH_SUFFIXES)
+    или все файлы по glob-шаблону (** — с подпапками). exclude — пути, которые не брать (вывод).
+    """
+    excluded = {os.path.realpath(path) for path in exclude}
+    if os.path.isdir(spec):
+        paths = [entry.path for entry in os.scandir(spec) if entry.is_file() and _is_log_name(entry.name)]
+    else:
+        paths = [path for path in glob.glob(spec, recursive=True) if os.path.isfile(path)]
+    return sorted(path for path in set(paths) if os.path.realpath(path) not in excluded)
+
+def _merge_keys(path):
+    """
+    Ключи слияния записей JSONL, который записал process_file: время (epoch ns) и tf_req_id.
+    Поля берутся из строки без json.loads: timestamp — второе поле build_record, tf_req_id —
+    последнее поле верхнего уровня перед source (внутри строк JSON кавычки экранированы,
+    так что rindex не попадёт в raw_full_json). Запись без метки получает время предыдущей —
+    остаётся рядом с соседями по файлу.
+    """
+    times = array('q')
+    req_ids = []
+    last = NAT
+    seconds = {}  # метка Terraform без дробной части -> epoch ns: в одну секунду пишется много строк
+    with open(path, 'rb') as f:
+        for line in f:
+            m = RECORD_TS_RE.match(line)
+            raw = m.group(1) if m is not None else None
+            if m is None:  # метка с экранированием или не строка
+                ts = parse_ts_ns(json.loads(line)['timestamp'])
+            elif raw is None:
+                ts = None
+            elif len(raw) == TF_TS_LEN and raw[19:20] == b'.' and raw[20:26].isdigit():
+                second = raw[:19] + raw[26:]
+                base = seconds.get(second)
+                if base is None:
+                    base = seconds[second] = parse_ts_ns(second.decode('ascii', 'replace'))
+                ts = base + int(raw[20:26]) * 1000 if base is not None else None
+            else:
+                ts = parse_ts_ns(raw.decode('utf-8'))
+            if ts is not None:
+                last = ts
+            times.append(last)
+            pos = line.rindex(REQ_ID_KEY) + len(REQ_ID_KEY)
+            m = REQ_ID_RE.match(line, pos)
+            if m is None:  # с экранированием или не строка
+                req_ids.append(_JSON_DECODER.raw_decode(line[pos:].decode('utf-8'))[0])
+            else:
+                req_ids.append(None if m.group(1) is None else m.group(1).decode('utf-8'))
+    return times, req_ids
+
+def _parse_source(task):
+    """Воркер пакетного режима: один лог во временный JSONL (process_file) и ключи слияния его записей."""
+    path_in, tmp_out, group_memory, line_filter, sampler, with_metrics = task
+    metrics = Metrics() if with_metrics else None
+    _, grouped, stats = process_file(path_in, tmp_out, metrics=metrics, group_memory=group_memory,
+                                     line_filter=line_filter, sampler=sampler, source=path_in)
+    grouped.close()  # группы по всем файлам собирает родитель, в порядке слияния
+    timer = metrics.timer() if metrics is not None else None
+    times, req_ids = _merge_keys(tmp_out)
+    if timer: timer.lap('merge_keys')
+    return {'stats': stats, 'times': times, 'req_ids': req_ids,
+            'metrics': metrics.snapshot() if metrics is not None else None}
+
+def combine_stats(per_file):
+    """Статистика пакетного режима: суммы по файлам и сами они в stats['files']."""
+    stats = {'total_lines': 0, 'parsed_errors': 0, 'guessed_timestamps': 0, 'guessed_levels': 0,
+             'section_counts': defaultdict(int), 'level_counts': defaultdict(int)}
+    for part in per_file.values():
+        for key in ('total_lines', 'parsed_errors', 'guessed_timestamps', 'guessed_levels'):
+            stats[key] += part[key]
+        for key in ('section_counts', 'level_counts'):
+            for name, n in part[key].items():
+                stats[key][name] += n
+    sampled = [part['sampling'] for part in per_file.values() if 'sampling' in part]
+    if sampled:
+        stats['sampling'] = combine_sampling_stats(sampled)
+    stats['files'] = per_file
+    return stats
+
+def process_files(paths_in, path_out, workers=None, metrics=None, compress=None,
+                  group_memory=GROUP_MEMORY_BYTES, line_filter=None, sampler=None):
+    """
+    Пакетный режим: несколько логов (например, plan и apply одного прогона) в один JSONL path_out.
+
+    Файлы разбираются одновременно в пуле из workers процессов (None — по процессу на файл,
+    но не больше числа ядер), поэтому время прогона — примерно время самого большого файла,
+    а не сумма. Каждый файл разбирается как process_file, со своим состоянием секций и своими
+    номерами строк; каждая запись получает поле source — путь к её файлу. Затем родитель сливает временные файлы
+    по времени записей (heapq.merge): при равных метках раньше идёт файл, стоящий раньше
+    в paths_in. Порядок записей внутри файла сохраняется, даже если метки в нём не по возрастанию.
+
+    line_filter / sampler применяются к каждому файлу отдельно (у каждого процесса своя копия).
+    Группы tf_req_id — общие для всех файлов, записи в группе — в порядке слияния.
+    Возвращает (path_out, группы, stats): stats — суммы по файлам, stats['files'] — статистика
+    process_file каждого файла (ключ — путь). compress — как в process_file; колоночный
+    вывод и сайдкар-индекс для слитого выхода не поддерживаются.
+    """
+    paths_in = [str(path) for path in paths_in]
+    path_out = Path(path_out)
+    workers = workers or min(len(paths_in), os.cpu_count() or 1)
+    timer = metrics.timer() if metrics is not None else None
+
+    grouped_records = GroupStore(group_memory)
+    with ProcessPoolExecutor(max_workers=workers) as pool, \
+            tempfile.TemporaryDirectory(prefix='tflog_batch_') as tmp_dir:
+        tasks = [(path, os.path.join(tmp_dir, f'{i}.part'), group_memory // workers, line_filter, sampler,
+                  metrics is not None) for i, path in enumerate(paths_in)]
+        parts = list(pool.map(_parse_source, tasks))
+        if timer: timer.start()  # ожидание воркеров — не стадия родителя
+
+        with ExitStack() as stack, open_output(path_out, compress) as fout:
+            streams = []
+            for task, part in zip(tasks, parts):
+                fpart = stack.enter_context(open(task[1], encoding='utf-8', newline=''))
+                streams.append(zip(part['times'], fpart, part['req_ids']))
+            for seq, (_, line, req_id) in enumerate(heapq.merge(*streams, key=itemgetter(0)), start=1):
+                fout.write(line)
+                if req_id:
+                    grouped_records.add(req_id, seq, line)
+        if timer: timer.lap('merge')
+
+    if metrics is not None:
+        for part in parts:
+            metrics.merge(part['metrics'])
+    return path_out, grouped_records, combine_stats({path: part['stats'] for path, part in zip(paths_in, parts)})
+
+# ---------- Режим слежения (follow) ----------
+# Растущий лог (TF_LOG_PATH во время apply) дочитывается по мере записи. Состояние разбора
+# сохраняется в чекпоинт, чтобы после перезапуска продолжить с того же места, а не с байта 0.
+FOLLOW_POLL_INTERVAL = 0.25  # пауза между проверками размера файла, сек
+FOLLOW_READ_SIZE = 1024 * 1024  # сколько байт дочитывать за раз
+CHECKPOINT_SUFFIX = '.ckpt'
+
+def checkpoint_path_for(path_out):
+    path_out = Path(path_out)
+    return path_out.with_name(path_out.name + CHECKPOINT_SUFFIX)
+
+def new_follow_state(path_in):
+    """Начальное состояние слежения: всё, что нужно, чтобы продолжить разбор с середины файла."""
+    return {
+        'version': 1,
+        'input': str(Path(path_in).resolve()),
+        'inode': None,        # чтобы заметить ротацию/пересоздание лога
+        'offset': 0,          # сколько байт входа уже прочитано (включая partial)
+        'partial': '',        # хвост без '\n' — строка ещё дописывается
+        'lineno': 0,
+        'section': None,      # состояние detect_section
+        'output_size': 0,     # длина выхода на момент чекпоинта
+        'stats': {
+            'total_lines': 0,
+            'parsed_errors': 0,
+            'guessed_timestamps': 0,
+            'guessed_levels': 0,
+            'section_counts': {},
+            'level_counts': {},
+        },
+    }
+
+def load_checkpoint(checkpoint, path_in):
+    """Состояние из чекпоинта или новое, если чекпоинта нет или он от другого входного файла."""
+    state = new_follow_state(path_in)
+    try:
+        with open(checkpoint, 'r', encoding='utf-8') as f:
+            saved = json.load(f)
+    except FileNotFoundError:
+        return state
+    if saved.get('version') != state['version'] or saved.get('input') != state['input']:
+        print(f"[!] Checkpoint {checkpoint} is for another input, starting from scratch")
+        return state
+    return saved
+
+def save_checkpoint(checkpoint, state):
+    """Атомарная запись чекпоинта: временный файл + os.replace."""
+    tmp = f"{checkpoint}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        # partial может обрываться посреди UTF-8 символа: surrogateescape + \udcXX-экранирование json
+        json.dump(state, f)
+    os.replace(tmp, checkpoint)
+
+def _follow_records(text, state):
+    """Разбирает завершённые строки text (заканчивается на '\n'), продолжая state; возвращает записи."""
+    stats = state['stats']
+    current_section = state['section']
+    records = []
+    for raw_line in io.StringIO(text, newline=None):
+        state['lineno'] += 1
+        raw_line = raw_line.strip()
+        if not raw_line:
+            continue
+
+        obj, parse_error = parse_line(raw_line)
+        if parse_error:
+            stats['parsed_errors'] += 1
+
+        ts, ts_guessed = guess_timestamp(obj)
+        level, level_guessed = guess_level(obj)
+        if ts_guessed: stats['guessed_timestamps'] += 1
+        if level_guessed: stats['guessed_levels'] += 1
+
+        old_section = current_section
+        current_section = detect_section(obj, current_section)
+        records.append(build_record(state['lineno'], obj, ts, ts_guessed, level, level_guessed,
+                                    old_section, current_section))
+
+        if current_section:
+            stats['section_counts'][current_section] = stats['section_counts'].get(current_section, 0) + 1
+        stats['level_counts'][level] = stats['level_counts'].get(level, 0) + 1
+
+    state['section'] = current_section
+    stats['total_lines'] = state['lineno']
+    return records
+
+def follow_file(path_in, path_out, checkpoint=None, poll_interval=FOLLOW_POLL_INTERVAL, idle_timeout=None):
+    """
+    Следит за растущим логом path_in и дописывает разобранные записи в path_out по мере
+    появления строк (нумерация строк, секции и статистика — как у process_file).
+
+    После каждой пачки состояние сохраняется в checkpoint (по умолчанию path_out.ckpt):
+    смещение во входе, незавершённая строка, секция, статистика и длина выхода.
+    При перезапуске выход обрезается до длины из чекпоинта, и разбор продолжается с того же байта.
+    Если лог пересоздан или обрезан, он разбирается заново с начала (выход дописывается).
+
+    В простое — только os.stat раз в poll_interval секунд. idle_timeout — выйти после стольких
+    секунд без новых данных (None — следить до Ctrl+C). Возвращает (path_out, stats).
+    """
+    path_in = Path(path_in)
+    path_out = Path(path_out)
+    checkpoint = Path(checkpoint) if checkpoint else checkpoint_path_for(path_out)
+
+    state = load_checkpoint(checkpoint, path_in)
+    out_size = path_out.stat().st_size if path_out.exists() else 0
+    if out_size < state['output_size']:
+        print(f"[!] {path_out} is shorter than the checkpoint says, starting from scratch")
+        state = new_follow_state(path_in)
+    elif out_size > state['output_size']:
+        # Записи после последнего чекпоинта будут разобраны ещё раз — убираем их из выхода
+        os.truncate(path_out, state['output_size'])
+
+    fin = None
+    idle_since = time.monotonic()
+    try:
+        with path_out.open('ab') as fout:
+            while True:
+                try:
+                    st = os.stat(path_in)
+                except FileNotFoundError:
+                    st = None
+                if st is not None and (st.st_ino != state['inode'] or st.st_size < state['offset']):
+                    if fin is not None:
+                        fin.close()
+                        fin = None
+                    if state['inode'] is not None:
+                        print(f"[!] {path_in} was rotated or truncated, reading it from the start")
+                        state.update(offset=0, partial='', lineno=0, section=None)
+                    state['inode'] = st.st_ino
+                if st is not None and fin is None:
+                    fin = path_in.open('rb')
+
+                data = b''
+                if st is not None and st.st_size > state['offset']:
+                    fin.seek(state['offset'])
+                    data = fin.read(FOLLOW_READ_SIZE)
+                if not data:
+                    if idle_timeout is not None and time.monotonic() - idle_since >= idle_timeout:
+                        break
+                    time.sleep(poll_interval)
+                    continue
+                idle_since = time.monotonic()
+
+                state['offset'] += len(data)
+                buf = state['partial'].encode('utf-8', 'surrogateescape') + data
+                cut = buf.rfind(b'\n') + 1  # разбираем только завершённые строки
+                state['partial'] = buf[cut:].decode('utf-8', 'surrogateescape')
+                if cut:
+                    # errors='replace': одна битая строка не должна останавливать слежение
+                    for record in _follow_records(buf[:cut].decode('utf-8', errors='replace'), state):
+                        fout.write((json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8'))
+                    fout.flush()
+                    state['output_size'] = fout.tell()
+                save_checkpoint(checkpoint, state)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if fin is not None:
+            fin.close()
+        save_checkpoint(checkpoint, state)
+
+    return path_out, state['stats']
 
 if __name__ == '__main__':
-    if len(sys.argv) < 3:
-        print("Usage: python parse.py input.jsonl output.jsonl")
-        print("Example: python parse.py '3. apply_tflog.json' parsed_apply.jsonl")
-        sys.exit(2)
+    parser = argparse.ArgumentParser(
+        description="Парсер Terraform JSON-логов",
+        epilog="Example: python main.py '3. apply_tflog.json' parsed_apply.jsonl --workers 4; "
+               "python main.py ../logs merged.jsonl (all logs of a directory merged by time)",
+    )
+    parser.add_argument('input', help="входной лог (JSON на строку; .gz / .zst распаковываются на лету); "
+                                      "папка или glob-шаблон в кавычках — пакетный режим: все логи "
+                                      "разбираются параллельно и сливаются в output по времени")
+    parser.add_argument('output', help="выходной JSONL (output.gz / output.zst — сжатый; .parquet / .arrow — колоночный)")
+    parser.add_argument('--compress', choices=CODECS,
+                        help="сжать выходной JSONL (по умолчанию — по расширению output)")
+    parser.add_argument('--format', choices=FORMATS,
+                        help="колоночный вывод вместо JSONL (по умолчанию — по расширению output: "
+                             ".parquet / .arrow / .feather); нужен pyarrow")
+    parser.add_argument('--workers', type=int,
+                        help="число процессов для параллельного парсинга (по умолчанию 1; в пакетном "
+                             "режиме — файлов, разбираемых одновременно, по умолчанию по процессу на файл)")
+    parser.add_argument('--group-memory', type=int, default=GROUP_MEMORY_BYTES >> 20, metavar='MB',
+                        help="память под группы tf_req_id, МБ; сверх неё группы выгружаются на диск "
+                             f"(по умолчанию {GROUP_MEMORY_BYTES >> 20})")
+    parser.add_argument('--index', action='store_true',
+                        help="записать рядом с output сайдкар-индекс output.idx (см. sidecar_index.py)")
+    parser.add_argument('--follow', action='store_true',
+                        help="следить за растущим логом и дописывать записи по мере появления (Ctrl+C — выход)")
+    parser.add_argument('--checkpoint',
+                        help="файл чекпоинта для --follow (по умолчанию output.ckpt)")
+    parser.add_argument('--poll-interval', type=float, default=FOLLOW_POLL_INTERVAL,
+                        help=f"пауза между проверками лога в --follow, сек (по умолчанию {FOLLOW_POLL_INTERVAL})")
+    filters = parser.add_argument_group(
+        "фильтры", "писать только подходящие записи; значения одного фильтра — «или», разные фильтры — «и». "
+                   "Неподходящие строки отбрасываются по байтам, без разбора JSON; разбор идёт последовательно")
+    filters.add_argument('--level', action='append', metavar='LEVEL', help="уровень записи (error, warning, ...)")
+    filters.add_argument('--section', action='append', choices=('plan', 'apply', 'none'),
+                         help="секция записи (none — вне plan/apply)")
+    filters.add_argument('--req-id', action='append', metavar='ID', help="tf_req_id (или tf_http_trans_id)")
+    filters.add_argument('--resource-type', action='append', metavar='TYPE', help="tf_resource_type")
+    filters.add_argument('--since', metavar='TS', help="не раньше метки времени (ISO 8601; без пояса — UTC)")
+    filters.add_argument('--until', metavar='TS', help="не позже метки времени (ISO 8601; без пояса — UTC)")
+    filters.add_argument('--grep', action='append', metavar='TEXT',
+                         help="подстрока исходной строки лога (как в файле, с учётом регистра)")
+    sampling = parser.add_argument_group(
+        "выборка", "оставить часть trace/debug-записей; записи других уровней, границы секций и запросы "
+                   "(tf_req_id) с ошибками остаются целиком. Нужен ещё один проход по файлу")
+    sampling.add_argument('--sample-rate', type=float, metavar='RATE',
+                          help="доля trace/debug-записей, 0..1 (детерминированно по номеру строки)")
+    sampling.add_argument('--sample-per-rpc', type=int, metavar='N',
+                          help="не больше N trace/debug-записей на значение tf_rpc (резервуарная выборка); "
+                               "записи без tf_rpc — по --sample-rate")
+    sampling.add_argument('--sample-seed', type=int, default=0, help="seed выборки (по умолчанию 0)")
+    parser.add_argument('--metrics', action='store_true',
+                        help="замерить время по стадиям разбора и вывести таблицу (при --workers — сумма по процессам)")
+    parser.add_argument('--profile', metavar='FILE',
+                        help="сэмплирующий профилировщик: свёрнутые стеки в FILE (flamegraph.pl, speedscope); "
+                             "при --workers видит только основной процесс")
+    parser.add_argument('--profile-interval', type=float, default=5,
+                        help="период сэмплов профилировщика, мс (по умолчанию 5)")
+    args = parser.parse_args()
+    bounds = {}
+    for name in ('since', 'until'):
+        value = getattr(args, name)
+        if value is not None:
+            bounds[name] = parse_ts_ns(value)
+            if bounds[name] is None:
+                parser.error(f"--{name}: не разобрать метку времени {value!r}")
+    line_filter = LineFilter(levels=args.level, sections=args.section, req_ids=args.req_id,
+                             resource_types=args.resource_type, grep=args.grep, **bounds) or None
+    sampler = None
+    if args.sample_rate is not None or args.sample_per_rpc is not None:
+        try:
+            sampler = Sampler(rate=1.0 if args.sample_rate is None else args.sample_rate,
+                              per_rpc=args.sample_per_rpc, seed=args.sample_seed)
+        except ValueError as e:
+            parser.error(str(e))
+    workers = args.workers or 1
+    batch = is_batch_input(args.input)
+    if args.follow and (batch or args.index or workers > 1 or args.metrics or line_filter or sampler):
+        parser.error("--follow нельзя совмещать с пакетным режимом, --index, --workers, --metrics, "
+                     "фильтрами и выборкой")
+    compressed_out = args.compress or codec_for_path(args.output)
+    columnar_out = args.format or format_for_path(args.output)
+    if args.index and (compressed_out or columnar_out):
+        parser.error("--index несовместим со сжатым и колоночным выводом (индекс хранит смещения в JSONL)")
+    if batch and (args.index or columnar_out):
+        parser.error("пакетный режим (папка / glob) пишет только JSONL: --index и колоночный вывод недоступны")
+    inputs = expand_inputs(args.input, exclude=[args.output]) if batch else None
+    if batch and not inputs:
+        parser.error(f"по {args.input!r} не найдено ни одного лога")
+    if args.follow and (compressed_out or columnar_out or (os.path.exists(args.input) and file_codec(args.input))):
+        parser.error("--follow работает только с несжатыми входом и JSONL-выходом")
     
-    inpath = sys.argv[1]
-    outpath = sys.argv[2]
+    inpath = args.input
+    outpath = args.output
+    profiler = SamplingProfiler(args.profile_interval / 1000).start() if args.profile else None
+
+    def stop_profiler():
+        if profiler is None:
+            return
+        profiler.stop()
+        profiler.write_folded(args.profile)
+        print(f"\n--- Profile: {profiler.samples} samples, folded stacks saved to {args.profile} ---")
+        for func, _, share in profiler.top(10):
+            print(f"  {share:6.1%}  {func}")
     
-    print(f"[*] Starting parsing for '{inpath}'...")
-    parsed_path, grouped, stats = process_file(inpath, outpath)
-    print(f"[*] Parsing complete. Results saved to: {parsed_path}")
+    if args.follow:
+        checkpoint = args.checkpoint or checkpoint_path_for(outpath)
+        print(f"[*] Following '{inpath}' -> {outpath} (checkpoint: {checkpoint}, Ctrl+C to stop)...")
+        parsed_path, stats = follow_file(inpath, outpath, checkpoint=checkpoint, poll_interval=args.poll_interval)
+        stop_profiler()
+        print(f"\n[*] Stopped. Progress saved to {checkpoint}; run again to resume.")
+        print(f"Total lines processed: {stats['total_lines']}")
+        print(f"Lines with parsing errors: {stats['parsed_errors']}")
+        print(f"Level counts: {stats['level_counts']}")
+        raise SystemExit(0)
+
+    metrics = Metrics() if args.metrics else None
+    started = time.perf_counter()
+    if batch:
+        print(f"[*] Starting batch parsing of {len(inputs)} files from '{inpath}'...")
+        parsed_path, grouped, stats = process_files(inputs, outpath, workers=args.workers, metrics=metrics,
+                                                    compress=args.compress, group_memory=args.group_memory << 20,
+                                                    line_filter=line_filter, sampler=sampler)
+    else:
+        print(f"[*] Starting parsing for '{inpath}'...")
+        if line_filter is not None and workers > 1:
+            print("[*] Filters are set: parsing sequentially, --workers is ignored")
+        parsed_path, grouped, stats = process_file(inpath, outpath, workers=workers, index=args.index,
+                                                   metrics=metrics, compress=args.compress, fmt=args.format,
+                                                   group_memory=args.group_memory << 20, line_filter=line_filter,
+                                                   sampler=sampler)
+    elapsed = time.perf_counter() - started
+    stop_profiler()
+    print(f"[*] Parsing complete in {elapsed:.2f} s. Results saved to: {parsed_path}")
+    if metrics is not None:
+        print("\n--- Stage timings ---")
+        print(metrics.report())
     
+    if batch:
+        print("\n--- Files (merged by timestamp) ---")
+        for source, file_stats in stats['files'].items():
+            print(f"  {source}: {file_stats['total_lines']} lines, "
+                  f"{sum(file_stats['level_counts'].values())} records")
+
     print("\n--- Parsing Statistics ---")
     print(f"Total lines processed: {stats['total_lines']}")
+    if line_filter is not None:
+        print(f"Records matching filters: {sum(stats['level_counts'].values())}")
     print(f"Lines with parsing errors: {stats['parsed_errors']}")
     print(f"Timestamps guessed: {stats['guessed_timestamps']}")
     print(f"Levels guessed: {stats['guessed_levels']}")
     print("\nSection counts:")
-    for sec, count in stats['section_counts'].items():
-        print(f"  {sec.capitalize()}: {count} entries")
+    for sec, n in stats['section_counts'].items():
+        print(f"  {sec.capitalize()}: {n} entries")
     print("\nLevel counts:")
-    for lvl, count in stats['level_counts'].items():
-        print(f"  {lvl.capitalize()}: {count} entries")
+    for lvl, n in stats['level_counts'].items():
+        print(f"  {lvl.capitalize()}: {n} entries")
+    if 'sampling' in stats:
+        sampled = stats['sampling']
+        print(f"\nSampling (kept / seen; divide counts by the ratio to scale back up), "
+              f"{sampled['error_requests']} requests with errors kept whole:")
+        for lvl, level_stats in sampled['levels'].items():
+            print(f"  {lvl.capitalize()}: {level_stats['kept']} / {level_stats['seen']} (ratio {level_stats['ratio']:.4f})")
         
     print(f"\nFound {len(grouped)} unique tf_req_id groups.")
+    if grouped.runs:
+        print(f"Groups spilled to disk: {len(grouped.runs)} runs, {grouped.spilled_bytes / 2**20:.1f} MB")
     print("Sample groups (tf_req_id -> count):")
-    for k, v in list(grouped.items())[:5]: # Показываем до 5 примеров
-        print(f"  {k} -> {len(v)} records")
+    for k, lines in islice(grouped.iter_lines(), 5): # Показываем до 5 примеров
+        print(f"  {k} -> {len(lines)} records")
+    grouped.close()
     print("\nOutput file 'parsed.jsonl' contains full parsed records, including original JSON and section/guess metadata.")
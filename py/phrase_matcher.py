@@ -0,0 +1,49 @@
+"""
+phrase_matcher.py
+Однопроходный поиск набора фраз в строке.
+
+Вместо десятков проверок `phrase in msg` по каждой таблице фраз (PLAN_START_PHRASES,
+LEVEL_KEYWORDS и т.д.) все фразы собираются один раз в общую regex-альтернацию.
+Результат match() — битовая маска групп, хотя бы одна фраза которых встречается в тексте.
+У guess_level и detect_section свои экземпляры (свои таблицы фраз). Экземпляр без
+состояния между вызовами, поэтому общий модульный объект можно звать из разных потоков.
+"""
+
+import re
+
+
+class PhraseMatcher:
+    """
+    groups — словарь {имя группы: список фраз}. Текст перед поиском приводится к нижнему
+    регистру, а фразы берутся как есть: фраза с заглавными буквами не найдётся никогда —
+    ровно как раньше в `p in msg.lower()`.
+    """
+
+    def __init__(self, groups):
+        self.bits = {name: 1 << i for i, name in enumerate(groups)}
+        phrases = {p for group in groups.values() for p in group if p}
+        # Найденная фраза поднимает биты всех групп, чьи фразы являются её подстрокой:
+        # так короткие фразы внутри длинного совпадения не теряются
+        self._flags = {}
+        for p in phrases:
+            flags = 0
+            for name, group in groups.items():
+                if any(q and q in p for q in group):
+                    flags |= self.bits[name]
+            self._flags[p] = flags
+        # Длинные альтернативы первыми: в каждой позиции берётся самое длинное совпадение
+        alternation = '|'.join(re.escape(p) for p in sorted(phrases, key=len, reverse=True))
+        self._search = re.compile(alternation).search if phrases else None
+
+    def match(self, text):
+        """Битовая маска групп, найденных в text (0 — ничего не найдено)."""
+        flags = 0
+        if self._search is not None:
+            lowered = text.lower()
+            m = self._search(lowered)
+            while m:
+                flags |= self._flags[m.group()]
+                # Следующий поиск — со следующего символа, а не с конца совпадения,
+                # чтобы не пропустить фразы, перекрывающиеся с найденной
+                m = self._search(lowered, m.start() + 1)
+        return flags
@@ -0,0 +1,204 @@
+"""
+request_groups.py
+Группировка записей по tf_req_id (или tf_http_trans_id) с ограниченной памятью.
+
+Записи группы хранятся уже сериализованными строками JSONL — для JSONL-вывода это та же
+строка, что пишется в файл, — поэтому занятая память считается без обхода объектов, а сама
+запись занимает в разы меньше, чем дерево dict'ов. Когда сумма строк в памяти превышает бюджет,
+холодные группы выгружаются на диск, пока не освободится половина бюджета: сначала завершённые
+(строка Served request или поле tf_req_duration_ms — запрос закончен), затем давно
+не пополнявшиеся. Выгрузка — файл-серия (run) с группами, отсортированными по ключу.
+
+В конце серии и остаток памяти сливаются (heapq.merge), и группы отдаются по одной:
+в памяти одновременно только одна группа. Порядок групп — по ключу (JSON tf_req_id),
+а не по первому появлению.
+
+Группа может оказаться в нескольких сериях кусками: запись пришла уже после выгрузки
+(в логах terraform бывают строки и после Served request), куски параллельного разбора.
+Куски одной группы не перекрываются по номерам строк, при слиянии они упорядочиваются
+по номеру первой строки и склеиваются.
+
+Снаружи GroupStore похож на словарь tf_req_id -> [записи]: len(), keys(), items().
+"""
+
+import heapq
+import json
+import os
+import shutil
+import tempfile
+import weakref
+from collections import OrderedDict
+from itertools import groupby, islice
+from operator import itemgetter
+
+GROUP_MEMORY_BYTES = 256 * 1024 * 1024
+SPILL_FRACTION = 0.5   # до какой доли бюджета выгружать за раз (одна серия — много групп)
+LINE_OVERHEAD = 57     # заголовок объекта str и ссылка в списке, байт на строку
+MERGE_FANIN = 64       # серий в одном слиянии (столько файлов открыто одновременно)
+RUN_SUFFIX = '.run'
+CLOSING_MESSAGES = ('Served request',)  # последняя строка RPC в terraform-plugin-go
+
+
+def closes_request(obj):
+    """True, если строка лога завершает запрос (группу можно выгружать первой)."""
+    return 'tf_req_duration_ms' in obj or obj.get('@message') in CLOSING_MESSAGES
+
+
+def _key(req_id):
+    """Ключ сортировки серий: JSON tf_req_id (без перевода строк и табуляций — их JSON экранирует)."""
+    return json.dumps(req_id, ensure_ascii=False)
+
+
+def _read_run(path):
+    """Куски групп серии по порядку: (ключ, номер первой строки, [строки])."""
+    with open(path, encoding='utf-8', newline='') as f:
+        for header in f:
+            key, first, count = header.rstrip('\n').split('\t')
+            yield key, int(first), list(islice(f, int(count)))
+
+
+class GroupStore:
+    """
+    add(req_id, lineno, line) — запись группы (line — строка JSONL с '\\n');
+    complete(req_id) — запрос закончен. items() — (tf_req_id, [записи]) после разбора.
+
+    spill_dir — папка для серий; по умолчанию своя временная, удаляется вместе с хранилищем.
+    Процессы пула пишут серии в папку родителя и передают ему состояние через export() / absorb().
+    """
+
+    def __init__(self, memory_bytes=GROUP_MEMORY_BYTES, spill_dir=None):
+        self.memory_bytes = memory_bytes
+        self.runs = []  # файлы серий
+        self.spilled_bytes = 0
+        self._groups = OrderedDict()  # req_id -> [первая строка, байт, [строки]], от холодных к горячим
+        self._used = 0
+        self._ids = set()      # все ключи, и в памяти, и в сериях
+        self._spilled = set()  # ключи, у которых есть куски в сериях
+        self._spill_dir = spill_dir
+        self._finalizer = None
+
+    def spill_dir(self):
+        if self._spill_dir is None:
+            self._spill_dir = tempfile.mkdtemp(prefix='tflog_groups_')
+            self._finalizer = weakref.finalize(self, shutil.rmtree, self._spill_dir, ignore_errors=True)
+        return self._spill_dir
+
+    def close(self):
+        """Удаляет серии (и свою временную папку)."""
+        for path in self.runs:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self.runs = []
+        if self._finalizer is not None:
+            self._finalizer()
+
+    # --- накопление ---
+    def add(self, req_id, lineno, line):
+        group = self._groups.get(req_id)
+        if group is None:
+            self._ids.add(req_id)
+            group = self._groups[req_id] = [lineno, 0, []]
+        else:
+            self._groups.move_to_end(req_id)
+        size = len(line) + LINE_OVERHEAD
+        group[1] += size
+        group[2].append(line)
+        self._used += size
+        if self._used > self.memory_bytes:
+            self.spill()
+
+    def complete(self, req_id):
+        if req_id in self._groups:
+            self._groups.move_to_end(req_id, last=False)  # первой на выгрузку
+
+    def spill(self, target=None):
+        """Выгружает холодные группы одной серией, пока в памяти не останется target байт."""
+        target = int(self.memory_bytes * SPILL_FRACTION) if target is None else target
+        chunks = []
+        while self._groups and self._used > target:
+            req_id, group = self._groups.popitem(last=False)
+            self._used -= group[1]
+            chunks.append((req_id, group))
+        self._write_run(chunks)
+
+    def _write_run(self, chunks):
+        if not chunks:
+            return
+        fd, path = tempfile.mkstemp(dir=self.spill_dir(), suffix=RUN_SUFFIX)
+        with os.fdopen(fd, 'w', encoding='utf-8', newline='') as f:
+            for key, first, lines in sorted(((_key(req_id), group[0], group[2]) for req_id, group in chunks),
+                                            key=itemgetter(0, 1)):
+                f.write(f'{key}\t{first}\t{len(lines)}\n')
+                f.writelines(lines)
+            self.spilled_bytes += f.tell()
+        self.runs.append(path)
+        self._spilled.update(req_id for req_id, _ in chunks)
+
+    # --- передача между процессами ---
+    def export(self):
+        """Состояние для родителя (absorb); серии остаются на диске и переходят к нему."""
+        state = {'runs': self.runs, 'groups': self._groups, 'ids': self._ids, 'spilled': self._spilled}
+        self.runs = []
+        return state
+
+    def absorb(self, state):
+        """Добавляет группы следующего куска файла, собранные в другом процессе (export())."""
+        # Кусок группы в памяти раньше кусков в сериях state — выгружаем его, иначе
+        # при склейке в памяти он перемешался бы с ними по номерам строк
+        clash = [(req_id, self._groups.pop(req_id)) for req_id in state['spilled'] if req_id in self._groups]
+        self._used -= sum(group[1] for _, group in clash)
+        self._write_run(clash)
+        self.runs.extend(state['runs'])
+        self._ids.update(state['ids'])
+        self._spilled.update(state['spilled'])
+        for req_id, (first, size, lines) in state['groups'].items():
+            group = self._groups.get(req_id)
+            if group is None:
+                self._groups[req_id] = [first, size, lines]
+            else:
+                group[1] += size
+                group[2].extend(lines)
+                self._groups.move_to_end(req_id)
+            self._used += size
+        if self._used > self.memory_bytes:
+            self.spill()
+
+    # --- результат ---
+    def __len__(self):
+        return len(self._ids)
+
+    def _compact(self):
+        """Сливает серии по MERGE_FANIN в одну, пока их больше MERGE_FANIN (многопроходное слияние)."""
+        while len(self.runs) > MERGE_FANIN:
+            batch, self.runs = self.runs[:MERGE_FANIN], self.runs[MERGE_FANIN:]
+            fd, path = tempfile.mkstemp(dir=self.spill_dir(), suffix=RUN_SUFFIX)
+            with os.fdopen(fd, 'w', encoding='utf-8', newline='') as f:
+                for key, first, lines in heapq.merge(*map(_read_run, batch), key=itemgetter(0, 1)):
+                    f.write(f'{key}\t{first}\t{len(lines)}\n')
+                    f.writelines(lines)
+            for old in batch:
+                os.remove(old)
+            self.runs.append(path)
+
+    def iter_lines(self):
+        """(tf_req_id, [строки JSONL]) по возрастанию ключа; серии читаются потоково."""
+        self._compact()
+        memory = sorted(((_key(req_id), group[0], group[2]) for req_id, group in self._groups.items()),
+                        key=itemgetter(0, 1))
+        streams = [_read_run(path) for path in self.runs] + [iter(memory)]
+        for key, chunks in groupby(heapq.merge(*streams, key=itemgetter(0, 1)), key=itemgetter(0)):
+            lines = []
+            for _, _, part in chunks:
+                lines.extend(part)
+            yield json.loads(key), lines
+
+    def items(self):
+        for req_id, lines in self.iter_lines():
+            yield req_id, [json.loads(line) for line in lines]
+
+    def keys(self):
+        return iter(sorted(self._ids, key=_key))
+
+    __iter__ = keys
@@ -0,0 +1,131 @@
+"""
+sampling.py
+Выборка trace/debug-записей для огромных логов: их на порядки больше остальных,
+а смысл чаще всего несут ошибки и то, что к ним привело.
+
+Всегда остаются записи прочих уровней (error / warn / info / ...), границы секций и все
+записи запроса (tf_req_id), в котором есть запись уровня error / fatal. Остальные trace/debug:
+- с долей rate — решение по хэшу номера строки: детерминированно, не зависит ни от порядка
+  обхода, ни от разбиения файла на куски (параллельный разбор выбирает те же строки);
+- или, при per_rpc, не больше per_rpc записей на каждое значение tf_rpc (резервуарная выборка,
+  алгоритм R с seed); записи trace/debug без tf_rpc — по-прежнему с долей rate.
+
+Нужны два прохода: observe() по всем записям (запросы с ошибками, резервуары), затем keep()
+по записям в порядке вывода. Счётчики keep() — сколько записей каждого уровня было и сколько
+осталось — в stats(): по ним числа из выборки пересчитываются обратно на весь лог.
+"""
+
+import random
+
+SAMPLED_LEVELS = ('trace', 'debug')
+ERROR_LEVELS = ('error', 'fatal')
+_MASK64 = (1 << 64) - 1
+
+
+def line_fraction(key, seed=0):
+    """Псевдослучайное число в [0, 1) по номеру строки (splitmix64): одно и то же при каждом прогоне."""
+    x = (key * 0x9E3779B97F4A7C15 + seed) & _MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return ((x ^ (x >> 31)) >> 11) / (1 << 53)
+
+
+class Sampler:
+    """
+    rate — доля trace/debug-записей, которая остаётся (1 — все); per_rpc — резервуар на tf_rpc
+    (None — без резервуаров); keep_error_requests — оставлять запросы с ошибками целиком.
+    Ключ записи (key) — номер строки: lineno в main.py, index в api.py.
+    """
+
+    def __init__(self, rate=1.0, per_rpc=None, keep_error_requests=True, seed=0):
+        if not 0 <= rate <= 1:
+            raise ValueError(f"доля выборки должна быть в [0, 1]: {rate!r}")
+        if per_rpc is not None and per_rpc < 0:
+            raise ValueError(f"размер резервуара не может быть отрицательным: {per_rpc!r}")
+        self.rate = rate
+        self.per_rpc = per_rpc
+        self.keep_error_requests = keep_error_requests
+        self.seed = seed
+        self.error_requests = set()
+        self._random = random.Random(seed)
+        self._reservoirs = {}  # tf_rpc -> [сколько записей видели, [ключи выбранных]]
+        self._chosen = None    # ключи из всех резервуаров, после finish_observe()
+        self.reset_counts()
+
+    # --- проход 1 ---
+    @property
+    def needs_observe(self):
+        return self.keep_error_requests or self.per_rpc is not None
+
+    def observe(self, key, level, req_id=None, rpc=None):
+        if self.keep_error_requests and req_id and level in ERROR_LEVELS:
+            self.error_requests.add(req_id)
+        if self.per_rpc is not None and rpc and level in SAMPLED_LEVELS:
+            reservoir = self._reservoirs.get(rpc)
+            if reservoir is None:
+                reservoir = self._reservoirs[rpc] = [0, []]
+            reservoir[0] += 1
+            if len(reservoir[1]) < self.per_rpc:
+                reservoir[1].append(key)
+            else:
+                j = self._random.randrange(reservoir[0])
+                if j < self.per_rpc:
+                    reservoir[1][j] = key
+
+    def finish_observe(self):
+        self._chosen = {key for _, keys in self._reservoirs.values() for key in keys}
+
+    # --- проход 2 ---
+    def keep(self, key, level, req_id=None, rpc=None, boundary=False):
+        """Оставить ли запись; boundary — запись начинает или заканчивает секцию."""
+        if level not in SAMPLED_LEVELS:
+            return True
+        self.seen[level] += 1
+        if boundary or (req_id and req_id in self.error_requests):
+            keep = True
+        elif self.per_rpc is not None and rpc:
+            keep = key in self._chosen
+        else:
+            keep = self.rate >= 1 or line_fraction(key, self.seed) < self.rate
+        if keep:
+            self.kept[level] += 1
+        return keep
+
+    def reset_counts(self):
+        self.seen = dict.fromkeys(SAMPLED_LEVELS, 0)
+        self.kept = dict.fromkeys(SAMPLED_LEVELS, 0)
+
+    def merge_counts(self, counts):
+        """Счётчики keep() другого экземпляра (counts()) — для параллельного разбора."""
+        for level, n in counts['seen'].items():
+            self.seen[level] += n
+        for level, n in counts['kept'].items():
+            self.kept[level] += n
+
+    def counts(self):
+        return {'seen': dict(self.seen), 'kept': dict(self.kept)}
+
+    def stats(self):
+        """
+        Параметры выборки и её итог по уровням: seen — записей в логе, kept — осталось,
+        ratio = kept / seen; число записей уровня в логе ≈ число в выборке / ratio.
+        """
+        levels = {level: {'seen': self.seen[level], 'kept': self.kept[level],
+                          'ratio': self.kept[level] / self.seen[level] if self.seen[level] else 1.0}
+                  for level in SAMPLED_LEVELS}
+        return {'rate': self.rate, 'per_rpc': self.per_rpc, 'seed': self.seed,
+                'error_requests': len(self.error_requests), 'rpcs': len(self._reservoirs),
+                'levels': levels}
+
+
+def combine_stats(parts):
+    """Итог нескольких выборок (Sampler.stats() по файлам) — как если бы это была одна."""
+    levels = {}
+    for level in SAMPLED_LEVELS:
+        seen = sum(part['levels'][level]['seen'] for part in parts)
+        kept = sum(part['levels'][level]['kept'] for part in parts)
+        levels[level] = {'seen': seen, 'kept': kept, 'ratio': kept / seen if seen else 1.0}
+    first = parts[0]
+    return {'rate': first['rate'], 'per_rpc': first['per_rpc'], 'seed': first['seed'],
+            'error_requests': sum(part['error_requests'] for part in parts),
+            'rpcs': sum(part['rpcs'] for part in parts), 'levels': levels}
@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+"""
+sidecar_index.py
+Бинарный индекс-«сайдкар» к выходному JSONL (parsed.jsonl -> parsed.jsonl.idx).
+
+Что хранит:
+- байтовое смещение каждой записи в JSONL и её lineno;
+- байтовое смещение исходной строки во входном логе (если вход не сжат) — для source_line();
+- posting-листы (номера записей) по tf_req_id / tf_resource_type / level / section;
+- min/max timestamp (epoch ns) для каждого блока из BLOCK_SIZE записей.
+
+Формат файла:
+    MAGIC (8 байт) | длина заголовка (uint64 LE) | заголовок (JSON) |
+    offsets (uint64 * count) | linenos (uint64 * count) | postings (uint32 ...) |
+    blocks (int64 * 2 * n_blocks) [| source_offsets (uint64 * count)] |
+    для каждого поля: <поле>.keys (байты значений) | <поле>.key_offsets (uint64 * (n + 1)) |
+                      <поле>.refs (uint64 * 2 * n: начало и длина posting-листа)
+Словарь значений поля — таблица, отсортированная по байтам UTF-8: значение ищется двоичным
+поиском прямо в файле. Заголовок хранит только размещение секций, число значений каждого
+поля и путь к входному логу (source), так что открытие индекса не зависит от числа tf_req_id.
+
+ParsedIndex отображает файл в память (mmap), читает только нужные posting-листы и смещения
+и сразу seek'ается к подходящим записям, поэтому выборка стоит O(совпадений), а не O(файла).
+"""
+
+import argparse
+import bisect
+import json
+import mmap
+import struct
+import sys
+from array import array
+from pathlib import Path
+
+from timestamps import NAT as TS_NONE, parse_ts_ns
+
+MAGIC = b'TFIDX\x00\x02\x00'
+INDEX_SUFFIX = '.idx'
+BLOCK_SIZE = 1024  # записей на блок min/max timestamp
+INDEXED_FIELDS = ('tf_req_id', 'tf_resource_type', 'level', 'section')
+
+
+def index_path_for(path_out):
+    path_out = Path(path_out)
+    return path_out.with_name(path_out.name + INDEX_SUFFIX)
+
+
+def index_entry(record, nbytes, source_offset=None):
+    """
+    Всё, что индексу нужно знать о записи; компактный кортеж (передаётся и из воркеров).
+    source_offset — смещение исходной строки во входном логе (None — неизвестно).
+    """
+    raw = record.get('raw_full_json') or {}
+    return (
+        record['lineno'],
+        nbytes,
+        source_offset,
+        record.get('tf_req_id'),
+        raw.get('tf_resource_type') if isinstance(raw, dict) else None,
+        record.get('level'),
+        record.get('section'),
+        parse_ts_ns(record.get('timestamp')),
+    )
+
+
+class IndexWriter:
+    """Копит индекс по мере записи JSONL (записи добавляются строго в порядке вывода)."""
+
+    def __init__(self, path_out, source=None):
+        self.path = index_path_for(path_out)
+        self.source = source
+        self.offsets = array('Q')
+        self.linenos = array('Q')
+        self.source_offsets = array('Q')  # отбрасываются, если хоть одно смещение неизвестно
+        self.postings = {field: {} for field in INDEXED_FIELDS}
+        self.blocks = array('q')
+        self._pos = 0
+
+    def add(self, entry):
+        lineno, nbytes, source_offset, *keys, ts = entry
+        ordinal = len(self.offsets)
+        self.offsets.append(self._pos)
+        self.linenos.append(lineno)
+        if source_offset is None:
+            self.source = None
+        elif self.source is not None:
+            self.source_offsets.append(source_offset)
+        self._pos += nbytes
+        for field, value in zip(INDEXED_FIELDS, keys):
+            if value is not None:
+                self.postings[field].setdefault(str(value), array('I')).append(ordinal)
+
+        if ordinal % BLOCK_SIZE == 0:
+            self.blocks.extend((TS_NONE, TS_NONE))
+        if ts is not None:
+            lo, hi = self.blocks[-2], self.blocks[-1]
+            if lo == TS_NONE or ts < lo:
+                self.blocks[-2] = ts
+            if hi == TS_NONE or ts > hi:
+                self.blocks[-1] = ts
+
+    def write(self):
+        fields = {}
+        postings = array('I')
+        vocabulary = []
+        for field, values in self.postings.items():
+            keys = array('B')
+            key_offsets = array('Q', [0])
+            refs = array('Q')
+            for key, value in sorted((value.encode('utf-8'), value) for value in values):
+                ordinals = values[value]
+                refs.extend((len(postings), len(ordinals)))
+                postings.extend(ordinals)
+                keys.frombytes(key)
+                key_offsets.append(len(keys))
+            fields[field] = len(values)
+            vocabulary += [(f'{field}.keys', keys), (f'{field}.key_offsets', key_offsets),
+                           (f'{field}.refs', refs)]
+
+        arrays = [('offsets', self.offsets), ('linenos', self.linenos),
+                  ('postings', postings), ('blocks', self.blocks)]
+        if self.source is not None:
+            arrays.append(('source_offsets', self.source_offsets))
+        arrays += vocabulary
+        sections = {}
+        pos = 0
+        for name, arr in arrays:
+            nbytes = len(arr) * arr.itemsize
+            sections[name] = [pos, nbytes]
+            pos += nbytes
+
+        header = json.dumps({
+            'version': 2,
+            'byteorder': sys.byteorder,
+            'count': len(self.offsets),
+            'data_size': self._pos,
+            'block_size': BLOCK_SIZE,
+            'sections': sections,
+            'fields': fields,
+            'source': str(Path(self.source).resolve()) if self.source is not None else None,
+        }, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+        with self.path.open('wb') as f:
+            f.write(MAGIC)
+            f.write(struct.pack('<Q', len(header)))
+            f.write(header)
+            for _, arr in arrays:
+                arr.tofile(f)
+        return self.path
+
+
+class ParsedIndex:
+    """
+    Чтение parsed.jsonl через сайдкар-индекс:
+        with ParsedIndex('parsed.jsonl') as idx:
+            for rec in idx.lookup(tf_req_id='...', level='error'): ...
+    """
+
+    def __init__(self, path_out):
+        self.data_path = Path(path_out)
+        self.path = index_path_for(path_out)
+        with self.path.open('rb') as f:
+            self._idx = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._idx[:len(MAGIC)] != MAGIC:
+            self._idx.close()
+            raise ValueError(f"{self.path}: не индекс TFIDX этой версии (пересоздайте его: --index)")
+        (header_len,) = struct.unpack_from('<Q', self._idx, len(MAGIC))
+        self._base = len(MAGIC) + 8 + header_len
+        self.header = json.loads(self._idx[len(MAGIC) + 8:self._base])
+        self._swap = self.header['byteorder'] != sys.byteorder
+        self.count = self.header['count']
+        self._data = self.data_path.open('rb')
+        self._linenos = None
+        self._source = None
+
+    def close(self):
+        self._idx.close()
+        self._data.close()
+        if self._source is not None:
+            self._source.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    # --- низкоуровневое чтение секций ---
+    def _read(self, section, typecode, start, count):
+        arr = array(typecode)
+        pos = self._base + self.header['sections'][section][0] + start * arr.itemsize
+        arr.frombytes(self._idx[pos:pos + count * arr.itemsize])
+        if self._swap:
+            arr.byteswap()
+        return arr
+
+    def _key(self, field, i):
+        """i-е значение словаря поля — байты UTF-8."""
+        start, end = self._read(f'{field}.key_offsets', 'Q', i, 2)
+        pos = self._base + self.header['sections'][f'{field}.keys'][0]
+        return self._idx[pos + start:pos + end]
+
+    def _find(self, field, value):
+        """Номер значения в словаре поля (двоичный поиск по таблице в файле) или None."""
+        key = str(value).encode('utf-8')
+        lo, hi = 0, self.header['fields'][field]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(field, mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.header['fields'][field] and self._key(field, lo) == key:
+            return lo
+        return None
+
+    def values(self, field):
+        """Все проиндексированные значения поля (например, все tf_req_id), по возрастанию байт."""
+        return [self._key(field, i).decode('utf-8') for i in range(self.header['fields'][field])]
+
+    def postings(self, field, value):
+        """Номера записей (по возрастанию), у которых field == value."""
+        i = self._find(field, value)
+        if i is None:
+            return array('I')
+        start, count = self._read(f'{field}.refs', 'Q', 2 * i, 2)
+        return self._read('postings', 'I', start, count)
+
+    def read_record(self, ordinal):
+        offset = self._read('offsets', 'Q', ordinal, 1)[0]
+        self._data.seek(offset)
+        return json.loads(self._data.readline())
+
+    def ordinal(self, lineno):
+        """Номер записи по номеру строки исходного лога (None, если такой записи нет)."""
+        if self._linenos is None:
+            self._linenos = self._read('linenos', 'Q', 0, self.count)
+        i = bisect.bisect_left(self._linenos, lineno)
+        if i < self.count and self._linenos[i] == lineno:
+            return i
+        return None
+
+    def get(self, lineno):
+        """Запись по номеру строки исходного лога (None, если такой записи нет)."""
+        i = self.ordinal(lineno)
+        return self.read_record(i) if i is not None else None
+
+    def source_line(self, ordinal):
+        """
+        Исходная строка записи из входного лога (bytes, без перевода строки) — одним seek'ом.
+        None, если индекс без смещений (вход был сжат) или входного лога уже нет.
+        """
+        if 'source_offsets' not in self.header['sections']:
+            return None
+        if self._source is None:
+            try:
+                self._source = open(self.header['source'], 'rb')
+            except OSError:
+                return None
+        self._source.seek(self._read('source_offsets', 'Q', ordinal, 1)[0])
+        # '\r' внутри JSON-строки не бывает (экранируется), так что он — конец строки
+        return self._source.readline().rstrip(b'\n').split(b'\r', 1)[0]
+
+    def _time_blocks(self, since_ns, until_ns):
+        """Номера блоков, в которых могут быть записи из [since_ns, until_ns] (по min/max блока)."""
+        n_blocks = -(-self.count // self.header['block_size'])
+        blocks = self._read('blocks', 'q', 0, 2 * n_blocks)
+        found = []
+        for b in range(n_blocks):
+            lo, hi = blocks[2 * b], blocks[2 * b + 1]
+            if lo == TS_NONE:
+                continue
+            if (since_ns is not None and hi < since_ns) or (until_ns is not None and lo > until_ns):
+                continue
+            found.append(b)
+        return found
+
+    def _time_candidates(self, since_ns, until_ns):
+        block_size = self.header['block_size']
+        for b in self._time_blocks(since_ns, until_ns):
+            yield from range(b * block_size, min((b + 1) * block_size, self.count))
+
+    def lookup(self, tf_req_id=None, tf_resource_type=None, level=None, section=None,
+               since=None, until=None):
+        """
+        Записи, удовлетворяющие всем заданным условиям, в порядке файла.
+        since/until — ISO-строки или epoch ns; записи без timestamp при фильтре по времени отбрасываются.
+        """
+        wanted = {'tf_req_id': tf_req_id, 'tf_resource_type': tf_resource_type,
+                  'level': level, 'section': section}
+        lists = [self.postings(field, value) for field, value in wanted.items() if value is not None]
+        since_ns = parse_ts_ns(since) if isinstance(since, str) else since
+        until_ns = parse_ts_ns(until) if isinstance(until, str) else until
+        timed = since_ns is not None or until_ns is not None
+
+        if lists:
+            lists.sort(key=len)
+            smallest, rest = lists[0], lists[1:]
+            candidates = (o for o in smallest if all(_contains(arr, o) for arr in rest))
+            if timed:  # и здесь отбрасываем записи из блоков, которые не пересекают интервал
+                block_size = self.header['block_size']
+                blocks = set(self._time_blocks(since_ns, until_ns))
+                candidates = (o for o in candidates if o // block_size in blocks)
+        elif timed:
+            candidates = self._time_candidates(since_ns, until_ns)
+        else:
+            candidates = range(self.count)
+
+        for ordinal in candidates:
+            record = self.read_record(ordinal)
+            if timed:
+                ts = parse_ts_ns(record.get('timestamp'))
+                if ts is None or (since_ns is not None and ts < since_ns) \
+                        or (until_ns is not None and ts > until_ns):
+                    continue
+            yield record
+
+
+def _contains(sorted_arr, value):
+    i = bisect.bisect_left(sorted_arr, value)
+    return i < len(sorted_arr) and sorted_arr[i] == value
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Выборка из parsed.jsonl по сайдкар-индексу (.idx)")
+    parser.add_argument('parsed', help="выходной JSONL process_file (рядом должен лежать .idx)")
+    parser.add_argument('--req-id')
+    parser.add_argument('--resource-type')
+    parser.add_argument('--level')
+    parser.add_argument('--section')
+    parser.add_argument('--since')
+    parser.add_argument('--until')
+    parser.add_argument('--lineno', type=int)
+    parser.add_argument('--source', action='store_true',
+                        help="печатать исходную строку входного лога вместо разобранной записи (для --lineno)")
+    args = parser.parse_args()
+
+    with ParsedIndex(args.parsed) as idx:
+        if args.lineno is not None and args.source:
+            i = idx.ordinal(args.lineno)
+            line = idx.source_line(i) if i is not None else None
+            if line is not None:
+                sys.stdout.buffer.write(line + b'\n')
+            sys.exit(0 if line is not None else 1)
+        if args.lineno is not None:
+            found = [r for r in [idx.get(args.lineno)] if r is not None]
+        else:
+            found = idx.lookup(tf_req_id=args.req_id, tf_resource_type=args.resource_type,
+                               level=args.level, section=args.section,
+                               since=args.since, until=args.until)
+        for record in found:
+            print(json.dumps(record, ensure_ascii=False))
@@ -1,120 +1,94 @@
 # app.py
 import streamlit as st
-import json, re
 from pathlib import Path
-from datetime import datetime
 
-st.set_page_config(page_title="TF Log Explorer", layout="wide")
+import numpy as np
+import pandas as pd
+import plotly.express as px
 
-ISO_TS_RE = re.compile(r'\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(?:\.\d+)?(?:[+-]\d{2}:\d{2})?')
-LEVEL_KEYWORDS = {
-    'fatal': 'fatal', 'error': 'error', 'err': 'error', 'warn': 'warning',
-    'warning': 'warning', 'info': 'info', 'debug': 'debug', 'trace': 'trace'
-}
-PLAN_START_PHRASES = ['cli command args', 'plan', '"plan"', 'plan is starting', '"terraform plan"']
-PLAN_END_PHRASES = ['plan is complete', 'plan is not applyable', 'plan operation completed']
-APPLY_START_PHRASES = ['apply', '"apply"', 'apply operation', 'starting apply operation', 'apply is starting']
-APPLY_END_PHRASES = ['apply operation completed', 'apply operation finished', 'apply finished']
-
-def guess_timestamp(obj):
-    for key in ('@timestamp', 'timestamp', 'time'):
-        if key in obj and obj[key]:
-            return str(obj[key])
-    msg = obj.get('@message') or obj.get('message') or ''
-    m = ISO_TS_RE.search(msg)
-    if m:
-        return m.group(0)
-    return None
-
-def guess_level(obj):
-    for key in ('@level', 'level', 'log.level'):
-        if key in obj and obj[key]:
-            return str(obj[key]).lower()
-    msg = (obj.get('@message') or obj.get('message') or '').lower()
-    for kw, lvl in LEVEL_KEYWORDS.items():
-        if kw in msg:
-            return lvl
-    return 'info'
-
-def detect_section(msg, current):
-    m = (msg or '').lower()
-    # starts
-    if any(p in m for p in PLAN_START_PHRASES):
-        return 'plan'
-    if any(p in m for p in APPLY_START_PHRASES):
-        return 'apply'
-    # ends
-    if any(p in m for p in PLAN_END_PHRASES) or any(p in m for p in APPLY_END_PHRASES):
-        return None
-    return current
+from body_cache import BodyCache
+from search_index import SearchIndex
+from timestamps import NAT
+import explorer
+from explorer import safe_parse_json_field, log_tz, filter_mask, top_groups
+
+st.set_page_config(page_title="TF Log Explorer", layout="wide")
 
-def safe_parse_json_field(s):
-    if not s:
+TABLE_PAGE_SIZE = 1000  # table rows sent to the browser per page
+
+# every per-file cache is keyed by a short data key (upload id or path) and gets the data
+# as an underscore argument, so a rerun does not hash the whole uploaded file again
+# (the server is long-lived: only the last few files keep their records, index, frame and figure)
+MAX_CACHED_FILES = 3
+
+@st.cache_resource
+def get_body_cache():
+    """decoded HTTP bodies survive reruns; size-bounded LRU, bodies are decoded only on expand"""
+    return BodyCache(safe_parse_json_field, max_bytes=64 * 1024 * 1024)
+
+@st.cache_resource(max_entries=MAX_CACHED_FILES)
+def load_and_parse(data_key, _path_or_bytes):
+    """cached per file; the parsing itself is explorer.load_and_parse"""
+    return explorer.load_and_parse(_path_or_bytes)
+
+@st.cache_resource(max_entries=MAX_CACHED_FILES)
+def get_search_index(data_key, _path_or_bytes):
+    """inverted index over the loaded file, built once and reused by every rerun"""
+    return SearchIndex(load_and_parse(data_key, _path_or_bytes))
+
+@st.cache_resource(max_entries=MAX_CACHED_FILES)
+def get_ts_column(data_key, _path_or_bytes):
+    """timestamps of the loaded file as int64 epoch ns (NAT where missing), parsed once"""
+    return explorer.ts_column(_path_or_bytes, load_and_parse(data_key, _path_or_bytes))
+
+@st.cache_resource(max_entries=MAX_CACHED_FILES)
+def get_frame(data_key, _path_or_bytes):
+    """table of short fields with categorical level/section/tf_req_id; filters are masks over it"""
+    return explorer.records_frame(load_and_parse(data_key, _path_or_bytes), get_ts_column(data_key, _path_or_bytes))
+
+@st.cache_resource(max_entries=MAX_CACHED_FILES)
+def get_top_groups(data_key, _path_or_bytes):
+    return top_groups(get_frame(data_key, _path_or_bytes))
+
+@st.cache_resource(max_entries=MAX_CACHED_FILES)
+def get_timeline(data_key, _path_or_bytes):
+    """gantt figure of the file, or None when no record has both tf_req_id and a timestamp"""
+    frame = get_frame(data_key, _path_or_bytes)
+    # group on the parsed ns column: min/max are real instants, not string order
+    df_ts = frame.loc[frame['tf_req_id'].notna() & (frame['ts_ns'] != NAT), ['tf_req_id', 'ts_ns']]
+    spans = df_ts.groupby('tf_req_id', sort=False, observed=True)['ts_ns'].agg(['min', 'max', 'count'])
+    if spans.empty:
         return None
-    if isinstance(s, (dict, list)):
-        return s
-    try:
-        return json.loads(s)
-    except Exception:
-        try:
-            return json.loads(s.replace("'", '"'))
-        except Exception:
-            return s
-
-@st.cache_data
-def load_and_parse(path_or_bytes):
-    """
-    path_or_bytes: either bytes from uploader, or path string
-    returns list of records (dicts)
-    """
-    records = []
-    section = None
-    if isinstance(path_or_bytes, (bytes, bytearray)):
-        lines = path_or_bytes.decode('utf-8', errors='replace').splitlines()
-    else:
-        p = Path(path_or_bytes)
-        with p.open('r', encoding='utf-8', errors='replace') as f:
-            lines = f.readlines()
-    for i, raw in enumerate(lines, start=1):
-        raw = raw.strip()
-        if not raw:
-            continue
-        try:
-            obj = json.loads(raw)
-        except Exception:
-            obj = {'@message': raw, '_parse_error': True}
-        ts = guess_timestamp(obj)
-        level = guess_level(obj)
-        section = detect_section(obj.get('@message') or obj.get('message') or '', section)
-        rec = {
-            'lineno': i,
-            'timestamp': ts,
-            'level': level,
-            'message': (obj.get('@message') or obj.get('message') or '')[:1000],
-            'raw': obj,
-            'section': section,
-            'tf_req_id': obj.get('tf_req_id') or obj.get('tf_http_trans_id') or None,
-            'has_req_body': 'tf_http_req_body' in obj,
-            'has_res_body': 'tf_http_res_body' in obj
-        }
-        records.append(rec)
-    return records
-
-def filter_records(records, tf_req_id=None, tf_resource_type=None, q=None, date_from=None, date_to=None):
-    res = records
-    if tf_req_id:
-        res = [r for r in res if r['tf_req_id'] == tf_req_id]
-    if tf_resource_type:
-        # try to find in raw or message
-        res = [r for r in res if tf_resource_type in (json.dumps(r['raw']) + ' ' + (r['message'] or ''))]
-    if q:
-        ql = q.lower()
-        res = [r for r in res if ql in (json.dumps(r['raw']).lower() + ' ' + (r['message'] or '').lower())]
-    if date_from:
-        res = [r for r in res if r['timestamp'] and r['timestamp'] >= date_from]
-    if date_to:
-        res = [r for r in res if r['timestamp'] and r['timestamp'] <= date_to]
-    return res
+    tz = log_tz(load_and_parse(data_key, _path_or_bytes))
+    df_tl = spans.reset_index().rename(columns={'min': 'start', 'max': 'end'})
+    df_tl['tf_req_id'] = df_tl['tf_req_id'].astype(str)
+    for col in ('start', 'end'):
+        df_tl[col] = pd.to_datetime(df_tl[col], unit='ns', utc=True)
+        if tz is not None:
+            df_tl[col] = df_tl[col].dt.tz_convert(tz)
+    fig = px.timeline(df_tl, x_start="start", x_end="end", y="tf_req_id",
+                      color="count", hover_data=["count"])
+    fig.update_yaxes(autorange="reversed")  # сверху вниз
+    return fig
+
+def pager(total, page_size, key):
+    """page picker under a list of total rows; returns the slice of the visible page"""
+    pages = max(1, -(-total // page_size))
+    if st.session_state.get(key, 1) > pages:  # the filter shrank the list under the current page
+        st.session_state[key] = pages
+    page = st.number_input(f"Страница (всего {pages})", min_value=1, max_value=pages, value=1, step=1, key=key)
+    start = (page - 1) * page_size
+    return slice(start, min(start + page_size, total))
+
+def show_record(r, header, key_prefix):
+    with st.expander(header):
+        st.json(r['raw'])
+        if r['has_req_body']:
+            if st.button(f"Показать req body (lineno {r['lineno']})", key=f"{key_prefix}req_{r['lineno']}"):
+                st.json(get_body_cache().get(r['raw'].get('tf_http_req_body')))
+        if r['has_res_body']:
+            if st.button(f"Показать res body (lineno {r['lineno']})", key=f"{key_prefix}res_{r['lineno']}"):
+                st.json(get_body_cache().get(r['raw'].get('tf_http_res_body')))
 
 # --- UI ---
 st.title("Terraform Log Explorer — чекпойнт 2 (MVP)")
@@ -122,7 +96,7 @@ st.title("Terraform Log Explorer — чекпойнт 2 (MVP)")
 col1, col2 = st.columns([2,1])
 
 with col1:
-    uploaded = st.file_uploader("Загрузить файл с логами (JSONL/JSON per line) или ввести путь справа", type=['json','txt'], accept_multiple_files=False)
+    uploaded = st.file_uploader("Загрузить файл с логами (JSONL/JSON per line, можно .gz/.zst) или ввести путь справа", type=['json','txt','gz','zst'], accept_multiple_files=False)
     st.markdown("Формат: одна JSON-строка на строке.")
     if uploaded is None:
         st.info("Можно перетянуть файл или указать путь в правой колонке.")
@@ -142,8 +116,10 @@ if uploaded is None and not path_input:
 
 # load
 data_source = uploaded.getvalue() if uploaded else path_input
+data_key = f"upload:{uploaded.file_id}" if uploaded else f"path:{path_input}"
 try:
-    records = load_and_parse(data_source)
+    records = load_and_parse(data_key, data_source)
+    frame = get_frame(data_key, data_source)
 except Exception as e:
     st.exception(e)
     st.stop()
@@ -151,10 +127,8 @@ except Exception as e:
 st.success(f"Загружено записей: {len(records)}")
 
 # Quick stats / sample groups
-from collections import Counter
-groups = Counter([r['tf_req_id'] for r in records if r['tf_req_id']])
 st.write("Найдено групп (tf_req_id) — топ 10:")
-st.table(list(groups.most_common(10)))
+st.table(get_top_groups(data_key, data_source))
 
 # Filters
 st.markdown("### Фильтры")
@@ -173,56 +147,40 @@ with c4:
 apply_filters = st.button("Применить фильтры")
 
 if apply_filters or True:
-    filtered = filter_records(records, tf_req_id=tf_req_id.strip() or None,
-                              tf_resource_type=tf_resource_type.strip() or None,
-                              q=q.strip() or None,
-                              date_from=date_from.strip() or None,
-                              date_to=date_to.strip() or None)
-    st.write(f"Найдено: {len(filtered)} записей")
-
-    # Show table of short fields
-    import pandas as pd
-    df = pd.DataFrame([{
-        'lineno': r['lineno'],
-        'timestamp': r['timestamp'],
-        'level': r['level'],
-        'section': r['section'],
-        'tf_req_id': r['tf_req_id'],
-        'message': (r['message'] or '')[:150],
-        'has_req_body': r['has_req_body'],
-        'has_res_body': r['has_res_body']
-    } for r in filtered])
-    st.dataframe(df, use_container_width=True)
+    try:
+        mask = filter_mask(frame, get_search_index(data_key, data_source),
+                           tf_req_id=tf_req_id.strip() or None,
+                           tf_resource_type=tf_resource_type.strip() or None,
+                           q=q.strip() or None,
+                           date_from=date_from.strip() or None,
+                           date_to=date_to.strip() or None,
+                           tz=log_tz(records))
+    except ValueError as e:
+        st.warning(str(e))
+        mask = np.zeros(len(frame), dtype=bool)
+    ids = np.flatnonzero(mask)
+    st.write(f"Найдено: {len(ids)} записей")
+
+    # Show table of short fields, one page at a time
+    view = frame.iloc[ids[pager(len(ids), TABLE_PAGE_SIZE, 'table_page')]]
+    st.dataframe(view.drop(columns='ts_ns'), use_container_width=True, hide_index=True)
 
     st.markdown("#### Просмотр записей (развернуть для полного JSON и тел)")
-    # show first N expanders
-    N = st.number_input("Показать первых N записей", min_value=1, max_value=500, value=50, step=10)
-    for r in filtered[:N]:
-        header = f"[{r['lineno']}] {r['timestamp']} | {r['level'].upper()} | section={r['section']} | tf_req_id={r['tf_req_id']}"
-        with st.expander(header):
-            st.json(r['raw'])
-            if r['has_req_body']:
-                if st.button(f"Показать req body (lineno {r['lineno']})", key=f"req_{r['lineno']}"):
-                    body = safe_parse_json_field(r['raw'].get('tf_http_req_body'))
-                    st.json(body)
-            if r['has_res_body']:
-                if st.button(f"Показать res body (lineno {r['lineno']})", key=f"res_{r['lineno']}"):
-                    body = safe_parse_json_field(r['raw'].get('tf_http_res_body'))
-                    st.json(body)
+    # only the visible page of expanders is rendered
+    N = st.number_input("Записей на странице", min_value=1, max_value=500, value=50, step=10)
+    for i in ids[pager(len(ids), N, 'records_page')].tolist():
+        r = records[i]
+        show_record(r, f"[{r['lineno']}] {r['timestamp']} | {r['level'].upper()} | section={r['section']} | tf_req_id={r['tf_req_id']}", "")
 
 st.markdown("---")
 st.markdown("### Группировка по tf_req_id")
 sel_id = st.text_input("Показать все записи группы tf_req_id (вставьте ID)", "")
 if sel_id:
-    group = [r for r in records if r['tf_req_id'] == sel_id]
+    group = np.flatnonzero((frame['tf_req_id'] == sel_id).to_numpy())
     st.write(f"Найдено {len(group)} записей в группе")
-    for r in group:
-        with st.expander(f"[{r['lineno']}] {r['timestamp']} | {r['level']}"):
-            st.json(r['raw'])
-            if r['has_req_body'] and st.button(f"req body group {r['lineno']}", key=f"greq_{r['lineno']}"):
-                st.json(safe_parse_json_field(r['raw'].get('tf_http_req_body')))
-            if r['has_res_body'] and st.button(f"res body group {r['lineno']}", key=f"gres_{r['lineno']}"):
-                st.json(safe_parse_json_field(r['raw'].get('tf_http_res_body')))
+    for i in group[pager(len(group), N, 'group_page')].tolist():
+        r = records[i]
+        show_record(r, f"[{r['lineno']}] {r['timestamp']} | {r['level']}", "g")
 
 st.markdown("---")
 st.caption("MVP: поиск, группировка и интерактивное разворачивание JSON. Дальше: API (FastAPI) и визуализация хронологии (Gantt/graph).")
@@ -230,36 +188,10 @@ st.caption("MVP: поиск, группировка и интерактивно
 
 
 # --------------------------------------------3_Чекпоинт--------------------------------------------------------------------------
-import plotly.express as px
-import pandas as pd
-from collections import defaultdict
-
 st.markdown("## Чекпоинт 3: Хронология запросов (Gantt chart)")
 
-timeline = []
-grouped = defaultdict(list)
-for r in records:
-    if r['tf_req_id'] and r['timestamp']:
-        grouped[r['tf_req_id']].append(r['timestamp'])
-
-for req_id, ts_list in grouped.items():
-    try:
-        ts_sorted = sorted(ts_list)
-        start, end = ts_sorted[0], ts_sorted[-1]
-        timeline.append({
-            "tf_req_id": req_id,
-            "start": start,
-            "end": end,
-            "count": len(ts_list)
-        })
-    except Exception:
-        pass
-
-if timeline:
-    df_tl = pd.DataFrame(timeline)
-    fig = px.timeline(df_tl, x_start="start", x_end="end", y="tf_req_id",
-                      color="count", hover_data=["count"])
-    fig.update_yaxes(autorange="reversed")  # сверху вниз
+fig = get_timeline(data_key, data_source)
+if fig is not None:
     st.plotly_chart(fig, use_container_width=True)
 else:
     st.info("Нет данных для построения диаграммы.")
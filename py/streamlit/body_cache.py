@@ -0,0 +1,54 @@
+"""
+body_cache.py
+LRU-кэш раскрытых HTTP-тел (tf_http_req_body / tf_http_res_body) с ограничением по размеру.
+
+Тела в логах хранятся строками и раскрываются только по запросу (когда пользователь
+разворачивает запись). Повторное раскрытие того же тела берётся из кэша; при превышении
+бюджета вытесняются давно не использованные тела. Размер оценивается по длине сырой строки.
+Кэш общий для потоков (один на процесс), поэтому доступ к словарю идёт под блокировкой;
+само раскрытие выполняется вне её.
+"""
+
+import threading
+from collections import OrderedDict
+
+
+class BodyCache:
+    def __init__(self, decode, max_bytes=64 * 1024 * 1024):
+        self.decode = decode
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()  # сырая строка -> раскрытое значение
+        self._lock = threading.Lock()
+
+    def get(self, raw):
+        """Раскрытое значение сырого тела raw (строки кэшируются, остальное — как есть)."""
+        if not isinstance(raw, str):
+            return self.decode(raw)
+        with self._lock:
+            try:
+                value = self._items[raw]
+            except KeyError:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._items.move_to_end(raw)
+                return value
+
+        value = self.decode(raw)
+        if len(raw) <= self.max_bytes:
+            with self._lock:
+                if raw not in self._items:  # другой поток мог успеть раскрыть то же тело
+                    self._items[raw] = value
+                    self.size += len(raw)
+                    while self.size > self.max_bytes:
+                        old_raw, _ = self._items.popitem(last=False)
+                        self.size -= len(old_raw)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.size = 0
@@ -0,0 +1,410 @@
+# explorer.py
+"""
+Parsing and filtering behind the Streamlit explorer (app.py), without Streamlit itself:
+app.py wraps these in st.cache_* and builds the UI; benchmarks and scripts import them directly.
+"""
+import json, re
+from collections.abc import Mapping
+from pathlib import Path
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import columnar
+from compressed_io import decompress_bytes, open_input
+from phrase_matcher import PhraseMatcher
+from timestamps import NAT, parse_ts_column, parse_ts_ns, ts_offset
+
+ISO_TS_RE = re.compile(r'\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(?:\.\d+)?(?:[+-]\d{2}:\d{2})?')
+LEVEL_KEYWORDS = {
+    'fatal': 'fatal', 'error': 'error', 'err': 'error', 'warn': 'warning',
+    'warning': 'warning', 'info': 'info', 'debug': 'debug', 'trace': 'trace'
+}
+PLAN_START_PHRASES = ['cli command args', 'plan', '"plan"', 'plan is starting', '"terraform plan"']
+PLAN_END_PHRASES = ['plan is complete', 'plan is not applyable', 'plan operation completed']
+APPLY_START_PHRASES = ['apply', '"apply"', 'apply operation', 'starting apply operation', 'apply is starting']
+APPLY_END_PHRASES = ['apply operation completed', 'apply operation finished', 'apply finished']
+
+# one precompiled matcher for all phrase tables (one scan per message);
+# level keywords get their own, they are only needed when @level is missing
+SECTION_MATCHER = PhraseMatcher({
+    'plan_start': PLAN_START_PHRASES,
+    'apply_start': APPLY_START_PHRASES,
+    'end': PLAN_END_PHRASES + APPLY_END_PHRASES,
+})
+BITS = SECTION_MATCHER.bits
+LEVEL_MATCHER = PhraseMatcher({kw: [kw] for kw in LEVEL_KEYWORDS})
+LEVEL_BITS = [(LEVEL_MATCHER.bits[kw], lvl) for kw, lvl in LEVEL_KEYWORDS.items()]
+
+class Categories:
+    """value <-> small int code, shared by every record of the process (level, section)"""
+    __slots__ = ('values', 'codes')
+
+    def __init__(self, values=()):
+        self.values = []
+        self.codes = {}
+        for value in values:
+            self.code(value)
+
+    def code(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+LEVELS = Categories(['trace', 'debug', 'info', 'warning', 'error', 'fatal'])
+SECTIONS = Categories([None, 'plan', 'apply'])
+
+RECORD_FIELDS = ('lineno', 'timestamp', 'level', 'message', 'raw', 'section', 'tf_req_id',
+                 'has_req_body', 'has_res_body')
+_SLOT_FIELDS = frozenset(RECORD_FIELDS) - {'level', 'section'}
+
+class Record(Mapping):
+    """
+    one parsed line as a read-only mapping of RECORD_FIELDS (r['level'], r.get(...), dict(r));
+    slots instead of a per-record dict, level and section are Categories codes
+    """
+    __slots__ = ('lineno', 'timestamp', 'level_code', 'message', 'raw', 'section_code', 'tf_req_id',
+                 'has_req_body', 'has_res_body')
+
+    def __init__(self, lineno, timestamp, level, message, raw, section, tf_req_id, has_req_body, has_res_body):
+        self.lineno = lineno
+        self.timestamp = timestamp
+        self.level_code = LEVELS.code(level)
+        self.message = message
+        if raw is not None:
+            self.raw = raw
+        self.section_code = SECTIONS.code(section)
+        self.tf_req_id = tf_req_id
+        self.has_req_body = has_req_body
+        self.has_res_body = has_res_body
+
+    def __getitem__(self, key):
+        if key == 'level':
+            return LEVELS.values[self.level_code]
+        if key == 'section':
+            return SECTIONS.values[self.section_code]
+        if key in _SLOT_FIELDS:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(RECORD_FIELDS)
+
+    def __len__(self):
+        return len(RECORD_FIELDS)
+
+    def __repr__(self):
+        return f"Record(lineno={self.lineno}, level={self['level']!r}, tf_req_id={self.tf_req_id!r})"
+
+# values that repeat all over a log: one shared str per distinct value instead of one per line
+# (not tf_req_id / tf_http_trans_id: those are unique per request, sharing them saves nothing)
+INTERNED_FIELDS = ('@level', '@module', '@caller', 'tf_provider_addr', 'tf_rpc', 'tf_proto_version',
+                   'tf_resource_type', 'tf_data_source_type')
+INTERNED_MESSAGE_LEN = 256  # short messages are mostly fixed phrases ("Served request", ...)
+MAX_KEY_SETS = 10000        # distinct key sets remembered; a log rarely has more than a few hundred
+MAX_STRINGS = 100000        # distinct shared strings; past that, new values stay unshared
+
+class StringTable:
+    """
+    shared strings of one load: lives as long as that load's records and is dropped with them,
+    so a long-running app does not keep the strings of every file it has ever opened
+    """
+    def __init__(self):
+        self.strings = {}
+        self.key_sets = {}  # tuple of keys as decoded -> the same keys as shared strings
+
+    def intern(self, value):
+        shared = self.strings.get(value)
+        if shared is None:
+            if len(self.strings) >= MAX_STRINGS:
+                return value
+            shared = self.strings[value] = value
+        return shared
+
+    def compact_raw(self, obj):
+        """
+        the decoded line with its keys and repeated values shared between records: json.loads
+        allocates fresh key strings for every line, here they become one copy per distinct key
+        """
+        keys = tuple(obj)
+        shared = self.key_sets.get(keys)
+        if shared is None:
+            if len(self.key_sets) >= MAX_KEY_SETS:
+                return obj
+            shared = self.key_sets[keys] = tuple(self.intern(k) for k in keys)
+        obj = dict(zip(shared, obj.values()))
+        for key in INTERNED_FIELDS:
+            value = obj.get(key)
+            if value.__class__ is str:
+                obj[key] = self.intern(value)
+        message = obj.get('@message')
+        if message.__class__ is str and len(message) <= INTERNED_MESSAGE_LEN:
+            obj['@message'] = self.intern(message)
+        return obj
+
+def guess_timestamp(obj):
+    for key in ('@timestamp', 'timestamp', 'time'):
+        if key in obj and obj[key]:
+            return str(obj[key])
+    msg = obj.get('@message') or obj.get('message') or ''
+    m = ISO_TS_RE.search(msg)
+    if m:
+        return m.group(0)
+    return None
+
+def guess_level(obj):
+    for key in ('@level', 'level', 'log.level'):
+        if key in obj and obj[key]:
+            return str(obj[key]).lower()
+    flags = LEVEL_MATCHER.match(obj.get('@message') or obj.get('message') or '')
+    for bit, lvl in LEVEL_BITS:
+        if flags & bit:
+            return lvl
+    return 'info'
+
+def detect_section(msg, current):
+    flags = SECTION_MATCHER.match(msg or '')
+    # starts
+    if flags & BITS['plan_start']:
+        return 'plan'
+    if flags & BITS['apply_start']:
+        return 'apply'
+    # ends
+    if flags & BITS['end']:
+        return None
+    return current
+
+def safe_parse_json_field(s):
+    if not s:
+        return None
+    if isinstance(s, (dict, list)):
+        return s
+    try:
+        return json.loads(s)
+    except Exception:
+        try:
+            return json.loads(s.replace("'", '"'))
+        except Exception:
+            return s
+
+def load_and_parse(path_or_bytes):
+    """
+    path_or_bytes: either bytes from uploader, or path string; gzip/zstd are detected
+    by magic bytes and decompressed on the fly, parquet/arrow output of main.py is
+    read column-wise (see load_columnar)
+    returns list of records (dicts)
+    """
+    if isinstance(path_or_bytes, (bytes, bytearray)):
+        lines = decompress_bytes(bytes(path_or_bytes)).decode('utf-8', errors='replace').splitlines()
+        return _parse_lines(lines)
+    if columnar.detect_format(path_or_bytes):
+        return load_columnar(path_or_bytes)
+    with open_input(Path(path_or_bytes), errors='replace') as f:
+        return _parse_lines(f)
+
+# columns of a parquet/arrow file the explorer needs; the rest (tf_rpc, flags…) is not read
+COLUMNAR_FIELDS = ('lineno', 'timestamp', 'level', 'section', 'tf_req_id', 'message',
+                   'has_req_body', 'has_res_body', 'raw_json')
+
+class ColumnarRecord(Record):
+    """record loaded from a parquet/arrow file: 'raw' is parsed from raw_json on first access"""
+    __slots__ = ('raw_json', 'strings')
+
+    def __getitem__(self, key):
+        if key != 'raw':
+            return Record.__getitem__(self, key)
+        try:
+            return self.raw
+        except AttributeError:
+            pass
+        try:
+            raw = self.strings.compact_raw(json.loads(self.raw_json))
+        except Exception:
+            raw = {'@message': self.raw_json, '_parse_error': True}
+        self.raw = raw
+        return raw
+
+def load_columnar(path):
+    """
+    records from parquet/arrow written by main.py (--format): only COLUMNAR_FIELDS are read,
+    column by column, and no line is json-parsed until its 'raw' is needed
+    """
+    table = columnar.read_table(path, COLUMNAR_FIELDS)
+    columns = [table.column(name).to_pylist() for name in COLUMNAR_FIELDS]
+    records = []
+    strings = StringTable()
+    for lineno, ts, level, section, req_id, message, has_req, has_res, raw_json in zip(*columns):
+        rec = ColumnarRecord(lineno, ts, level, (message or '')[:1000], None, section, req_id, has_req, has_res)
+        rec.raw_json = raw_json
+        rec.strings = strings
+        records.append(rec)
+    return records
+
+def ts_column(path_or_bytes, records):
+    """int64 epoch ns per record (NAT where missing); parquet/arrow files already store it"""
+    if not isinstance(path_or_bytes, (bytes, bytearray)) and columnar.detect_format(path_or_bytes):
+        return columnar.ts_ns_column(columnar.read_table(path_or_bytes, ['ts_ns']))
+    return parse_ts_column([r['timestamp'] for r in records])
+
+def _parse_lines(lines):
+    records = []
+    section = None
+    strings = StringTable()
+    for i, raw in enumerate(lines, start=1):
+        raw = raw.strip()
+        if not raw:
+            continue
+        try:
+            obj = strings.compact_raw(json.loads(raw))
+        except Exception:
+            obj = {'@message': raw, '_parse_error': True}
+        ts = guess_timestamp(obj)
+        level = guess_level(obj)
+        section = detect_section(obj.get('@message') or obj.get('message') or '', section)
+        records.append(Record(
+            i, ts, level,
+            (obj.get('@message') or obj.get('message') or '')[:1000],
+            obj, section,
+            obj.get('tf_req_id') or obj.get('tf_http_trans_id') or None,
+            'tf_http_req_body' in obj,
+            'tf_http_res_body' in obj,
+        ))
+    return records
+
+def log_tz(records):
+    """utc offset of the first timestamped record; naive dates in the filters are read in it"""
+    for r in records:
+        if r['timestamp']:
+            return ts_offset(r['timestamp'])
+    return None
+
+def time_bound_ns(value, tz=None):
+    """date filter input -> epoch ns; raises ValueError on input it can't read"""
+    try:
+        dt = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))  # 'Z' only from python 3.11
+    except ValueError:
+        raise ValueError(f"Не удалось разобрать дату: {value!r} (ожидается ISO, например 2025-09-09T10:55:44)")
+    if dt.tzinfo is None and tz is not None:
+        dt = dt.replace(tzinfo=tz)
+    ns = parse_ts_ns(dt.isoformat())
+    if ns is None:
+        raise ValueError(f"Дата вне допустимого диапазона: {value!r}")
+    return ns
+
+def filter_records(records, tf_req_id=None, tf_resource_type=None, q=None, date_from=None, date_to=None, index=None,
+                   ts_ns=None, tz=None):
+    if ts_ns is not None:
+        return filter_records_columnar(records, tf_req_id, tf_resource_type, q, date_from, date_to, index, ts_ns, tz)
+    res = records
+    if index is not None and (tf_resource_type or q):
+        # posting-list intersections instead of json.dumps over every record
+        ids = None
+        if tf_resource_type:
+            ids = index.search(tf_resource_type, case_sensitive=True)
+        if q:
+            ids = index.search(q, within=ids)
+        res = [records[i] for i in ids]
+    if tf_req_id:
+        res = [r for r in res if r['tf_req_id'] == tf_req_id]
+    if tf_resource_type and index is None:
+        # try to find in raw or message
+        res = [r for r in res if tf_resource_type in (json.dumps(r['raw']) + ' ' + (r['message'] or ''))]
+    if q and index is None:
+        ql = q.lower()
+        res = [r for r in res if ql in (json.dumps(r['raw']).lower() + ' ' + (r['message'] or '').lower())]
+    if date_from or date_to:
+        # compare instants, not strings: offsets and fraction widths differ between lines
+        lo = time_bound_ns(date_from, tz) if date_from else None
+        hi = time_bound_ns(date_to, tz) if date_to else None
+        kept = []
+        for r in res:
+            ts = parse_ts_ns(r['timestamp'])
+            if ts is not None and (lo is None or ts >= lo) and (hi is None or ts <= hi):
+                kept.append(r)
+        res = kept
+    return res
+
+def filter_records_columnar(records, tf_req_id, tf_resource_type, q, date_from, date_to, index, ts_ns, tz):
+    """same result as the scan in filter_records, but the time range is one mask over the ns column"""
+    ids = None
+    if index is not None and (tf_resource_type or q):
+        if tf_resource_type:
+            ids = index.search(tf_resource_type, case_sensitive=True)
+        if q:
+            ids = index.search(q, within=ids)
+    ids = np.arange(len(records)) if ids is None else np.asarray(ids, dtype=np.int64)
+    if date_from or date_to:
+        t = ts_ns[ids]
+        keep = t != NAT
+        if date_from:
+            keep &= t >= time_bound_ns(date_from, tz)
+        if date_to:
+            keep &= t <= time_bound_ns(date_to, tz)
+        ids = ids[keep]
+    res = [records[i] for i in ids]
+    if tf_req_id:
+        res = [r for r in res if r['tf_req_id'] == tf_req_id]
+    if tf_resource_type and index is None:
+        res = [r for r in res if tf_resource_type in (json.dumps(r['raw']) + ' ' + (r['message'] or ''))]
+    if q and index is None:
+        ql = q.lower()
+        res = [r for r in res if ql in (json.dumps(r['raw']).lower() + ' ' + (r['message'] or '').lower())]
+    return res
+
+# short fields shown in the table; row i of the frame is records[i]
+FRAME_CATEGORIES = ('level', 'section', 'tf_req_id')
+
+def records_frame(records, ts_ns):
+    """
+    short fields of every record as one DataFrame, built once per file (app.py caches it).
+    level/section/tf_req_id are categoricals: filters and group counts compare int codes,
+    and the repeated strings are stored once
+    """
+    frame = pd.DataFrame({
+        'lineno': np.fromiter((r['lineno'] for r in records), dtype=np.int64, count=len(records)),
+        'timestamp': [r['timestamp'] for r in records],
+        'level': [r['level'] for r in records],
+        'section': [r['section'] for r in records],
+        'tf_req_id': [r['tf_req_id'] for r in records],
+        'message': [(r['message'] or '')[:150] for r in records],
+        'has_req_body': np.fromiter((r['has_req_body'] for r in records), dtype=bool, count=len(records)),
+        'has_res_body': np.fromiter((r['has_res_body'] for r in records), dtype=bool, count=len(records)),
+        'ts_ns': ts_ns,
+    })
+    for col in FRAME_CATEGORIES:
+        frame[col] = frame[col].astype('category')
+    return frame
+
+def filter_mask(frame, index, tf_req_id=None, tf_resource_type=None, q=None, date_from=None, date_to=None, tz=None):
+    """
+    boolean mask over records_frame rows, the same records as filter_records(..., index=index, ts_ns=...);
+    every condition is a vector op on the frame, search index hits are turned into a mask
+    """
+    mask = np.ones(len(frame), dtype=bool)
+    if tf_req_id:
+        mask &= (frame['tf_req_id'] == tf_req_id).to_numpy()
+    if tf_resource_type or q:
+        ids = None
+        if tf_resource_type:
+            ids = index.search(tf_resource_type, case_sensitive=True)
+        if q:
+            ids = index.search(q, within=ids)
+        hits = np.zeros(len(frame), dtype=bool)
+        hits[np.asarray(ids, dtype=np.int64)] = True
+        mask &= hits
+    if date_from or date_to:
+        t = frame['ts_ns'].to_numpy()
+        mask &= t != NAT
+        if date_from:
+            mask &= t >= time_bound_ns(date_from, tz)
+        if date_to:
+            mask &= t <= time_bound_ns(date_to, tz)
+    return mask
+
+def top_groups(frame, n=10):
+    """[(tf_req_id, records)] of the n largest groups, counted on the categorical codes"""
+    counts = frame['tf_req_id'].value_counts(sort=True)
+    return [(req_id, int(count)) for req_id, count in counts.head(n).items() if count]
@@ -4,13 +4,13 @@ parse_tflog.py
 Простой парсер Terraform JSON-line логов для чекпоинта 1.
 
 Что делает:
-- читает файл с одной JSON-объектом в строке
+- читает файл с одной JSON-объектом в строке (.gz / .zst распаковываются на лету)
 - извлекает timestamp (если есть) или ищет во @message
 - определяет уровень логирования (по полю @level или по эвристике над @message)
 - отмечает секции plan/apply по подсказкам в @message/CLI args
 - извлекает tf_http_req_body / tf_http_res_body, но помечает их hidden=True по умолчанию
 - группирует записи по tf_req_id (если есть)
-- пишет результат в JSONL файл parsed.jsonl
+- пишет результат в JSONL файл parsed.jsonl (parsed.jsonl.gz / .zst — сжатый)
 """
 
 import json
@@ -20,6 +20,9 @@ from collections import defaultdict
 from pathlib import Path
 import sys
 
+from compressed_io import open_input, open_output
+from phrase_matcher import PhraseMatcher
+
 # ---------- Эвристики ----------
 # regex для поиска ISO-дат внутри строки (простая версия)
 ISO_TS_RE = re.compile(r'\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(?:\.\d+)?(?:[+-]\d{2}:\d{2})?')
@@ -34,6 +37,21 @@ PLAN_END_PHRASES = ['Plan is complete', 'Plan is not applyable', 'plan operation
 APPLY_START_PHRASES = ['apply', '"apply"', 'Apply operation', 'starting Apply operation']
 APPLY_END_PHRASES = ['apply operation completed', 'Apply operation completed', 'backend/local: plan calling Plan']
 
+# Один предкомпилированный матчер на все фразы (сообщение он сам приводит к нижнему регистру).
+# Стартовые фразы берём как есть (как и раньше в `p in msg`), а закрывающие — lower()
+SECTION_MATCHER = PhraseMatcher({
+    'cli_args': ['cli args', 'cli command args'],
+    'plan': ['plan'],
+    'apply': ['apply'],
+    'plan_start': PLAN_START_PHRASES,
+    'apply_start': APPLY_START_PHRASES,
+    'plan_end': [p.lower() for p in PLAN_END_PHRASES],
+    'apply_end': [p.lower() for p in APPLY_END_PHRASES],
+})
+BITS = SECTION_MATCHER.bits
+LEVEL_MATCHER = PhraseMatcher({kw: [kw] for kw in LEVEL_KEYWORDS})
+LEVEL_BITS = [(LEVEL_MATCHER.bits[kw], lvl) for kw, lvl in LEVEL_KEYWORDS.items()]
+
 def guess_timestamp(obj):
     # 1) явное поле @timestamp
     for key in ('@timestamp', 'timestamp', 'time'):
@@ -53,9 +71,9 @@ def guess_level(obj):
         if key in obj and obj[key]:
             return str(obj[key]).lower()
     # 2) поиск ключевых слов в @message
-    msg = (obj.get('@message') or obj.get('message') or '').lower()
-    for kw, lvl in LEVEL_KEYWORDS.items():
-        if kw in msg:
+    flags = LEVEL_MATCHER.match(obj.get('@message') or obj.get('message') or '')
+    for bit, lvl in LEVEL_BITS:
+        if flags & bit:
             return lvl
     # 3) дефолт
     return 'info'
@@ -65,22 +83,22 @@ def detect_section(obj, state):
     state — словарь, где храним текущую секцию (None / 'plan' / 'apply')
     Возвращает новый state (может быть тот же).
     """
-    msg = (obj.get('@message') or obj.get('message') or '').lower()
+    flags = SECTION_MATCHER.match(obj.get('@message') or obj.get('message') or '')
     # Если CLI args показывают явно plan/apply
-    if 'cli args' in msg or 'cli command args' in msg:
-        if 'plan' in msg:
+    if flags & BITS['cli_args']:
+        if flags & BITS['plan']:
             return 'plan'
-        if 'apply' in msg:
+        if flags & BITS['apply']:
             return 'apply'
     # По фразам
-    if any(p in msg for p in PLAN_START_PHRASES):
+    if flags & BITS['plan_start']:
         return 'plan'
-    if any(p in msg for p in APPLY_START_PHRASES):
+    if flags & BITS['apply_start']:
         return 'apply'
     # Закрывающие
-    if any(p.lower() in msg for p in PLAN_END_PHRASES):
+    if flags & BITS['plan_end']:
         return None
-    if any(p.lower() in msg for p in APPLY_END_PHRASES):
+    if flags & BITS['apply_end']:
         return None
     return state  # без изменений
 
@@ -103,7 +121,7 @@ def process_file(path_in, path_out):
     section = None
     grouped = defaultdict(list)  # tf_req_id -> list of records
 
-    with path_in.open('r', encoding='utf-8') as fin, path_out.open('w', encoding='utf-8') as fout:
+    with open_input(path_in) as fin, open_output(path_out) as fout:
         for lineno, raw in enumerate(fin, start=1):
             raw = raw.strip()
             if not raw:
@@ -2,12 +2,52 @@
 import grpc
 from concurrent import futures
 import logs_pb2, logs_pb2_grpc
+from template_miner import TemplateMiner
+
+TOP_TEMPLATES = 10
+ERROR_LEVELS = {'error', 'err', 'fatal', 'critical'}
+WARNING_LEVELS = {'warn', 'warning'}
+
+def severity(log, message_lower):
+    """'error' / 'warning' / None: by the level field if the entry has one, else by the message text"""
+    level = (getattr(log, 'level', '') or '').lower()
+    if level in ERROR_LEVELS:
+        return 'error'
+    if level in WARNING_LEVELS:
+        return 'warning'
+    if 'error' in message_lower:
+        return 'error'
+    if 'warn' in message_lower:
+        return 'warning'
+    return None
+
+def format_report(errors, miners):
+    lines = [f"Найдено ошибок: {errors}"]
+    for kind, title in (('error', "Шаблоны ошибок"), ('warning', "Шаблоны предупреждений")):
+        miner = miners[kind]
+        if not miner.total:
+            continue
+        lines.append(f"{title} ({miner.total} строк, {len(miner.clusters)} шаблонов), топ {TOP_TEMPLATES}:")
+        for template, count, examples in miner.top(TOP_TEMPLATES):
+            lines.append(f"  {count} x {template}  (строки: {', '.join(map(str, examples))})")
+    return "\n".join(lines)
 
 class ErrorCounter(logs_pb2_grpc.LogProcessorServicer):
     def Process(self, request, context):
-        errors = [log for log in request.logs if "error" in log.message.lower()]
+        # One pass over the batch: count errors and mine error/warning templates.
+        # Line numbers are 1-based positions of the entries in request.logs.
+        miners = {'error': TemplateMiner(), 'warning': TemplateMiner()}
+        errors = 0
+        for lineno, log in enumerate(request.logs, start=1):
+            message = log.message
+            message_lower = message.lower()
+            if "error" in message_lower:
+                errors += 1
+            kind = severity(log, message_lower)
+            if kind:
+                miners[kind].add(message, lineno)
         return logs_pb2.ProcessResponse(
-            result=f"Найдено ошибок: {len(errors)}"
+            result=format_report(errors, miners)
         )
 
 def serve():
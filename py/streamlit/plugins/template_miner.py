@@ -0,0 +1,126 @@
+# plugins/template_miner.py
+"""
+Drain-style log template miner for the error aggregation plugin.
+
+Messages are grouped into templates in one streaming pass:
+1. variable parts (uuids, urls, paths, ip addresses, cloud/hex ids, numbers) are masked
+   with fixed placeholders by a few precompiled regex passes;
+2. the masked message is split into tokens and routed through a fixed-depth prefix tree:
+   token count -> first `depth` tokens (tokens with digits go to the <*> branch);
+3. in the leaf, the most similar cluster (share of equal tokens >= sim_threshold) absorbs
+   the message, and positions where they differ become <*>; otherwise a new cluster starts.
+
+Memory is bounded: at most max_clusters clusters (least recently matched ones are evicted),
+at most max_children branches per tree node, max_examples example line numbers per
+cluster, and a bounded exact-match cache of masked messages.
+"""
+import heapq
+import re
+from collections import OrderedDict
+
+WILDCARD = '<*>'
+
+# order matters: wider patterns first, so a url is not half-masked as a path
+MASKS = [
+    (re.compile(r'\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b'), '<UUID>'),
+    (re.compile(r'\b[a-zA-Z][a-zA-Z0-9+.-]*://[^\s"\'<>]+'), '<URL>'),
+    (re.compile(r'\b\d{1,3}(?:\.\d{1,3}){3}(?::\d+)?\b'), '<IP>'),
+    (re.compile(r'(?:(?<=\s)|^)(?:~|\.{1,2})?(?:/[\w.@+-]+){2,}/?'), '<PATH>'),
+    (re.compile(r'\b(?=[a-z0-9]*\d)(?=[a-z0-9]*[a-z])[a-z0-9]{16,}\b'), '<ID>'),
+    (re.compile(r'\b(?:0x)?[0-9a-fA-F]*\d[0-9a-fA-F]*[a-fA-F][0-9a-fA-F]*\b|\b(?:0x)?[0-9a-fA-F]*[a-fA-F][0-9a-fA-F]*\d[0-9a-fA-F]*\b'), '<HEX>'),
+    (re.compile(r'(?<![\w<])[-+]?\d+(?:\.\d+)?(?:[a-zA-Z%]{1,3})?\b'), '<NUM>'),
+]
+# without a digit only urls and paths can match
+MASKS_NO_DIGITS = [(p, m) for p, m in MASKS if m in ('<URL>', '<PATH>')]
+_HAS_DIGIT = re.compile(r'\d')
+
+
+def mask(message):
+    for pattern, placeholder in (MASKS if _HAS_DIGIT.search(message) else MASKS_NO_DIGITS):
+        message = pattern.sub(placeholder, message)
+    return message
+
+
+class Cluster:
+    __slots__ = ('tokens', 'count', 'examples', 'leaf')
+
+    def __init__(self, tokens, leaf):
+        self.tokens = tokens
+        self.count = 0
+        self.examples = []
+        self.leaf = leaf  # list the cluster lives in, for eviction
+
+    @property
+    def template(self):
+        return ' '.join(self.tokens)
+
+
+class TemplateMiner:
+    def __init__(self, depth=4, sim_threshold=0.5, max_children=100, max_clusters=1000,
+                 max_examples=3, cache_size=100_000):
+        self.depth = depth
+        self.sim_threshold = sim_threshold
+        self.max_children = max_children
+        self.max_clusters = max_clusters
+        self.max_examples = max_examples
+        self.cache_size = cache_size
+        self.root = {}
+        self.clusters = OrderedDict()  # id(cluster) -> cluster, least recently matched first
+        self._cache = {}  # masked message -> cluster
+        self.total = 0
+
+    def add(self, message, lineno=None):
+        """feed one message; returns the cluster it landed in"""
+        self.total += 1
+        masked = mask(message)
+        cluster = self._cache.get(masked)
+        if cluster is None or cluster.leaf is None:
+            cluster = self._match(masked.split())
+            if len(self._cache) >= self.cache_size:
+                self._cache.clear()
+            self._cache[masked] = cluster
+        cluster.count += 1
+        if lineno is not None and len(cluster.examples) < self.max_examples:
+            cluster.examples.append(lineno)
+        self.clusters.move_to_end(id(cluster))
+        return cluster
+
+    def _leaf(self, tokens):
+        node = self.root.setdefault(len(tokens), {})
+        for token in tokens[:self.depth]:
+            key = WILDCARD if _HAS_DIGIT.search(token) else token
+            child = node.get(key)
+            if child is None:
+                if len(node) >= self.max_children:
+                    key = WILDCARD
+                    child = node.get(key)
+                if child is None:
+                    child = node[key] = {}
+            node = child
+        return node.setdefault(None, [])  # the None key holds the leaf's clusters
+
+    def _match(self, tokens):
+        leaf = self._leaf(tokens)
+        best, best_sim = None, -1.0
+        for cluster in leaf:
+            same = sum(1 for a, b in zip(cluster.tokens, tokens) if a == b or a == WILDCARD)
+            sim = same / len(tokens) if tokens else 1.0
+            if sim > best_sim:
+                best, best_sim = cluster, sim
+        if best is not None and best_sim >= self.sim_threshold:
+            best.tokens = [a if a == b else WILDCARD for a, b in zip(best.tokens, tokens)]
+            return best
+
+        cluster = Cluster(list(tokens), leaf)
+        leaf.append(cluster)
+        self.clusters[id(cluster)] = cluster
+        if len(self.clusters) > self.max_clusters:
+            _, old = self.clusters.popitem(last=False)
+            old.leaf.remove(old)
+            old.leaf = None  # stale cache entries pointing at it get re-matched
+        return cluster
+
+    def top(self, n=10):
+        """[(template, count, example line numbers)] for the n biggest clusters"""
+        biggest = heapq.nlargest(n, self.clusters.values(), key=lambda c: c.count)
+        return [(c.template, c.count, list(c.examples)) for c in biggest]
@@ -0,0 +1,97 @@
+# search_index.py
+"""
+Token-level inverted index over loaded records, for filter_records.
+
+The searchable text of a record is the same haystack the plain filter scans:
+json.dumps(raw) + ' ' + message. It is split into word tokens (\\w+), and every
+token gets a posting list of record numbers. A substring query is answered
+through a trigram index over the token vocabulary: each word of the query must
+be a substring of some vocabulary token, so the candidates are the union of the
+postings of those tokens, intersected across the query words. When the query is
+a single word, the candidates are already the exact answer. Otherwise they are
+checked against the haystack, so results match the linear scan exactly.
+"""
+import json
+import re
+from array import array
+from collections import defaultdict
+
+TOKEN_RE = re.compile(r'\w+')
+GRAM = 3
+
+
+def record_haystack(r):
+    """text the filters search in (case-sensitive; lower() it for q)"""
+    return json.dumps(r['raw']) + ' ' + (r['message'] or '')
+
+
+def _grams(token):
+    return {token[i:i + GRAM] for i in range(len(token) - GRAM + 1)}
+
+
+class SearchIndex:
+    def __init__(self, records):
+        self.records = records
+        postings = defaultdict(list)
+        for i, r in enumerate(records):
+            for token in set(TOKEN_RE.findall(record_haystack(r).lower())):
+                postings[token].append(i)
+        self.postings = {token: array('I', ids) for token, ids in postings.items()}
+
+        grams = defaultdict(list)
+        for token in self.postings:
+            for g in _grams(token):
+                grams[g].append(token)
+        self.grams = dict(grams)
+
+    def _tokens_containing(self, word):
+        """vocabulary tokens that have word as a substring"""
+        if len(word) < GRAM:
+            return [t for t in self.postings if word in t]
+        candidates = None
+        for g in _grams(word):
+            tokens = self.grams.get(g)
+            if not tokens:
+                return []
+            candidates = set(tokens) if candidates is None else candidates.intersection(tokens)
+            if not candidates:
+                return []
+        return [t for t in candidates if word in t]
+
+    def candidates(self, query):
+        """
+        (ids, exact): ids are sorted record numbers that may contain lowercased query.
+        exact=True means no re-check is needed. ids=None means no word in the query,
+        so nothing can be pruned.
+        """
+        words = TOKEN_RE.findall(query)
+        if not words:
+            return None, False
+        result = None
+        for word in sorted(set(words), key=len, reverse=True):
+            ids = set()
+            for token in self._tokens_containing(word):
+                ids.update(self.postings[token])
+            result = ids if result is None else result & ids
+            if not result:
+                return [], True
+        exact = len(words) == 1 and words[0] == query
+        return sorted(result), exact
+
+    def search(self, query, case_sensitive=False, within=None):
+        """
+        record numbers whose haystack contains query, in file order.
+        within: optional sorted record numbers to restrict to (e.g. a previous filter).
+        """
+        ids, exact = self.candidates(query.lower())
+        if ids is None:
+            ids = range(len(self.records)) if within is None else within
+        elif within is not None:
+            allowed = set(within)
+            ids = [i for i in ids if i in allowed]
+        if exact and not case_sensitive:
+            return list(ids)
+        if case_sensitive:
+            return [i for i in ids if query in record_haystack(self.records[i])]
+        ql = query.lower()
+        return [i for i in ids if ql in record_haystack(self.records[i]).lower()]
@@ -0,0 +1,56 @@
+"""
+Общие помощники тестов: модули py/ импортируются как в main.py (плоские имена),
+эталон для быстрых путей — обычный последовательный process_file без фильтров и выборки.
+"""
+
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+PY_DIR = Path(__file__).resolve().parents[1]
+LOGS_DIR = PY_DIR.parent / 'logs'
+sys.path.insert(0, str(PY_DIR))
+
+from main import process_file  # noqa: E402
+
+SAMPLE_LOG = LOGS_DIR / 'tf.json'
+BATCH_LOGS = [LOGS_DIR / '1. plan_test-k801vip_tflog.json', LOGS_DIR / '3. apply_tflog.json']
+
+# Строки, на которых байтовые проверки расходились с разбором: обрезанный JSON, который
+# случайно кончается на '}', с явным "@level":"trace" и словом terraform (в нём есть 'err') —
+# разбор падает, guess_level угадывает по тексту
+MALFORMED_LINES = [
+    '{"@level":"info","@message":"CLI command args: []string{\\"terraform\\", \\"plan\\"}",'
+    '"@timestamp":"2025-09-09T10:55:44.205291+03:00"}',
+    '{"@level":"trace","@message":"terraform: walking hcl.Pos{Line:1, Column:2}",'
+    '"@timestamp":"2025-09-09T10:55:44.205292+03:00","tf_req_id":"r1","tf_rpc":"PlanResourceChange"}',
+    '{"@caller":"x.go:1","@level":"trace","@message":"terraform: truncated hcl.Pos{Line:1}',
+    '{"@level":"trace","@message":"truncated hcl.Pos{Line:1}',
+    '{"@level":"trace","@message":"TRUE","x":TRUE}',
+    '{"@level":"debug","@message":"terraform apply hcl.Pos{Line:2}',
+    '{"@level":"error","@message":"boom","@timestamp":"2025-09-09T10:55:45.000000+03:00","tf_req_id":"r1"}',
+    'not json at all: terraform error',
+    '{"@level":"trace","@message":"Apply operation completed","@timestamp":"2025-09-09T10:55:46.000000+03:00"}',
+]
+
+
+@pytest.fixture
+def malformed_log(tmp_path):
+    path = tmp_path / 'malformed.json'
+    path.write_text('\n'.join(MALFORMED_LINES) + '\n', encoding='utf-8')
+    return path
+
+
+def read_jsonl(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def parse(path_in, path_out, **kwargs):
+    """process_file -> (записи, {tf_req_id: записи}, stats); группы закрываются сразу."""
+    _, grouped, stats = process_file(path_in, path_out, **kwargs)
+    groups = dict(grouped.items())
+    grouped.close()
+    return read_jsonl(path_out), groups, stats
@@ -0,0 +1,60 @@
+"""Пакетный режим (process_files) — это process_file каждого файла, слитый по времени записей."""
+
+import heapq
+from collections import Counter
+
+import pytest
+
+from conftest import BATCH_LOGS, parse, read_jsonl
+from main import process_files
+from timestamps import NAT, parse_ts_ns
+
+STAT_KEYS = ('total_lines', 'parsed_errors', 'guessed_timestamps', 'guessed_levels')
+
+
+def merge_key(records):
+    """Время записи для слияния: запись без метки получает время предыдущей записи файла."""
+    last = NAT
+    for r in records:
+        ts = parse_ts_ns(r['timestamp'])
+        if ts is not None:
+            last = ts
+        yield last, r
+
+
+@pytest.fixture(scope='module')
+def per_file(tmp_path_factory):
+    tmp = tmp_path_factory.mktemp('per_file')
+    return [parse(path, tmp / f'{i}.jsonl', source=str(path)) for i, path in enumerate(BATCH_LOGS)]
+
+
+@pytest.mark.parametrize('workers', [None, 1])
+def test_batch_matches_per_file(per_file, tmp_path, workers):
+    path_out, grouped, stats = process_files(BATCH_LOGS, tmp_path / 'batch.jsonl', workers=workers)
+    groups = dict(grouped.items())
+    grouped.close()
+    records = read_jsonl(path_out)
+
+    streams = [merge_key(file_records) for file_records, _, _ in per_file]
+    assert records == [r for _, r in heapq.merge(*streams, key=lambda item: item[0])]
+
+    expected_groups = {}
+    for r in records:
+        if r['tf_req_id']:
+            expected_groups.setdefault(r['tf_req_id'], []).append(r)
+    assert groups == expected_groups
+
+    for key in STAT_KEYS:
+        assert stats[key] == sum(file_stats[key] for _, _, file_stats in per_file)
+    for key in ('section_counts', 'level_counts'):
+        assert Counter(stats[key]) == sum((Counter(file_stats[key]) for _, _, file_stats in per_file), Counter())
+    assert stats['files'] == {str(path): file_stats for path, (_, _, file_stats) in zip(BATCH_LOGS, per_file)}
+
+
+def test_batch_keeps_order_within_file(tmp_path):
+    path_out, grouped, _ = process_files(BATCH_LOGS, tmp_path / 'batch.jsonl')
+    grouped.close()
+    records = read_jsonl(path_out)
+    for path in BATCH_LOGS:
+        linenos = [r['lineno'] for r in records if r['source'] == str(path)]
+        assert linenos == sorted(linenos)
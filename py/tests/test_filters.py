@@ -0,0 +1,59 @@
+"""Фильтры с выталкиванием в байты (LineFilter) дают то же, что фильтр по записям обычного разбора."""
+
+import pytest
+
+from conftest import SAMPLE_LOG, parse
+from main import (APPLY_END_PHRASES, APPLY_START_PHRASES, PLAN_END_PHRASES, PLAN_START_PHRASES,
+                  SECTION_TRIGGERS, LineFilter)
+
+FILTERS = [
+    {'levels': ['error']},
+    {'levels': ['error'], 'sections': ['plan']},
+    {'levels': ['trace']},
+    {'levels': ['debug', 'warn']},
+    {'sections': ['apply']},
+    {'sections': ['none']},
+    {'req_ids': ['r1']},
+    {'grep': ['hcl.Pos']},
+]
+
+
+def test_every_section_phrase_has_a_trigger():
+    # Иначе строка, меняющая секцию, могла бы быть отброшена по байтам, не дойдя до detect_section
+    for phrase in PLAN_START_PHRASES + PLAN_END_PHRASES + APPLY_START_PHRASES + APPLY_END_PHRASES:
+        assert any(t.decode() in phrase.lower() for t in SECTION_TRIGGERS), phrase
+
+
+def post_filtered(records, line_filter):
+    # grep смотрит в исходную строку, а её здесь нет — для него эталон строится отдельно
+    return [r for r in records if line_filter.matches(r, b'')]
+
+
+@pytest.mark.parametrize('kwargs', [f for f in FILTERS if 'grep' not in f])
+def test_pushdown_matches_post_filter_on_malformed_lines(malformed_log, tmp_path, kwargs):
+    full, _, _ = parse(malformed_log, tmp_path / 'full.jsonl')
+    filtered, _, stats = parse(malformed_log, tmp_path / 'filtered.jsonl', line_filter=LineFilter(**kwargs))
+    assert filtered == post_filtered(full, LineFilter(**kwargs))
+    assert stats['total_lines'] == len(full)
+
+
+def test_truncated_line_with_explicit_level_is_guessed(malformed_log, tmp_path):
+    filtered, _, _ = parse(malformed_log, tmp_path / 'filtered.jsonl', line_filter=LineFilter(levels=['error']))
+    assert [r['lineno'] for r in filtered] == [3, 6, 7, 8]
+
+
+@pytest.mark.parametrize('kwargs', FILTERS + [{'resource_types': ['t1_vpc_address_group']}])
+def test_pushdown_matches_post_filter_on_sample(tmp_path, kwargs):
+    full, _, _ = parse(SAMPLE_LOG, tmp_path / 'full.jsonl')
+    filtered, groups, _ = parse(SAMPLE_LOG, tmp_path / 'filtered.jsonl', line_filter=LineFilter(**kwargs))
+    if 'grep' in kwargs:
+        raw = SAMPLE_LOG.read_bytes().split(b'\n')
+        expected = [r for r in full if any(g.encode() in raw[r['lineno'] - 1] for g in kwargs['grep'])]
+    else:
+        expected = post_filtered(full, LineFilter(**kwargs))
+    assert filtered == expected
+    expected_groups = {}
+    for r in expected:
+        if r['tf_req_id']:
+            expected_groups.setdefault(r['tf_req_id'], []).append(r)
+    assert groups == expected_groups
@@ -0,0 +1,31 @@
+"""Параллельный разбор и выгрузка групп на диск дают то же, что обычный последовательный разбор."""
+
+import pytest
+
+from conftest import SAMPLE_LOG, parse
+
+
+@pytest.fixture
+def reference(tmp_path):
+    return parse(SAMPLE_LOG, tmp_path / 'reference.jsonl')
+
+
+@pytest.mark.parametrize('workers', [2, 3])
+def test_parallel_matches_sequential(reference, tmp_path, workers):
+    assert parse(SAMPLE_LOG, tmp_path / 'parallel.jsonl', workers=workers) == reference
+
+
+@pytest.mark.parametrize('workers', [1, 3])
+def test_spilled_groups_match_in_memory(reference, tmp_path, workers):
+    # 4 КБ — меньше одной крупной группы: серии на диске пишутся почти на каждую запись
+    records, groups, stats = parse(SAMPLE_LOG, tmp_path / 'spilled.jsonl', workers=workers, group_memory=4096)
+    assert (records, groups, stats) == reference
+
+
+def test_groups_are_records_by_request(reference):
+    records, groups, _ = reference
+    expected = {}
+    for r in records:
+        if r['tf_req_id']:
+            expected.setdefault(r['tf_req_id'], []).append(r)
+    assert groups == expected
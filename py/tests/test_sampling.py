@@ -0,0 +1,71 @@
+"""
+Выборка при разборе (observe_sampling по байтам + keep) оставляет те же записи, что Sampler,
+применённый к полному выходу обычного разбора; последовательно и параллельно — одинаково.
+"""
+
+import pytest
+
+from conftest import SAMPLE_LOG, parse
+from sampling import Sampler
+
+SAMPLERS = [
+    {'rate': 0.1},
+    {'rate': 0.3, 'seed': 7},
+    {'rate': 0.0, 'keep_error_requests': False},
+    {'rate': 0.2, 'per_rpc': 3},
+    {'rate': 0.0, 'per_rpc': 0},
+]
+
+
+def sampled(records, kwargs):
+    """Эталон: оба прохода Sampler по записям полного разбора."""
+    sampler = Sampler(**kwargs)
+    for r in records:
+        sampler.observe(r['lineno'], r['level'], r['tf_req_id'], r['raw_full_json'].get('tf_rpc'))
+    sampler.finish_observe()
+    kept = []
+    old_section = None
+    for r in records:
+        if sampler.keep(r['lineno'], r['level'], r['tf_req_id'], r['raw_full_json'].get('tf_rpc'),
+                        old_section != r['section']):
+            kept.append(r)
+        old_section = r['section']
+    return kept, sampler.stats()
+
+
+@pytest.fixture(scope='module')
+def full(tmp_path_factory):
+    records, _, _ = parse(SAMPLE_LOG, tmp_path_factory.mktemp('full') / 'full.jsonl')
+    return records
+
+
+@pytest.mark.parametrize('workers', [1, 3])
+@pytest.mark.parametrize('kwargs', SAMPLERS)
+def test_sampling_matches_reference(full, tmp_path, kwargs, workers):
+    expected, expected_stats = sampled(full, kwargs)
+    records, groups, stats = parse(SAMPLE_LOG, tmp_path / 'sampled.jsonl', workers=workers,
+                                   sampler=Sampler(**kwargs))
+    assert records == expected
+    assert stats['sampling'] == expected_stats
+    assert stats['total_lines'] == len(full)
+    expected_groups = {}
+    for r in expected:
+        if r['tf_req_id']:
+            expected_groups.setdefault(r['tf_req_id'], []).append(r)
+    assert groups == expected_groups
+
+
+def test_error_requests_are_kept_whole(full, tmp_path):
+    error_ids = {r['tf_req_id'] for r in full if r['level'] in ('error', 'fatal') and r['tf_req_id']}
+    records, _, _ = parse(SAMPLE_LOG, tmp_path / 'sampled.jsonl', sampler=Sampler(rate=0.0))
+    for req_id in error_ids:
+        assert [r for r in records if r['tf_req_id'] == req_id] == [r for r in full if r['tf_req_id'] == req_id]
+
+
+@pytest.mark.parametrize('kwargs', [{'rate': 0.0}, {'rate': 0.0, 'per_rpc': 1}])
+def test_sampling_matches_reference_on_malformed_lines(malformed_log, tmp_path, kwargs):
+    full, _, _ = parse(malformed_log, tmp_path / 'full.jsonl')
+    expected, expected_stats = sampled(full, kwargs)
+    records, _, stats = parse(malformed_log, tmp_path / 'sampled.jsonl', sampler=Sampler(**kwargs))
+    assert records == expected
+    assert stats['sampling'] == expected_stats
@@ -0,0 +1,96 @@
+"""Выборки через сайдкар-индекс (ParsedIndex) совпадают с фильтром по полному выходу разбора."""
+
+import pytest
+
+from conftest import SAMPLE_LOG, parse
+from main import process_file
+from sidecar_index import ParsedIndex
+from timestamps import parse_ts_ns
+
+
+def resource_type(record):
+    raw = record['raw_full_json']
+    return raw.get('tf_resource_type') if isinstance(raw, dict) else None
+
+
+@pytest.fixture(scope='module', params=[1, 3], ids=['sequential', 'parallel'])
+def indexed(request, tmp_path_factory):
+    tmp = tmp_path_factory.mktemp('indexed')
+    full, _, _ = parse(SAMPLE_LOG, tmp / 'full.jsonl')
+    path_out, grouped, _ = process_file(SAMPLE_LOG, tmp / 'parsed.jsonl', workers=request.param, index=True)
+    grouped.close()
+    with ParsedIndex(path_out) as idx:
+        yield full, idx
+
+
+def test_index_covers_every_record(indexed):
+    full, idx = indexed
+    assert len(idx) == len(full)
+    assert list(idx.lookup()) == full
+    for r in full[::97]:
+        assert idx.get(r['lineno']) == r
+
+
+@pytest.mark.parametrize('field, value_of', [
+    ('tf_req_id', lambda r: r['tf_req_id']),
+    ('tf_resource_type', resource_type),
+    ('level', lambda r: r['level']),
+    ('section', lambda r: r['section']),
+])
+def test_lookup_by_field_matches_filter(indexed, field, value_of):
+    full, idx = indexed
+    values = {value_of(r) for r in full} - {None}
+    assert values
+    for value in sorted(values)[:20]:
+        assert list(idx.lookup(**{field: value})) == [r for r in full if value_of(r) == value]
+
+
+def test_lookup_combined_and_by_time_matches_filter(indexed):
+    full, idx = indexed
+    timed = [r for r in full if parse_ts_ns(r['timestamp']) is not None]
+    since, until = timed[len(timed) // 4]['timestamp'], timed[len(timed) // 2]['timestamp']
+    expected = [r for r in timed if r['level'] == 'trace'
+                and parse_ts_ns(since) <= parse_ts_ns(r['timestamp']) <= parse_ts_ns(until)]
+    assert expected
+    assert list(idx.lookup(level='trace', since=since, until=until)) == expected
+
+
+def test_source_line_is_the_input_line(indexed):
+    full, idx = indexed
+    raw = SAMPLE_LOG.read_bytes().split(b'\n')
+    for ordinal in range(0, len(full), 113):
+        assert idx.source_line(ordinal) == raw[full[ordinal]['lineno'] - 1].rstrip(b'\r')
+
+
+def test_header_does_not_hold_the_vocabulary(indexed):
+    full, idx = indexed
+    # в заголовке — только число значений поля, сами значения ищутся в таблице файла
+    assert idx.header['fields']['tf_req_id'] == len({r['tf_req_id'] for r in full} - {None})
+    assert idx.values('tf_req_id') == sorted({r['tf_req_id'] for r in full} - {None}, key=str.encode)
+    assert list(idx.lookup(tf_req_id='no-such-request')) == []
+    assert list(idx.lookup(tf_req_id='')) == []
+
+
+def test_combined_lookup_prunes_blocks_by_time(indexed, monkeypatch):
+    full, idx = indexed
+    block_size = idx.header['block_size']
+    since = min(r['timestamp'] for r in full[(len(full) - 1) // block_size * block_size:] if r['timestamp'])
+    read = []
+    read_record = idx.read_record
+    monkeypatch.setattr(idx, 'read_record', lambda ordinal: read.append(ordinal) or read_record(ordinal))
+    found = list(idx.lookup(level='trace', since=since))
+    assert found == [r for r in full if r['level'] == 'trace' and parse_ts_ns(r['timestamp']) is not None
+                     and parse_ts_ns(r['timestamp']) >= parse_ts_ns(since)]
+    # читаются только записи блоков, пересекающих интервал, а не все trace-записи файла
+    assert len(read) < sum(r['level'] == 'trace' for r in full)
+
+
+def test_empty_log(tmp_path):
+    empty = tmp_path / 'empty.json'
+    empty.write_bytes(b'')
+    path_out, grouped, _ = process_file(empty, tmp_path / 'parsed.jsonl', index=True)
+    grouped.close()
+    with ParsedIndex(path_out) as idx:
+        assert len(idx) == 0
+        assert list(idx.lookup(level='trace', since='2025-01-01T00:00:00Z')) == []
+        assert idx.values('tf_req_id') == []
@@ -0,0 +1,25 @@
+"""Метки времени: 'Z' разбирается так же, как +00:00, и векторный путь совпадает с поштучным."""
+
+from datetime import timezone
+
+from timestamps import NAT, parse_ts_column, parse_ts_ns, ts_offset
+
+UTC_PAIRS = [
+    ('2025-09-09T07:55:44.205291Z', '2025-09-09T07:55:44.205291+00:00'),
+    ('2025-09-09T07:55:44Z', '2025-09-09T07:55:44+00:00'),
+]
+
+
+def test_zulu_is_utc():
+    for zulu, explicit in UTC_PAIRS:
+        assert parse_ts_ns(zulu) is not None
+        assert parse_ts_ns(zulu) == parse_ts_ns(explicit)
+        assert ts_offset(zulu) == timezone.utc
+
+
+def test_column_matches_single_parse():
+    values = ['2025-09-09T10:55:44.205291+03:00', '2025-09-09T07:55:44.205291Z', None, 'not a time',
+              '2025-09-09T10:55:44', '2025-02-30T10:55:44.205291+03:00']
+    expected = [NAT if ns is None else ns for ns in map(parse_ts_ns, values)]
+    assert parse_ts_column(values).tolist() == expected
+    assert expected[0] == expected[1]